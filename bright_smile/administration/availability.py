@@ -0,0 +1,265 @@
+import asyncio
+import heapq
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import datetime, timedelta
+from itertools import islice
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .caching import aget_versions, cache_stats, get_versions
+from .models import DoctorSchedule, Appointment
+from .occupancy import DayOccupancy
+
+# Every appointment lasts the same fixed amount of time (see README, "Assumptions")
+SLOT_DURATION = timedelta(minutes=15)
+SLOT_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def daterange(start_date, end_date):
+    """
+    Dates from start_date up to, but not including, end_date.
+    """
+    for offset in range((end_date - start_date).days):
+        yield start_date + timedelta(days=offset)
+
+
+def day_bounds(day):
+    start = timezone.make_aware(datetime.combine(day, datetime.min.time()))
+    return start, start + timedelta(days=1)
+
+
+def day_occupancy(weekly_schedule, bookings, day, duration=SLOT_DURATION):
+    """
+    Occupancy bitmap of one day from a weekly schedule ({'Mon': [(start_time, end_time), ...]})
+    and a doctor's sorted appointment start times, or None when the day has no working hours.
+    """
+    hours = weekly_schedule.get(day.strftime('%a'))
+    if not hours:
+        return None
+    start, end = day_bounds(day)
+    booked = bookings[bisect_left(bookings, start - duration):bisect_left(bookings, end)]
+    return DayOccupancy.build(day, hours, booked, duration)
+
+
+def _schedule_rows(doctor_ids, clinic_ids):
+    return DoctorSchedule.objects.filter(
+        affiliation__doctor_id__in=doctor_ids, affiliation__clinic_id__in=clinic_ids
+    ).values_list('affiliation__doctor_id', 'affiliation__clinic_id', 'day_of_week', 'start_time', 'end_time')
+
+
+def _group_schedules(rows):
+    schedules = defaultdict(lambda: defaultdict(list))
+    for doctor_id, clinic_id, day_of_week, start_time, end_time in rows:
+        schedules[doctor_id, clinic_id][day_of_week].append((start_time, end_time))
+    return schedules
+
+
+def load_schedules(doctor_ids, clinic_ids):
+    """
+    Weekly schedules for every affiliation between the given doctors and clinics, in one query:
+    {(doctor_id, clinic_id): {'Mon': [(start_time, end_time), ...]}}
+    """
+    return _group_schedules(_schedule_rows(doctor_ids, clinic_ids))
+
+
+async def aload_schedules(doctor_ids, clinic_ids):
+    return _group_schedules([row async for row in _schedule_rows(doctor_ids, clinic_ids)])
+
+
+def _booking_rows(doctor_ids, start, end):
+    return Appointment.objects.filter(
+        doctor_id__in=doctor_ids, date_time__gte=start - SLOT_DURATION, date_time__lt=end
+    ).order_by('doctor_id', 'date_time').values_list('doctor_id', 'date_time')
+
+
+def _group_bookings(rows):
+    bookings = defaultdict(list)
+    for doctor_id, date_time in rows:
+        bookings[doctor_id].append(date_time)
+    return bookings
+
+
+def load_bookings(doctor_ids, start, end):
+    """
+    Sorted appointment start times per doctor between two datetimes, in one query.
+    A doctor's appointments at any clinic block their time.
+    """
+    return _group_bookings(_booking_rows(doctor_ids, start, end))
+
+
+async def aload_bookings(doctor_ids, start, end):
+    return _group_bookings([row async for row in _booking_rows(doctor_ids, start, end)])
+
+
+# The async loaders serve the async views. Where a view needs both schedules and
+# bookings it gathers them: Django still runs one request's queries in turn on that
+# request's thread, but the event loop serves other requests in the meantime.
+async def aload_schedules_and_bookings(pairs, start_date, end_date):
+    doctor_ids = {doctor_id for doctor_id, _ in pairs}
+    clinic_ids = {clinic_id for _, clinic_id in pairs}
+    return await asyncio.gather(aload_schedules(doctor_ids, clinic_ids),
+                                aload_bookings(doctor_ids, day_bounds(start_date)[0], day_bounds(end_date)[0]))
+
+
+def iter_free_slots(weekly_schedule, bookings, start_date, end_date, not_before=None):
+    """
+    Free slot start times between two dates, in order. Each day's bitmap is only
+    built once the previous day's slots have been consumed.
+    """
+    for day in daterange(start_date, end_date):
+        occupancy = day_occupancy(weekly_schedule, bookings, day)
+        if occupancy is not None:
+            yield from occupancy.slot_times(not_before)
+
+
+def _streams(pairs, schedules, bookings, start_date, end_date, not_before):
+    return {
+        (doctor_id, clinic_id): iter_free_slots(schedules.get((doctor_id, clinic_id), {}), bookings.get(doctor_id, []),
+                                                start_date, end_date, not_before)
+        for doctor_id, clinic_id in pairs
+    }
+
+
+def _occupancy(pairs, schedules, bookings, start_date, end_date):
+    occupancy = {}
+    for doctor_id, clinic_id in pairs:
+        weekly_schedule, booked = schedules.get((doctor_id, clinic_id), {}), bookings.get(doctor_id, [])
+        days = ((day, day_occupancy(weekly_schedule, booked, day)) for day in daterange(start_date, end_date))
+        occupancy[doctor_id, clinic_id] = {day: day_occupancy for day, day_occupancy in days if day_occupancy}
+    return occupancy
+
+
+async def aget_occupancy(pairs, start_date, end_date):
+    """
+    Occupancy bitmaps of each (doctor_id, clinic_id) pair on the days it works between
+    start_date (inclusive) and end_date (exclusive), in two queries:
+    {(doctor_id, clinic_id): {date: DayOccupancy}}
+    """
+    pairs = list(pairs)
+    schedules, bookings = await aload_schedules_and_bookings(pairs, start_date, end_date)
+    return _occupancy(pairs, schedules, bookings, start_date, end_date)
+
+
+def _tagged(slots, doctor_id, clinic_id):
+    for slot in slots:
+        yield slot, doctor_id, clinic_id
+
+
+async def afirst_available(pairs, start_date, end_date, limit, not_before=None):
+    """
+    The ``limit`` earliest free slots across all pairs, as (slot, doctor_id, clinic_id),
+    in two queries. The per-pair streams are already sorted, so a k-way heap merge
+    only computes as many slots per pair as it needs.
+    """
+    pairs = list(pairs)
+    schedules, bookings = await aload_schedules_and_bookings(pairs, start_date, end_date)
+    streams = _streams(pairs, schedules, bookings, start_date, end_date, not_before)
+    merged = heapq.merge(*(_tagged(slots, *pair) for pair, slots in streams.items()))
+    return list(islice(merged, limit))
+
+
+def format_slots(slots):
+    return [slot.strftime(SLOT_FORMAT) for slot in slots]
+
+
+# Cached availability: one entry per (doctor, clinic, date), whose key embeds two
+# version stamps bumped by the write signals (see signals.py):
+#   bookings:<doctor>:<date>     any appointment of the doctor touching that date
+#   schedule:<doctor>:<clinic>   the affiliation or its weekly schedule
+# A write moves readers to a new key in the same transaction, so a stale entry is
+# never read again; it just ages out.
+
+def bookings_version_key(doctor_id, day):
+    return f'bookings:{doctor_id}:{day.isoformat()}'
+
+
+def schedule_version_key(doctor_id, clinic_id):
+    return f'schedule:{doctor_id}:{clinic_id}'
+
+
+def booking_days(date_time):
+    """
+    Local dates whose slots an appointment starting at ``date_time`` can block.
+    """
+    if isinstance(date_time, str):
+        date_time = parse_datetime(date_time)
+    if timezone.is_naive(date_time):
+        date_time = timezone.make_aware(date_time)
+    return {timezone.localdate(date_time),
+            timezone.localdate(date_time + SLOT_DURATION - timedelta(microseconds=1))}
+
+
+def _availability_version_keys(doctor_id, clinic_id, days):
+    return [schedule_version_key(doctor_id, clinic_id)] + [bookings_version_key(doctor_id, day) for day in days]
+
+
+def _availability_cache_keys(doctor_id, clinic_id, days, versions):
+    schedule_version = versions[schedule_version_key(doctor_id, clinic_id)]
+    return {
+        day: f'availability:{doctor_id}:{clinic_id}:{day.isoformat()}:'
+             f'{schedule_version}:{versions[bookings_version_key(doctor_id, day)]}'
+        for day in days
+    }
+
+
+def _split_cached(cache_keys, cached):
+    availability = {day: cached[key] for day, key in cache_keys.items() if key in cached}
+    missing = [day for day in cache_keys if day not in availability]
+    cache_stats.record('availability', hits=len(availability), misses=len(missing))
+    return availability, missing
+
+
+def cached_availability(doctor_id, clinic_id, start_date, end_date):
+    """
+    Occupancy bitmaps of one doctor at one clinic per date, served from the cache where possible:
+    {date: DayOccupancy or None when the doctor does not work there that day}
+
+    A full hit costs one query for the version stamps. The stamps are read before the
+    data, so a write landing in between only ever files fresher slots under an old key.
+    """
+    days = list(daterange(start_date, end_date))
+    versions = get_versions(_availability_version_keys(doctor_id, clinic_id, days))
+    cache_keys = _availability_cache_keys(doctor_id, clinic_id, days, versions)
+    availability, missing = _split_cached(cache_keys, cache.get_many(cache_keys.values()))
+
+    if missing:
+        weekly_schedule = load_schedules([doctor_id], [clinic_id]).get((doctor_id, clinic_id), {})
+        bookings = load_bookings([doctor_id], day_bounds(missing[0])[0], day_bounds(missing[-1])[1]).get(doctor_id, [])
+        computed = {day: day_occupancy(weekly_schedule, bookings, day) for day in missing}
+        cache.set_many({cache_keys[day]: occupancy for day, occupancy in computed.items()},
+                       timeout=settings.AVAILABILITY_CACHE_TIMEOUT)
+        availability.update(computed)
+
+    return availability
+
+
+async def acached_availability(doctor_id, clinic_id, start_date, end_date):
+    days = list(daterange(start_date, end_date))
+    versions = await aget_versions(_availability_version_keys(doctor_id, clinic_id, days))
+    cache_keys = _availability_cache_keys(doctor_id, clinic_id, days, versions)
+    availability, missing = _split_cached(cache_keys, await cache.aget_many(cache_keys.values()))
+
+    if missing:
+        schedules, bookings = await aload_schedules_and_bookings([(doctor_id, clinic_id)], missing[0],
+                                                                 missing[-1] + timedelta(days=1))
+        weekly_schedule, bookings = schedules.get((doctor_id, clinic_id), {}), bookings.get(doctor_id, [])
+        computed = {day: day_occupancy(weekly_schedule, bookings, day) for day in missing}
+        await cache.aset_many({cache_keys[day]: occupancy for day, occupancy in computed.items()},
+                              timeout=settings.AVAILABILITY_CACHE_TIMEOUT)
+        availability.update(computed)
+
+    return availability
+
+
+def is_bookable(doctor_id, clinic_id, date_time):
+    """
+    Whether an appointment can start at ``date_time``: inside the doctor's hours at
+    the clinic, on the slot grid and clear of their other appointments.
+    """
+    day = timezone.localdate(date_time)
+    occupancy = cached_availability(doctor_id, clinic_id, day, day + timedelta(days=1))[day]
+    return occupancy is not None and occupancy.is_start(date_time)
@@ -1,10 +1,12 @@
 from rest_framework import viewsets
 
+from .conditional import VersionedViewSetMixin
 from .models import Specialty
 from .serializers import SpecialtySerializer
 
 
-class SpecialityViewSet(viewsets.ModelViewSet):
+class SpecialityViewSet(VersionedViewSetMixin, viewsets.ModelViewSet):
     queryset = Specialty.objects.all()
     serializer_class = SpecialtySerializer
+    version_models = (Specialty,)
 
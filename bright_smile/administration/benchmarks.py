@@ -0,0 +1,202 @@
+import statistics
+import time
+from collections import namedtuple
+from datetime import timedelta
+from urllib.parse import urlencode
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+
+from .capabilities import capability_index
+from .instrumentation import QueryRecorder
+from .models import Clinic, Doctor, Patient, DoctorSchedule, Visit
+from .synthetic import WEEKDAY_NUMBERS, dataset_size, generate_dataset
+
+# url(sample) builds the request from the ids picked out of the dataset; max_queries
+# and max_ms are the budgets of the warm requests, max_ms for their median, and
+# max_cold_queries that of the first request after the caches were emptied
+Endpoint = namedtuple('Endpoint', ['name', 'url', 'max_queries', 'max_ms', 'max_cold_queries'])
+
+
+def _url(name, *args, **query):
+    url = reverse(name, args=args)
+    return f'{url}?{urlencode(query)}' if query else url
+
+
+ENDPOINTS = [
+    Endpoint('clinic_list', lambda sample: _url('clinic_list'), 5, 250, 5),
+    Endpoint('clinic_detail', lambda sample: _url('clinic_detail', sample['clinic_id']), 6, 150, 6),
+    Endpoint('doctor_list', lambda sample: _url('doctor_list'), 6, 250, 6),
+    Endpoint('doctor_detail', lambda sample: _url('doctor_detail', sample['doctor_id']), 8, 150, 8),
+    Endpoint('patient_list', lambda sample: _url('patient_list'), 5, 250, 5),
+    Endpoint('patient_detail', lambda sample: _url('patient_detail', sample['patient_id']), 6, 150, 6),
+    Endpoint('get_available_slots', lambda sample: _url(
+        'get_available_slots', doctor_id=sample['doctor_id'], clinic_id=sample['clinic_id'], date=sample['date']),
+        1, 50, 3),
+    Endpoint('get_doctor_schedule', lambda sample: _url(
+        'get_doctor_schedule', doctor_id=sample['doctor_id'], clinic_id=sample['clinic_id']), 1, 50, 8),
+    Endpoint('get_clinics', lambda sample: _url('get_clinics', procedure_id=sample['procedure_id']), 1, 50, 8),
+    Endpoint('get_doctors_with_clinic_and_procedure', lambda sample: _url(
+        'get_doctors_with_clinic_and_procedure', clinic_id=sample['clinic_id'], procedure_id=sample['procedure_id']),
+        1, 50, 8),
+    Endpoint('get_doctors', lambda sample: _url('get_doctors', clinic_id=sample['clinic_id']), 1, 50, 8),
+    Endpoint('get_specialties', lambda sample: _url('get_specialties', doctor_id=sample['doctor_id']), 1, 50, 8),
+    Endpoint('booking_bootstrap', lambda sample: _url('get_booking_bootstrap', parts='tree'), 1, 100, 8),
+    Endpoint('booking_availability', lambda sample: _url(
+        'get_booking_bootstrap', parts='availability', procedure_id=sample['procedure_id'],
+        clinic_id=sample['clinic_id']), 3, 100, 9),
+    Endpoint('api_clinics', lambda sample: _url('clinic-list'), 5, 100, 5),
+    Endpoint('api_doctors', lambda sample: _url('doctor-list'), 7, 100, 7),
+    Endpoint('api_patients', lambda sample: _url('patient-list'), 5, 100, 5),
+    Endpoint('api_specialties', lambda sample: _url('specialty-list'), 4, 100, 4),
+]
+
+Measurement = namedtuple('Measurement', ['scale', 'endpoint', 'status', 'queries', 'sql_ms', 'median_ms', 'max_ms',
+                                         'cold_queries', 'cold_ms'])
+
+# The requests the booking page makes to show one doctor's free slots, one after the
+# other: one lookup per step, and the bootstrap tree plus availability at a clinic.
+# The per-step lookups are today's, answered from the capability index like the bootstrap.
+Flow = namedtuple('Flow', ['name', 'endpoints'])
+
+FLOWS = [
+    Flow('booking_cascade', ['get_clinics', 'get_doctors_with_clinic_and_procedure', 'get_doctor_schedule',
+                             'get_available_slots']),
+    Flow('booking_bootstrap', ['booking_bootstrap', 'booking_availability']),
+]
+
+FlowResult = namedtuple('FlowResult', ['scale', 'flow', 'requests', 'queries', 'total_ms'])
+
+
+def pick_sample():
+    """
+    The ids the endpoint URLs are built from: the first doctor with a schedule, one of
+    their clinics and procedures, the next date they work there, and the first patient
+    with a visit.
+    """
+    schedule = DoctorSchedule.objects.select_related('affiliation').order_by('pk').first()
+    sample = {
+        'clinic_id': Clinic.objects.order_by('pk').values_list('pk', flat=True).first(),
+        'doctor_id': Doctor.objects.order_by('pk').values_list('pk', flat=True).first(),
+        'patient_id': Visit.objects.order_by('pk').values_list('patient_id', flat=True).first()
+        or Patient.objects.order_by('pk').values_list('pk', flat=True).first(),
+        'date': timezone.localdate().isoformat(),
+    }
+    if schedule:
+        tomorrow = timezone.localdate() + timedelta(days=1)
+        offset = (WEEKDAY_NUMBERS[schedule.day_of_week] - tomorrow.weekday()) % 7
+        sample.update(doctor_id=schedule.affiliation.doctor_id, clinic_id=schedule.affiliation.clinic_id,
+                      date=(tomorrow + timedelta(days=offset)).isoformat())
+    sample['procedure_id'] = Doctor.specialties.through.objects.filter(doctor_id=sample['doctor_id']).order_by(
+        'pk').values_list('specialty_id', flat=True).first()
+    return sample
+
+
+def _client():
+    user, created = User.objects.get_or_create(username='benchmark', defaults={'is_staff': True})
+    client = Client()
+    client.force_login(user)
+    return client
+
+
+def _go_cold():
+    """
+    Empty the Django cache and this process's capability index, as after a deploy.
+    """
+    cache.clear()
+    capability_index.reset()
+
+
+def measure(client, endpoint, sample, scale, repeat=5):
+    """
+    Time one request with the caches empty, then ``repeat`` warm ones; queries and SQL
+    time are those of the last request.
+    """
+    url = endpoint.url(sample)
+    _go_cold()
+    with QueryRecorder(slowest=0) as cold:
+        started = time.perf_counter()
+        client.get(url)
+        cold_ms = (time.perf_counter() - started) * 1000
+    timings = []
+    for _ in range(repeat):
+        with QueryRecorder(slowest=0) as queries:
+            started = time.perf_counter()
+            response = client.get(url)
+            timings.append((time.perf_counter() - started) * 1000)
+    return Measurement(scale, endpoint.name, response.status_code, queries.count, round(queries.seconds * 1000, 2),
+                       round(statistics.median(timings), 2), round(max(timings), 2), cold.count, round(cold_ms, 2))
+
+
+def check_budgets(measurements, endpoints=ENDPOINTS):
+    """
+    Describe every failed request, blown budget, and query count above the one at the
+    smallest scale.
+    """
+    budgets = {endpoint.name: endpoint for endpoint in endpoints}
+    smallest = {}
+    for measurement in sorted(measurements, key=lambda measurement: measurement.scale):
+        smallest.setdefault(measurement.endpoint, measurement)
+
+    violations = []
+    for measurement in measurements:
+        endpoint, label = budgets[measurement.endpoint], f'{measurement.endpoint} at {measurement.scale}x'
+        if measurement.status != 200:
+            violations.append(f'{label} returned {measurement.status}')
+        if measurement.queries > endpoint.max_queries:
+            violations.append(f'{label} ran {measurement.queries} queries, budget {endpoint.max_queries}')
+        if measurement.cold_queries > endpoint.max_cold_queries:
+            violations.append(f'{label} ran {measurement.cold_queries} queries cold, '
+                              f'budget {endpoint.max_cold_queries}')
+        if measurement.median_ms > endpoint.max_ms:
+            violations.append(f'{label} took {measurement.median_ms}ms, budget {endpoint.max_ms}ms')
+        baseline = smallest[measurement.endpoint]
+        if measurement.queries > baseline.queries:
+            violations.append(f'{label} ran {measurement.queries} queries, '
+                              f'{baseline.queries} at {baseline.scale}x')
+        if measurement.cold_queries > baseline.cold_queries:
+            violations.append(f'{label} ran {measurement.cold_queries} queries cold, '
+                              f'{baseline.cold_queries} at {baseline.scale}x')
+    return violations
+
+
+def compare_flows(measurements, flows=FLOWS):
+    """
+    The in-process cost of each flow at each scale: the medians of its requests added
+    up. Connecting and serving are left out, so this is not what a browser waits; the
+    load_test command times the flows end to end. Flows with an endpoint that was not
+    measured are left out.
+    """
+    by_scale = {}
+    for measurement in measurements:
+        by_scale.setdefault(measurement.scale, {})[measurement.endpoint] = measurement
+    results = []
+    for scale, measured in sorted(by_scale.items()):
+        for flow in flows:
+            if all(name in measured for name in flow.endpoints):
+                steps = [measured[name] for name in flow.endpoints]
+                results.append(FlowResult(scale, flow.name, len(steps), sum(step.queries for step in steps),
+                                          round(sum(step.median_ms for step in steps), 2)))
+    return results
+
+
+def run_benchmarks(scales=(1, 10, 100), repeat=5, seed=0, reset=None, endpoints=ENDPOINTS):
+    """
+    Seed the dataset at each scale and measure every endpoint against it. ``reset`` is
+    called before seeding each scale to empty the database; the cache is cleared too,
+    since the version stamps start over with the data.
+
+    Yields (scale, [Measurement, ...]) as each scale is done.
+    """
+    for scale in scales:
+        if reset:
+            reset()
+        cache.clear()
+        for _ in generate_dataset(seed=seed, **dataset_size(scale)):
+            pass
+        sample = pick_sample()
+        client = _client()
+        yield scale, [measure(client, endpoint, sample, scale, repeat) for endpoint in endpoints]
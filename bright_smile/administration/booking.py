@@ -0,0 +1,65 @@
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+
+from .availability import booking_days, bookings_version_key, day_bounds, day_occupancy, is_bookable, load_bookings, \
+    load_schedules, SLOT_DURATION
+from .caching import bump
+from .models import Appointment
+
+
+def patient_lock_key(patient_id, day):
+    return f'patient-bookings:{patient_id}:{day.isoformat()}'
+
+
+def _lock_days(appointment):
+    """
+    Serialize bookings per doctor-day and per patient-day by updating their counter
+    rows first. The row lock is held until the transaction ends, so bookings for
+    other doctors and days go ahead in parallel. Keys are taken in sorted order,
+    so two bookings cannot deadlock.
+    """
+    days = booking_days(appointment.date_time)
+    keys = {bookings_version_key(appointment.doctor_id, day) for day in days}
+    keys.update(patient_lock_key(appointment.patient_id, day) for day in days)
+    bump(*sorted(keys))
+
+
+def _check_slot(appointment):
+    date_time = appointment.date_time
+    day = timezone.localdate(date_time)
+    schedule = load_schedules([appointment.doctor_id], [appointment.clinic_id]).get(
+        (appointment.doctor_id, appointment.clinic_id), {})
+    hours = day_occupancy(schedule, [], day)
+    if hours is None or not hours.is_start(date_time):
+        raise ValidationError("The doctor does not see patients at this clinic at that time.", code='out_of_schedule')
+
+    bookings = load_bookings([appointment.doctor_id], *day_bounds(day)).get(appointment.doctor_id, [])
+    if not day_occupancy(schedule, bookings, day).is_start(date_time):
+        raise ValidationError("That slot has just been booked. Please choose another.", code='slot_taken')
+    if Appointment.objects.filter(patient_id=appointment.patient_id, date_time__gt=date_time - SLOT_DURATION,
+                                  date_time__lt=date_time + SLOT_DURATION).exists():
+        raise ValidationError("The patient already has an appointment at that time.", code='patient_busy')
+
+
+def book_appointment(appointment):
+    """
+    Save a new appointment if its slot is inside the doctor's hours at the clinic and
+    free for both the doctor and the patient; raise ValidationError otherwise.
+
+    Taken slots are usually turned away by the cached bitmap without locking. The
+    decisive check runs against the database, uncached, under the doctor-day and
+    patient-day locks, so two clerks can never book the same slot.
+
+    The doctor, clinic and patient rollups are refreshed once the booking has
+    committed, outside those locks; if that refresh is lost, rebuild_rollups repairs it.
+    """
+    if not is_bookable(appointment.doctor_id, appointment.clinic_id, appointment.date_time):
+        _check_slot(appointment)
+
+    appointment._refresh_rollups_on_commit = True
+    with transaction.atomic():
+        _lock_days(appointment)
+        _check_slot(appointment)
+        appointment.save()
+    return appointment
@@ -0,0 +1,132 @@
+from django.conf import settings
+from django.db import transaction
+from rest_framework import serializers, status
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from rest_framework.validators import UniqueValidator
+
+from .caching import bump_many, table_version_key
+from .rollups import create_rollups
+from .serializers import PrefetchedSlugRelatedField
+
+
+def _prefetched_fields(serializer):
+    """
+    (field name, PrefetchedSlugRelatedField) for every field of ``serializer`` that can use a prefetched lookup.
+    """
+    for name, field in serializer.fields.items():
+        relation = field.child_relation if isinstance(field, serializers.ManyRelatedField) else field
+        if isinstance(relation, PrefetchedSlugRelatedField) and not field.read_only:
+            yield name, relation
+
+
+def _slugs(value):
+    if isinstance(value, (list, tuple)):
+        return value
+    return [value]
+
+
+class BulkCreateMixin:
+    """
+    POST a JSON list to a viewset to create many objects in one request.
+
+    Items are validated together: related slugs are resolved with one query per
+    field, and unique fields are checked with one query each, against both the
+    table and the rest of the batch. Valid items are inserted with bulk_create,
+    many-to-many rows included. The response lists the outcome of each item:
+    {"created": 2, "results": [{"index": 0, "id": 7}, {"index": 1, "errors": {...}}, ...]}
+
+    Invalid items are skipped unless ``?atomic=true`` is passed, in which case one
+    invalid item rejects the whole batch.
+    """
+    bulk_batch_size = 1000
+
+    def create(self, request, *args, **kwargs):
+        if not isinstance(request.data, list):
+            return super().create(request, *args, **kwargs)
+
+        items = request.data
+        if len(items) > settings.BULK_CREATE_MAX_ITEMS:
+            raise ValidationError(f'Send at most {settings.BULK_CREATE_MAX_ITEMS} items per request.')
+        serializer = self.get_bulk_serializer(items)
+
+        validated, errors = {}, {}
+        for index, item in enumerate(items):
+            try:
+                validated[index] = serializer.run_validation(item)
+            except ValidationError as exc:
+                errors[index] = exc.detail
+        self.check_bulk_unique(serializer, validated, errors)
+
+        if errors and request.query_params.get('atomic') == 'true':
+            return self.bulk_response({}, errors, status.HTTP_400_BAD_REQUEST)
+
+        created = self.perform_bulk_create(serializer, validated) if validated else {}
+        if not created:
+            response_status = status.HTTP_400_BAD_REQUEST
+        else:
+            response_status = status.HTTP_207_MULTI_STATUS if errors else status.HTTP_201_CREATED
+        return self.bulk_response(created, errors, response_status)
+
+    def get_bulk_serializer(self, items):
+        """
+        One serializer validates every item. Its related-slug fields read from lookups loaded up front,
+        and its per-row unique validators are left to check_bulk_unique.
+        """
+        context = self.get_serializer_context()
+        context['slug_lookups'] = {}
+        serializer = self.get_serializer(context=context)
+        for name, relation in _prefetched_fields(serializer):
+            slugs = {slug for item in items if isinstance(item, dict) for slug in _slugs(item.get(name, []))}
+            context['slug_lookups'][relation.queryset.model] = relation.build_lookup(slugs)
+        for field in serializer.fields.values():
+            field.validators = [validator for validator in field.validators if not isinstance(validator, UniqueValidator)]
+        return serializer
+
+    def check_bulk_unique(self, serializer, validated, errors):
+        model = serializer.Meta.model
+        for field in model._meta.fields:
+            if not field.unique or field.primary_key:
+                continue
+            values = [data[field.name] for data in validated.values() if field.name in data]
+            taken = set(model.objects.filter(**{f'{field.name}__in': values}).values_list(field.name, flat=True))
+            message = f'{model._meta.verbose_name} with this {field.verbose_name} already exists.'
+            for index, data in list(validated.items()):
+                value = data.get(field.name)
+                if value in taken:
+                    errors[index] = {field.name: [message]}
+                    del validated[index]
+                taken.add(value)
+
+    def perform_bulk_create(self, serializer, validated):
+        """
+        Insert the validated items and their many-to-many rows; returns {index: instance}.
+        """
+        model = serializer.Meta.model
+        many_to_many = [field for field in model._meta.many_to_many if field.name in serializer.fields]
+        instances = {
+            index: model(**{name: value for name, value in data.items()
+                            if name not in {field.name for field in many_to_many}})
+            for index, data in validated.items()
+        }
+        with transaction.atomic():
+            model.objects.bulk_create(instances.values(), batch_size=self.bulk_batch_size)
+            for field in many_to_many:
+                through = field.remote_field.through
+                source, target = field.m2m_field_name(), field.m2m_reverse_field_name()
+                through.objects.bulk_create([
+                    through(**{f'{source}_id': instances[index].pk, f'{target}_id': related.pk})
+                    for index, data in validated.items()
+                    for related in {related.pk: related for related in data.get(field.name, [])}.values()
+                ], batch_size=self.bulk_batch_size)
+            # bulk_create sends no post_save, so the rollup rows and version stamps are handled here
+            create_rollups(instances.values())
+            written = [model] + [field.remote_field.through for field in many_to_many]
+            bump_many(table_version_key(table) for table in written if table in getattr(self, 'version_models', ()))
+        return instances
+
+    def bulk_response(self, created, errors, response_status):
+        results = [{'index': index, 'id': instance.pk} for index, instance in created.items()]
+        results += [{'index': index, 'errors': detail} for index, detail in errors.items()]
+        return Response({'created': len(created), 'results': sorted(results, key=lambda result: result['index'])},
+                        status=response_status)
@@ -0,0 +1,138 @@
+import threading
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import ChangeCounter
+
+
+def bump(*keys):
+    """
+    Increment the version stamp of each key. Call inside the transaction that makes
+    the change, so readers never see the new data with the old version.
+    """
+    now = timezone.now()
+    for key in keys:
+        if ChangeCounter.objects.filter(key=key).update(value=F('value') + 1, updated_at=now):
+            continue
+        try:
+            with transaction.atomic():
+                ChangeCounter.objects.create(key=key, value=1, updated_at=now)
+        except IntegrityError:
+            ChangeCounter.objects.filter(key=key).update(value=F('value') + 1, updated_at=now)
+
+
+def bump_many(keys):
+    """
+    Increment many version stamps in two queries, for bulk writes that bypass the signals.
+    Unlike bump() the rows are not locked in a set order, so keep it out of booking paths.
+    """
+    keys = set(keys)
+    if not keys:
+        return
+    ChangeCounter.objects.bulk_create([ChangeCounter(key=key) for key in keys], ignore_conflicts=True)
+    ChangeCounter.objects.filter(key__in=keys).update(value=F('value') + 1, updated_at=timezone.now())
+
+
+def get_versions(keys):
+    """
+    Current version stamp of each key in one query; keys never bumped are at 0.
+    """
+    keys = list(keys)
+    versions = dict.fromkeys(keys, 0)
+    versions.update(ChangeCounter.objects.filter(key__in=keys).values_list('key', 'value'))
+    return versions
+
+
+def get_stamps(keys):
+    """
+    (version, last changed) of each key in one query; keys never bumped are at (0, None).
+    """
+    keys = list(keys)
+    stamps = dict.fromkeys(keys, (0, None))
+    stamps.update((key, (value, updated_at)) for key, value, updated_at in
+                  ChangeCounter.objects.filter(key__in=keys).values_list('key', 'value', 'updated_at'))
+    return stamps
+
+
+def attach_stamps(targets):
+    """
+    Set each (object, attribute, key) attribute to the stamp of the key, in one query;
+    templates vary their cached fragments on them.
+    """
+    targets = list(targets)
+    stamps = get_stamps({key for _, _, key in targets})
+    for obj, attribute, key in targets:
+        setattr(obj, attribute, stamps[key])
+
+
+async def aget_versions(keys):
+    """
+    get_versions() for async views.
+    """
+    keys = list(keys)
+    versions = dict.fromkeys(keys, 0)
+    versions.update([row async for row in ChangeCounter.objects.filter(key__in=keys).values_list('key', 'value')])
+    return versions
+
+
+async def aget_stamps(keys):
+    """
+    get_stamps() for async views.
+    """
+    keys = list(keys)
+    stamps = dict.fromkeys(keys, (0, None))
+    stamps.update([(key, (value, updated_at)) async for key, value, updated_at in
+                   ChangeCounter.objects.filter(key__in=keys).values_list('key', 'value', 'updated_at')])
+    return stamps
+
+
+def table_version_key(model):
+    """
+    Version stamp of a whole table, bumped on every write to it (see administration.signals).
+    """
+    return f'table:{model._meta.label_lower}'
+
+
+def object_version_key(model, pk):
+    """
+    Version stamp of one row, bumped on writes to it for the models in
+    administration.signals.OBJECT_VERSIONED_MODELS.
+    """
+    return f'{model._meta.label_lower}:{pk}'
+
+
+class CacheStats:
+    """
+    Per-process hit/miss counters, one namespace per cached resource. Caches that
+    serve stale entries also count those hits as ``stale``.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = defaultdict(lambda: {'hits': 0, 'misses': 0})
+
+    def record(self, namespace, hits=0, misses=0, stale=0):
+        with self._lock:
+            counts = self._counts[namespace]
+            counts['hits'] += hits
+            counts['misses'] += misses
+            if stale:
+                counts['stale'] = counts.get('stale', 0) + stale
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                namespace: dict(counts, hit_ratio=round(counts['hits'] / (counts['hits'] + counts['misses']), 4)
+                                if counts['hits'] + counts['misses'] else None)
+                for namespace, counts in self._counts.items()
+            }
+
+    def reset(self):
+        with self._lock:
+            self._counts.clear()
+
+
+cache_stats = CacheStats()
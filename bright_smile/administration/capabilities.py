@@ -0,0 +1,195 @@
+import threading
+import time
+from collections import defaultdict, namedtuple
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .caching import cache_stats, get_stamps, table_version_key
+from .models import Clinic, Doctor, Specialty, DoctorClinicAffiliation, DoctorSchedule
+
+# Every table the index is built from; a write to any of them bumps its stamp
+INDEX_MODELS = (Specialty, Clinic, Doctor, Doctor.specialties.through, DoctorClinicAffiliation, DoctorSchedule)
+INDEX_KEYS = tuple(table_version_key(model) for model in INDEX_MODELS)
+
+Affiliation = namedtuple('Affiliation', ['id', 'doctor_id', 'clinic_id', 'office_address', 'schedules'])
+Schedule = namedtuple('Schedule', ['day_of_week', 'start_time', 'end_time'])
+
+
+def _id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class CapabilityIndex:
+    """
+    Which clinics offer each procedure, which doctors work at each clinic, what each
+    doctor does and when, loaded in six queries and answered from memory. Ids may be
+    given as strings, as they come in a query string; unknown ids have no matches.
+    Lists of (id, name) pairs are in id order.
+    """
+
+    def __init__(self, procedures, clinics, doctors, doctor_specialties, affiliations):
+        self.procedures = procedures
+        self.clinics = clinics
+        self.doctors = doctors
+        self.doctor_specialties = doctor_specialties
+        self.affiliations = affiliations
+
+        self.clinic_doctors = defaultdict(set)
+        self.procedure_clinics = defaultdict(set)
+        for doctor_id, clinic_id in affiliations:
+            self.clinic_doctors[clinic_id].add(doctor_id)
+            for procedure_id in doctor_specialties.get(doctor_id, ()):
+                self.procedure_clinics[procedure_id].add(clinic_id)
+
+    @classmethod
+    def load(cls):
+        doctor_specialties = defaultdict(set)
+        for doctor_id, specialty_id in Doctor.specialties.through.objects.values_list('doctor_id', 'specialty_id'):
+            doctor_specialties[doctor_id].add(specialty_id)
+
+        schedules = defaultdict(list)
+        for affiliation_id, *hours in DoctorSchedule.objects.order_by('pk').values_list(
+                'affiliation_id', 'day_of_week', 'start_time', 'end_time'):
+            schedules[affiliation_id].append(Schedule(*hours))
+
+        affiliations = {
+            (doctor_id, clinic_id): Affiliation(pk, doctor_id, clinic_id, office_address, tuple(schedules[pk]))
+            for pk, doctor_id, clinic_id, office_address in DoctorClinicAffiliation.objects.values_list(
+                'pk', 'doctor_id', 'clinic_id', 'office_address')
+        }
+        return cls(
+            procedures=dict(Specialty.objects.order_by('pk').values_list('pk', 'name')),
+            clinics=dict(Clinic.objects.order_by('pk').values_list('pk', 'name')),
+            doctors=dict(Doctor.objects.order_by('pk').values_list('pk', 'name')),
+            doctor_specialties=dict(doctor_specialties),
+            affiliations=affiliations,
+        )
+
+    def procedure_choices(self):
+        return list(self.procedures.items())
+
+    def clinic_choices(self):
+        return list(self.clinics.items())
+
+    def clinics_offering(self, procedure_id):
+        """
+        Clinics with at least one affiliated doctor who performs the procedure.
+        """
+        return [(pk, self.clinics[pk]) for pk in sorted(self.procedure_clinics.get(_id(procedure_id), ()))]
+
+    def doctors_at(self, clinic_id, procedure_id=None):
+        """
+        Doctors affiliated with the clinic, optionally only those who perform the procedure.
+        """
+        doctor_ids = self.clinic_doctors.get(_id(clinic_id), ())
+        if procedure_id is not None:
+            procedure_id = _id(procedure_id)
+            doctor_ids = [pk for pk in doctor_ids if procedure_id in self.doctor_specialties.get(pk, ())]
+        return [(pk, self.doctors[pk]) for pk in sorted(doctor_ids)]
+
+    def specialties_of(self, doctor_id):
+        return [(pk, self.procedures[pk]) for pk in sorted(self.doctor_specialties.get(_id(doctor_id), ()))]
+
+    def affiliation(self, doctor_id, clinic_id):
+        return self.affiliations.get((_id(doctor_id), _id(clinic_id)))
+
+    def offers(self):
+        """
+        The whole tree: {procedure_id: {clinic_id: [doctor_id, ...]}}, without empty branches.
+        """
+        return {
+            procedure_id: {clinic_id: [pk for pk, _ in self.doctors_at(clinic_id, procedure_id)]
+                           for clinic_id in sorted(clinic_ids)}
+            for procedure_id, clinic_ids in sorted(self.procedure_clinics.items())
+        }
+
+    def pairs(self, procedure_id=None, clinic_id=None, doctor_id=None):
+        """
+        (doctor_id, clinic_id) of the affiliations matching every filter that is not None.
+        """
+        def matches(value, wanted):
+            return wanted is None or _id(wanted) == value
+
+        return sorted(
+            (pair_doctor_id, pair_clinic_id) for pair_doctor_id, pair_clinic_id in self.affiliations
+            if matches(pair_doctor_id, doctor_id) and matches(pair_clinic_id, clinic_id)
+            and (procedure_id is None or _id(procedure_id) in self.doctor_specialties.get(pair_doctor_id, ()))
+        )
+
+
+class WorkerIndex:
+    """
+    The capability index of this process. It is loaded on first use and reloaded
+    when one of the INDEX_KEYS stamps has moved; the stamps are read at most every
+    CAPABILITY_INDEX_MAX_AGE seconds, so other workers' writes show up within that.
+    Writes made through this process's signals call expire() and are seen at once.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._index = None
+        self._stamps = None
+        self._checked = None
+
+    def fresh(self, stamps=None):
+        """
+        The index if it is known to be current without a query, else None. ``stamps``
+        already read by the caller (see administration.conditional) settle that when
+        they cover INDEX_KEYS; otherwise the last check must be recent enough.
+        """
+        if self._index is None:
+            return None
+        if stamps is not None and all(key in stamps for key in INDEX_KEYS):
+            current = {key: stamps[key] for key in INDEX_KEYS} == self._stamps
+        else:
+            current = self._checked is not None and time.monotonic() - self._checked < settings.CAPABILITY_INDEX_MAX_AGE
+        if not current:
+            return None
+        cache_stats.record('capability_index', hits=1)
+        return self._index
+
+    def get(self, stamps=None):
+        """
+        The current index, checking the stamps and reloading as needed.
+        """
+        index = self.fresh(stamps)
+        if index is not None:
+            return index
+
+        with self._lock:
+            # Stamps are read before the rows, so a write in between only costs an extra reload later
+            current = get_stamps(INDEX_KEYS)
+            if current == self._stamps and self._index is not None:
+                cache_stats.record('capability_index', hits=1)
+            else:
+                cache_stats.record('capability_index', misses=1)
+                self._index, self._stamps = CapabilityIndex.load(), current
+            self._checked = time.monotonic()
+            return self._index
+
+    async def aget(self, stamps=None):
+        """
+        get() for async views; only a check or reload leaves the event loop.
+        """
+        index = self.fresh(stamps)
+        return index if index is not None else await sync_to_async(self.get)(stamps)
+
+    def expire(self):
+        """
+        Check the stamps on the next use.
+        """
+        self._checked = None
+
+    def reset(self):
+        """
+        Drop the index, so the next use loads it as a new worker would.
+        """
+        with self._lock:
+            self._index = self._stamps = self._checked = None
+
+
+capability_index = WorkerIndex()
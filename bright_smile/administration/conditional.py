@@ -0,0 +1,152 @@
+import hashlib
+from functools import wraps
+from inspect import iscoroutinefunction
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.views.decorators.http import condition
+
+from .caching import aget_stamps, cache_stats, get_stamps, table_version_key
+
+SAFE_METHODS = ('GET', 'HEAD')
+
+
+def versioned(get_keys, cache_namespace=None):
+    """
+    Conditional GET for a view whose output depends only on its query string and the
+    version stamps named by ``get_keys(request, *args, **kwargs)``. The ETag hashes
+    both and Last-Modified is the latest change among the stamps, so a matching
+    If-None-Match or If-Modified-Since gets a 304 after a single query, before the
+    view runs. ``get_keys`` may return None to serve the view without validators.
+
+    With a ``cache_namespace``, 200 responses are also cached under their ETag for
+    RESPONSE_CACHE_TIMEOUT seconds, so clients without a copy are answered from the
+    cache after the same single query. A write bumps a stamp and so moves every
+    response that depends on it to a new key; nothing has to be deleted.
+
+    Async views are supported; their stamps are read with the async ORM first.
+    """
+    def stamps(request, *args, **kwargs):
+        if not hasattr(request, '_version_stamps'):
+            keys = get_keys(request, *args, **kwargs) if request.method in SAFE_METHODS else None
+            request._version_stamps = None if keys is None else get_stamps(keys)
+        return request._version_stamps
+
+    def etag(request, *args, **kwargs):
+        versions = stamps(request, *args, **kwargs)
+        if versions is None:
+            return None
+        # The times keep tags unique should the counters ever start over, as after a database restore
+        payload = ';'.join([request.get_full_path()] + [f'{key}={value}@{updated_at}'
+                                                        for key, (value, updated_at) in sorted(versions.items())])
+        return hashlib.sha1(payload.encode()).hexdigest()
+
+    def last_modified(request, *args, **kwargs):
+        versions = stamps(request, *args, **kwargs)
+        # Stamps never bumped have not changed since tracking began, before any that were
+        changed = [updated_at for _, updated_at in (versions or {}).values() if updated_at]
+        return max(changed) if changed else None
+
+    async def read_stamps(request, *args, **kwargs):
+        # condition() calls etag() and last_modified() synchronously, even for async views
+        if not hasattr(request, '_version_stamps'):
+            keys = get_keys(request, *args, **kwargs) if request.method in SAFE_METHODS else None
+            request._version_stamps = None if keys is None else await aget_stamps(keys)
+
+    conditional = condition(etag_func=etag, last_modified_func=last_modified)
+
+    def cache_key(request, *args, **kwargs):
+        tag = etag(request, *args, **kwargs)
+        return None if tag is None else f'{cache_namespace}:{tag}'
+
+    def cached_response(cached):
+        if cached is None:
+            cache_stats.record(cache_namespace, misses=1)
+            return None
+        cache_stats.record(cache_namespace, hits=1)
+        content, content_type = cached
+        return HttpResponse(content, content_type=content_type)
+
+    def cacheable(response):
+        return response.status_code == 200 and not response.streaming
+
+    def decorator(view):
+        if iscoroutinefunction(view):
+            if cache_namespace is None:
+                served = conditional(view)
+            else:
+                @wraps(view)
+                async def cached_view(request, *args, **kwargs):
+                    key = cache_key(request, *args, **kwargs)
+                    if key is None:
+                        return await view(request, *args, **kwargs)
+                    response = cached_response(await cache.aget(key))
+                    if response is None:
+                        response = await view(request, *args, **kwargs)
+                        if cacheable(response):
+                            await cache.aset(key, (response.content, response['Content-Type']),
+                                             settings.RESPONSE_CACHE_TIMEOUT)
+                    return response
+
+                served = conditional(cached_view)
+
+            @wraps(view)
+            async def async_view(request, *args, **kwargs):
+                await read_stamps(request, *args, **kwargs)
+                return await served(request, *args, **kwargs)
+
+            return async_view
+
+        if cache_namespace is None:
+            return conditional(view)
+
+        @wraps(view)
+        def cached_view(request, *args, **kwargs):
+            key = cache_key(request, *args, **kwargs)
+            if key is None:
+                return view(request, *args, **kwargs)
+            response = cached_response(cache.get(key))
+            if response is None:
+                response = view(request, *args, **kwargs)
+                if cacheable(response):
+                    cache.set(key, (response.content, response['Content-Type']), settings.RESPONSE_CACHE_TIMEOUT)
+            return response
+
+        return conditional(cached_view)
+
+    return decorator
+
+
+def request_stamps(request):
+    """
+    The stamps versioned() read for this request, or None; views can reuse them.
+    """
+    return getattr(request, '_version_stamps', None)
+
+
+def versioned_by(*models, cache_namespace=None):
+    """
+    versioned() on the whole-table stamps of ``models``.
+    """
+    keys = [table_version_key(model) for model in models]
+    return versioned(lambda request, *args, **kwargs: keys, cache_namespace)
+
+
+class VersionedViewSetMixin:
+    """
+    Conditional GET for a viewset's list and retrieve actions, on the whole-table
+    stamps of ``version_models``. Override get_version_keys() to vary them by request.
+    """
+    version_models = ()
+
+    def get_version_keys(self, request):
+        return [table_version_key(model) for model in self.version_models]
+
+    def list(self, request, *args, **kwargs):
+        view = versioned(lambda request, *args, **kwargs: self.get_version_keys(request))(super().list)
+        return view(request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        view = versioned(lambda request, *args, **kwargs: self.get_version_keys(request))(super().retrieve)
+        return view(request, *args, **kwargs)
@@ -0,0 +1,105 @@
+from collections import defaultdict, namedtuple
+from itertools import islice
+
+from django.conf import settings
+from django.db.models import Exists, OuterRef
+
+from .availability import day_bounds
+from .models import Patient, Visit, Appointment
+
+# columns: [(header, values_list lookup)]; extra_headers are filled per chunk by add_related
+ExportSpec = namedtuple('ExportSpec', ['build_queryset', 'columns', 'extra_headers', 'add_related'])
+
+EVENT_COLUMNS = [
+    ('id', 'id'),
+    ('date_time', 'date_time'),
+    ('patient_id', 'patient_id'),
+    ('patient_name', 'patient__name'),
+    ('doctor_id', 'doctor_id'),
+    ('doctor_name', 'doctor__name'),
+    ('doctor_npi', 'doctor__NPI'),
+    ('clinic_id', 'clinic_id'),
+    ('clinic_name', 'clinic__name'),
+]
+
+
+def _filter_events(queryset, start, end, clinic_id):
+    if start:
+        queryset = queryset.filter(date_time__gte=day_bounds(start)[0])
+    if end:
+        queryset = queryset.filter(date_time__lt=day_bounds(end)[1])
+    if clinic_id:
+        queryset = queryset.filter(clinic_id=clinic_id)
+    return queryset
+
+
+def _visits(start, end, clinic_id):
+    return _filter_events(Visit.objects.all(), start, end, clinic_id)
+
+
+def _appointments(start, end, clinic_id):
+    return _filter_events(Appointment.objects.all(), start, end, clinic_id)
+
+
+def _patients(start, end, clinic_id):
+    """
+    All patients, or with any filter, those with a visit or appointment matching it.
+    """
+    if not (start or end or clinic_id):
+        return Patient.objects.all()
+    return Patient.objects.filter(
+        Exists(_visits(start, end, clinic_id).filter(patient=OuterRef('pk')))
+        | Exists(_appointments(start, end, clinic_id).filter(patient=OuterRef('pk')))
+    )
+
+
+def _add_procedures(chunk):
+    """
+    Names of the procedures done in each visit of the chunk, in one query.
+    """
+    procedures = defaultdict(list)
+    through = Visit.procedures_done.through
+    rows = through.objects.filter(visit_id__in=[row['id'] for row in chunk]).order_by('specialty__name')
+    for visit_id, name in rows.values_list('visit_id', 'specialty__name'):
+        procedures[visit_id].append(name)
+    for row in chunk:
+        row['procedures'] = procedures[row['id']]
+
+
+EXPORTS = {
+    'patients': ExportSpec(_patients, [
+        ('id', 'id'), ('name', 'name'), ('date_of_birth', 'date_of_birth'), ('phone_number', 'phone_number'),
+        ('gender', 'gender'), ('address', 'address'),
+    ], [], None),
+    'visits': ExportSpec(_visits, EVENT_COLUMNS + [('doctor_notes', 'doctor_notes')], ['procedures'], _add_procedures),
+    'appointments': ExportSpec(_appointments, EVENT_COLUMNS + [
+        ('procedure', 'procedure__name'), ('date_booked', 'date_booked'),
+    ], [], None),
+}
+
+
+def export_headers(resource):
+    spec = EXPORTS[resource]
+    return [header for header, _ in spec.columns] + spec.extra_headers
+
+
+def export_chunks(resource, start=None, end=None, clinic_id=None, chunk_size=None):
+    """
+    The rows of an export as lists of dicts, ``chunk_size`` at a time.
+
+    Rows come from a single query read through a server-side cursor on PostgreSQL,
+    with the names of related rows joined in. Only the current chunk is held in
+    memory, and many-to-many columns cost one query per chunk.
+    """
+    spec = EXPORTS[resource]
+    chunk_size = chunk_size or settings.EXPORT_CHUNK_SIZE
+    headers = [header for header, _ in spec.columns]
+    queryset = spec.build_queryset(start, end, clinic_id).order_by('pk')
+    rows = queryset.values_list(*(lookup for _, lookup in spec.columns)).iterator(chunk_size=chunk_size)
+    while True:
+        chunk = [dict(zip(headers, row)) for row in islice(rows, chunk_size)]
+        if not chunk:
+            return
+        if spec.add_related:
+            spec.add_related(chunk)
+        yield chunk
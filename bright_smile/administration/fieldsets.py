@@ -0,0 +1,85 @@
+from django.core.exceptions import FieldDoesNotExist, ValidationError as DjangoValidationError
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import SAFE_METHODS
+
+
+class SparseFieldsetMixin:
+    """
+    Viewset mixin for ``?fields=id,name`` on reads: only the named fields are
+    serialized, only their columns are selected, and relations are prefetched only
+    when asked for.
+
+    ``field_prefetches`` maps serializer fields to the prefetch_related() lookups
+    (strings or Prefetch objects) they need; they are applied to every read that
+    returns the field, so a page costs the same number of queries at any size.
+    """
+    field_prefetches = {}
+    fields_param = 'fields'
+
+    def requested_fields(self):
+        """
+        The serializer fields to return, in serializer order; all of them without ``?fields=``.
+        """
+        if not hasattr(self, '_requested_fields'):
+            available = list(self.get_serializer_class()(context=self.get_serializer_context()).fields)
+            param = self.request.query_params.get(self.fields_param) if self.request.method in SAFE_METHODS else None
+            if not param:
+                self._requested_fields = available
+            else:
+                names = {name.strip() for name in param.split(',') if name.strip()}
+                unknown = names - set(available)
+                if unknown:
+                    raise ValidationError({self.fields_param: [
+                        f'Unknown field(s): {", ".join(sorted(unknown))}. Choose from {", ".join(available)}.'
+                    ]})
+                self._requested_fields = [name for name in available if name in names]
+        return self._requested_fields
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request.method not in SAFE_METHODS:
+            return queryset
+
+        fields = self.requested_fields()
+        serializer_fields = self.get_serializer_class()(context=self.get_serializer_context()).fields
+        model = queryset.model
+        columns = []
+        for name in fields:
+            try:
+                model_field = model._meta.get_field(serializer_fields[name].source)
+            except FieldDoesNotExist:
+                continue
+            if model_field.concrete and not model_field.many_to_many:
+                columns.append(model_field.name)
+        prefetches = [self.field_prefetches[name] for name in fields if name in self.field_prefetches]
+        return queryset.only(model._meta.pk.name, *columns).prefetch_related(*prefetches)
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        fields = set(self.requested_fields())
+        target = getattr(serializer, 'child', serializer)
+        for name in list(target.fields):
+            if name not in fields:
+                target.fields.pop(name)
+        return serializer
+
+
+class IndexedFilterMixin:
+    """
+    Viewset mixin for exact-match filters, ``?clinic=3&specialty=2``. ``filter_fields``
+    maps query parameters to lookups; keep them to indexed columns so a filtered page
+    is an index scan.
+    """
+    filter_fields = {}
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        for param, lookup in self.filter_fields.items():
+            value = self.request.query_params.get(param)
+            if value is None:
+                continue
+            try:
+                queryset = queryset.filter(**{lookup: value})
+            except (ValueError, DjangoValidationError):
+                raise ValidationError({param: [f'Invalid value {value!r}.']})
+        return queryset
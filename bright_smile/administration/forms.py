@@ -1,6 +1,8 @@
 from django import forms
+from django.db import router
 from django.forms import inlineformset_factory
 
+from .capabilities import capability_index
 from .models import Clinic, Doctor, Patient, DoctorClinicAffiliation, DAYS_OF_WEEK, DoctorSchedule, Specialty, Visit, \
     Appointment
 
@@ -71,51 +73,102 @@ class PatientForm(forms.ModelForm):
         fields = ['name', 'date_of_birth', 'last_4_ssn', 'phone_number', 'gender', 'address']
 
 
+def _indexed_instance(model, pk, name):
+    return model.from_db(router.db_for_read(model), ['id', 'name'], [int(pk), name])
+
+
+def _form_index(form):
+    """
+    The capability index for ``form``. A bound form is about to be saved, so the
+    index's stamps are checked first (one query): another worker may have deleted a
+    row within the last CAPABILITY_INDEX_MAX_AGE seconds.
+    """
+    if form.is_bound:
+        capability_index.expire()
+    return capability_index.get()
+
+
+class IndexedChoiceField(forms.ChoiceField):
+    """
+    A foreign key choice whose options come from the capability index rather than
+    a queryset. The cleaned value is an instance carrying only its id and name; the
+    other fields load on access. Forms load the index through _form_index(), so a
+    choice deleted before the form was submitted is not offered and fails as invalid.
+    """
+    empty_label = '---------'
+
+    def __init__(self, model, *args, **kwargs):
+        self.model = model
+        super().__init__(*args, **kwargs)
+
+    def set_options(self, pairs):
+        self.choices = [('', self.empty_label)] + list(pairs)
+
+    def prepare_value(self, value):
+        return getattr(value, 'pk', value)
+
+    def clean(self, value):
+        value = super().clean(value)
+        if value in self.empty_values:
+            return None
+        return _indexed_instance(self.model, value, dict(self.choices)[int(value)])
+
+
+class IndexedMultipleChoiceField(forms.MultipleChoiceField):
+    """
+    The many-to-many counterpart of IndexedChoiceField. Model validation does not
+    check many-to-many rows, so only the index's stamp check keeps deleted ones out.
+    """
+
+    def __init__(self, model, *args, **kwargs):
+        self.model = model
+        super().__init__(*args, **kwargs)
+
+    def set_options(self, pairs):
+        self.choices = list(pairs)
+
+    def prepare_value(self, value):
+        return [getattr(item, 'pk', item) for item in value] if isinstance(value, (list, tuple)) else value
+
+    def clean(self, value):
+        names = dict(self.choices)
+        return [_indexed_instance(self.model, pk, names[int(pk)]) for pk in super().clean(value)]
+
+
+def _selected(data, name):
+    try:
+        return int(data.get(name))
+    except (TypeError, ValueError):
+        return None
+
+
 class VisitForm(forms.ModelForm):
+    clinic = IndexedChoiceField(Clinic)
+    doctor = IndexedChoiceField(Doctor)
+    procedures_done = IndexedMultipleChoiceField(Specialty, widget=forms.CheckboxSelectMultiple())
+
     class Meta:
         model = Visit
         fields = ['clinic','doctor', 'date_time', 'procedures_done', 'doctor_notes']
         widgets = {
-            'procedures_done': forms.CheckboxSelectMultiple(),
             'date_time': forms.DateTimeInput(attrs={'type': 'datetime-local'}),
         }
 
     def __init__(self, *args, **kwargs):
         super(VisitForm, self).__init__(*args, **kwargs)
-
-        # Initially, doctors and procedures should be empty
-        self.fields['doctor'].queryset = Doctor.objects.none()
-        self.fields['procedures_done'].queryset = Specialty.objects.none()
-
-        # When the form is submitted, filter based on the selected clinic and doctor
-        if 'clinic' in self.data:
-            try:
-                clinic_id = int(self.data.get('clinic'))
-                # Filter doctors based on the clinic using DoctorClinicAffiliation
-                self.fields['doctor'].queryset = Doctor.objects.filter(
-                    id__in=DoctorClinicAffiliation.objects.filter(clinic_id=clinic_id).values_list('doctor_id', flat=True)
-                )
-            except (ValueError, TypeError):
-                pass  # Invalid clinic_id or doctor_id
-
-        elif self.instance.pk:
-            # Populate doctors if editing the visit
-            self.fields['doctor'].queryset = Doctor.objects.filter(
-                id__in=DoctorClinicAffiliation.objects.filter(clinic=self.instance.clinic).values_list('doctor_id', flat=True)
-            )
-
-        # When the doctor is selected, filter procedures based on the doctor's specialties
-        if 'doctor' in self.data:
-            try:
-                doctor_id = int(self.data.get('doctor'))
-                self.fields['procedures_done'].queryset = Doctor.objects.get(pk=doctor_id).specialties.all()
-            except (ValueError, TypeError):
-                pass
-        elif self.instance.pk:
-            self.fields['procedures_done'].queryset = self.instance.doctor.specialties.all() 
+        index = _form_index(self)
+        self.fields['clinic'].set_options(index.clinic_choices())
+
+        # Doctors and procedures follow the selected clinic and doctor; initially there are none
+        clinic_id = _selected(self.data, 'clinic') if 'clinic' in self.data else self.instance.clinic_id
+        doctor_id = _selected(self.data, 'doctor') if 'doctor' in self.data else self.instance.doctor_id
+        self.fields['doctor'].set_options(index.doctors_at(clinic_id) if clinic_id else [])
+        self.fields['procedures_done'].set_options(index.specialties_of(doctor_id) if doctor_id else [])
    
 class AppointmentForm(forms.ModelForm):
-    procedure = forms.ModelChoiceField(queryset=Specialty.objects.all(), label="Select Procedure")
+    procedure = IndexedChoiceField(Specialty, label="Select Procedure")
+    clinic = IndexedChoiceField(Clinic)
+    doctor = IndexedChoiceField(Doctor)
 
     class Meta:
         model = Appointment
@@ -126,30 +179,11 @@ class AppointmentForm(forms.ModelForm):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.fields['clinic'].queryset = Clinic.objects.none()
-        self.fields['doctor'].queryset = Doctor.objects.none()
-
-        # Dynamically update clinics and doctors based on the selected procedure
-        if 'procedure' in self.data:
-            try:
-                procedure_id = int(self.data.get('procedure'))
-                
-                # Get clinics that have affiliated doctors offering this procedure
-                self.fields['clinic'].queryset = Clinic.objects.filter(
-                    doctorclinicaffiliation__doctor__specialties=procedure_id
-                ).distinct()
-            except (ValueError, TypeError):
-                pass  # Invalid input from the client; ignore it
-
-        if 'clinic' in self.data:
-            try:
-                clinic_id = int(self.data.get('clinic'))
-                procedure_id = int(self.data.get('procedure'))
-
-                # Get doctors affiliated with the selected clinic and offering the procedure
-                self.fields['doctor'].queryset = Doctor.objects.filter(
-                    doctorclinicaffiliation__clinic=clinic_id,
-                    specialties=procedure_id
-                ).distinct()
-            except (ValueError, TypeError):
-                pass  # Invalid input from the client; ignore it
\ No newline at end of file
+        index = _form_index(self)
+        self.fields['procedure'].set_options(index.procedure_choices())
+
+        # Clinics offering the selected procedure, and doctors there who perform it
+        procedure_id = _selected(self.data, 'procedure')
+        clinic_id = _selected(self.data, 'clinic')
+        self.fields['clinic'].set_options(index.clinics_offering(procedure_id) if procedure_id else [])
+        self.fields['doctor'].set_options(index.doctors_at(clinic_id, procedure_id) if clinic_id and procedure_id else [])
@@ -0,0 +1,211 @@
+import csv
+import io
+from collections import namedtuple
+from datetime import datetime
+from itertools import islice
+
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .availability import booking_days, bookings_version_key
+from .caching import bump_many
+from .models import Clinic, Doctor, Patient, Specialty, Visit, Appointment, ImportCheckpoint
+
+# Natural keys of the rows every history file refers to
+PATIENT_COLUMNS = ('patient_name', 'patient_date_of_birth', 'patient_last_4_ssn')
+COMMON_COLUMNS = ('date_time', 'doctor_npi', 'clinic_name') + PATIENT_COLUMNS
+
+# kind -> model, required CSV columns, model columns written per row
+ImportKind = namedtuple('ImportKind', ['model', 'required', 'columns'])
+IMPORT_KINDS = {
+    'visits': ImportKind(Visit, COMMON_COLUMNS,
+                         ('id', 'patient_id', 'doctor_id', 'clinic_id', 'date_time', 'doctor_notes')),
+    'appointments': ImportKind(Appointment, COMMON_COLUMNS + ('procedure',),
+                               ('id', 'patient_id', 'doctor_id', 'clinic_id', 'procedure_id', 'date_time', 'date_booked')),
+}
+
+ImportProgress = namedtuple('ImportProgress', ['rows_done', 'imported', 'rejects'])
+
+
+class RowRejected(Exception):
+    pass
+
+
+class CheckpointMismatch(Exception):
+    pass
+
+
+def _aware(value, parse):
+    parsed = parse(value) if value else None
+    if parsed is None:
+        raise ValueError(value)
+    if isinstance(parsed, datetime) and timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+class Resolver:
+    """
+    Maps natural keys to primary keys, a batch at a time: doctors by NPI, patients by
+    name, date of birth and last 4 SSN digits, clinics and procedures by name.
+    """
+
+    def __init__(self):
+        self.clinics = self._by_name(Clinic)
+        self.procedures = self._by_name(Specialty)
+
+    @staticmethod
+    def _by_name(model):
+        names = {}
+        for pk, name in model.objects.values_list('pk', 'name'):
+            # A name shared by several rows cannot identify one of them
+            names[name] = None if name in names else pk
+        return names
+
+    def load(self, rows):
+        self.doctors = dict(Doctor.objects.filter(NPI__in={row.get('doctor_npi') for row in rows})
+                            .values_list('NPI', 'pk'))
+        self.patients = {}
+        patients = Patient.objects.filter(name__in={row.get('patient_name') for row in rows})
+        for pk, name, date_of_birth, last_4_ssn in patients.values_list('pk', 'name', 'date_of_birth', 'last_4_ssn'):
+            key = (name, date_of_birth, last_4_ssn)
+            self.patients[key] = None if key in self.patients else pk
+
+    def _lookup(self, mapping, key, label):
+        pk = mapping.get(key)
+        if pk is None:
+            raise RowRejected(f'{"Ambiguous" if key in mapping else "Unknown"} {label} {key!r}')
+        return pk
+
+    def resolve(self, kind, row):
+        missing = [column for column in IMPORT_KINDS[kind].required if not row.get(column)]
+        if missing:
+            raise RowRejected(f'Missing {", ".join(missing)}')
+        try:
+            record = {
+                'date_time': _aware(row['date_time'], parse_datetime),
+                'patient_key': (row['patient_name'], _aware(row['patient_date_of_birth'], parse_date),
+                                row['patient_last_4_ssn']),
+            }
+            if kind == 'appointments':
+                record['date_booked'] = _aware(row['date_booked'], parse_datetime) if row.get('date_booked') \
+                    else timezone.now()
+        except ValueError as error:
+            raise RowRejected(f'Invalid date {error}')
+
+        record['patient_id'] = self._lookup(self.patients, record.pop('patient_key'), 'patient')
+        record['doctor_id'] = self._lookup(self.doctors, row['doctor_npi'], 'doctor NPI')
+        record['clinic_id'] = self._lookup(self.clinics, row['clinic_name'], 'clinic')
+        if kind == 'visits':
+            record['doctor_notes'] = row.get('doctor_notes', '')
+            names = [name.strip() for name in row.get('procedures', '').split(';') if name.strip()]
+            record['procedures'] = {self._lookup(self.procedures, name, 'procedure') for name in names}
+        else:
+            record['procedure_id'] = self._lookup(self.procedures, row['procedure'], 'procedure')
+        return record
+
+
+def _reserve_ids(model, count):
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT nextval(pg_get_serial_sequence(%s, %s)) FROM generate_series(1, %s)',
+                       [model._meta.db_table, model._meta.pk.column, count])
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _copy_csv(rows):
+    r"""
+    The rows as CSV for COPY's psycopg2 path, with None written as \N. COPY reads a
+    bare empty field as NULL, which would fail on blank NOT NULL columns such as
+    doctor_notes.
+    """
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows([r'\N' if value is None else value for value in row] for row in rows)
+    buffer.seek(0)
+    return buffer
+
+
+def _copy(table, columns, rows):
+    """
+    Load rows with COPY ... FROM STDIN, through psycopg 3's copy() or psycopg2's copy_expert().
+    """
+    quote = connection.ops.quote_name
+    sql = f'COPY {quote(table)} ({", ".join(quote(column) for column in columns)}) FROM STDIN'
+    with connection.cursor() as cursor:
+        raw = cursor.cursor
+        if hasattr(raw, 'copy'):
+            with raw.copy(sql) as copy:
+                for row in rows:
+                    copy.write_row(row)
+        else:
+            raw.copy_expert(f"{sql} WITH (FORMAT csv, NULL '\\N')", _copy_csv(rows))
+
+
+def insert_records(kind, records):
+    """
+    Insert one batch of resolved records: COPY on PostgreSQL, bulk_create elsewhere.
+    """
+    model, _, columns = IMPORT_KINDS[kind]
+    through = Visit.procedures_done.through
+    if connection.vendor == 'postgresql':
+        for record, pk in zip(records, _reserve_ids(model, len(records))):
+            record['id'] = pk
+        _copy(model._meta.db_table, columns, ([record[column] for column in columns] for record in records))
+        if kind == 'visits':
+            _copy(through._meta.db_table, ('visit_id', 'specialty_id'),
+                  ([record['id'], procedure_id] for record in records for procedure_id in record['procedures']))
+        return
+
+    instances = model.objects.bulk_create(
+        [model(**{column: record[column] for column in columns if column != 'id'}) for record in records]
+    )
+    if kind == 'visits':
+        through.objects.bulk_create([
+            through(visit_id=instance.pk, specialty_id=procedure_id)
+            for instance, record in zip(instances, records) for procedure_id in record['procedures']
+        ])
+
+
+def import_history(kind, rows, key, file_size=0, batch_size=1000, restart=False):
+    """
+    Import visits or appointments from an iterable of CSV row dicts, ``batch_size`` rows
+    per transaction. The checkpoint under ``key`` is saved in the same transaction, so a
+    rerun after an interruption resumes after the last committed batch.
+
+    Yields an ImportProgress after each batch; rejects are (line number, reason) pairs
+    for rows that could not be resolved. Raises CheckpointMismatch when the file size
+    differs from the one the checkpoint was taken on, unless ``restart`` is set.
+    """
+    checkpoint, _ = ImportCheckpoint.objects.get_or_create(key=key, defaults={'file_size': file_size})
+    if checkpoint.rows_done and checkpoint.file_size != file_size and not restart:
+        raise CheckpointMismatch(f'{key} changed size since {checkpoint.rows_done} rows were imported from it')
+    if restart or checkpoint.file_size != file_size:
+        checkpoint.rows_done = 0
+        checkpoint.file_size = file_size
+        checkpoint.save()
+
+    resolver = Resolver()
+    rows_done = checkpoint.rows_done
+    rows = islice(iter(rows), rows_done, None)
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return
+        resolver.load(batch)
+        records, rejects = [], []
+        for line, row in enumerate(batch, start=rows_done + 2):
+            try:
+                records.append(resolver.resolve(kind, row))
+            except RowRejected as error:
+                rejects.append((line, str(error)))
+
+        rows_done += len(batch)
+        with transaction.atomic():
+            if records:
+                insert_records(kind, records)
+                if kind == 'appointments':
+                    # The inserts send no signals, so invalidate cached availability here
+                    bump_many(bookings_version_key(record['doctor_id'], day)
+                              for record in records for day in booking_days(record['date_time']))
+            ImportCheckpoint.objects.filter(pk=checkpoint.pk).update(rows_done=rows_done, updated_at=timezone.now())
+        yield ImportProgress(rows_done, len(records), rejects)
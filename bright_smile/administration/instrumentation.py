@@ -0,0 +1,81 @@
+import heapq
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.db import connections
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_LISTS = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_SPACES = re.compile(r'\s+')
+
+
+def fingerprint(sql):
+    """
+    The shape of a statement: literals and placeholders become ?, and IN lists of any
+    length collapse to (...), so the queries of an N+1 loop share one fingerprint.
+    """
+    sql = _LITERALS.sub('?', sql.replace('%s', '?'))
+    return _SPACES.sub(' ', _LISTS.sub('(...)', sql)).strip()
+
+
+class QueryRecorder:
+    """
+    Records every query run on the database connections of this thread while active:
+    the count, the total time, the ``slowest`` slowest statements and how often each
+    statement ran. Unlike connection.queries it works without DEBUG.
+
+        with QueryRecorder() as queries:
+            ...
+        queries.count, queries.seconds, queries.slowest_statements(), queries.repeated(5)
+    """
+
+    def __init__(self, slowest=5, using=None):
+        self.using = using
+        self.slowest = slowest
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = Counter()
+        self._slowest = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.count += 1
+            self.seconds += elapsed
+            self.statements[sql] += 1
+            if self.slowest:
+                entry = (elapsed, self.count, sql)
+                if len(self._slowest) < self.slowest:
+                    heapq.heappush(self._slowest, entry)
+                elif entry > self._slowest[0]:
+                    heapq.heapreplace(self._slowest, entry)
+
+    def __enter__(self):
+        self._stack = ExitStack()
+        aliases = [self.using] if self.using else [connection.alias for connection in connections.all()]
+        for alias in aliases:
+            self._stack.enter_context(connections[alias].execute_wrapper(self))
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stack.close()
+
+    def slowest_statements(self):
+        """
+        [(milliseconds, sql)], slowest first.
+        """
+        return [(elapsed * 1000, sql) for elapsed, _, sql in sorted(self._slowest, reverse=True)]
+
+    def repeated(self, threshold):
+        """
+        [(fingerprint, times run)] for the statements run at least ``threshold`` times, most repeated first.
+        """
+        fingerprints = Counter()
+        for sql, count in self.statements.items():
+            fingerprints[fingerprint(sql)] += count
+        return [(shape, count) for shape, count in fingerprints.most_common() if count >= threshold]
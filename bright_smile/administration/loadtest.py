@@ -0,0 +1,172 @@
+import asyncio
+import math
+import os
+import socket
+import subprocess
+import sys
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+
+from .benchmarks import ENDPOINTS, FLOWS
+
+# The endpoints served by async views, which the load test compares across servers
+ASYNC_ENDPOINTS = ['get_clinics', 'get_doctors', 'get_specialties', 'get_doctors_with_clinic_and_procedure',
+                   'get_doctor_schedule', 'get_available_slots', 'booking_bootstrap', 'booking_availability']
+
+# command(host, port, workers) starts the server from the project directory; env
+# overrides the settings that differ between them
+Server = namedtuple('Server', ['name', 'command', 'env'])
+
+SERVERS = [
+    Server('gunicorn', lambda host, port, workers: [
+        sys.executable, '-m', 'gunicorn', 'bright_smile.wsgi:application', '--worker-class', 'sync',
+        '--workers', str(workers), '--bind', f'{host}:{port}'], {}),
+    # Async views run their queries in a thread each, so connections are not kept open
+    Server('uvicorn', lambda host, port, workers: [
+        sys.executable, '-m', 'uvicorn', 'bright_smile.asgi:application', '--workers', str(workers),
+        '--host', host, '--port', str(port), '--no-access-log'], {'DB_CONN_MAX_AGE': '0'}),
+]
+
+LoadResult = namedtuple('LoadResult', ['server', 'endpoint', 'clients', 'requests', 'errors', 'seconds', 'rps',
+                                       'p50_ms', 'p99_ms'])
+
+# The wall time of whole booking flows, one request after the other, as a browser makes them
+FlowTiming = namedtuple('FlowTiming', ['server', 'flow', 'requests', 'runs', 'p50_ms', 'p99_ms'])
+
+
+def percentile(values, share):
+    """
+    Nearest-rank percentile, e.g. percentile(latencies, 0.99); None for no values.
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(math.ceil(share * len(ordered)) - 1, 0)]
+
+
+async def fetch(host, port, path, timeout=30):
+    """
+    GET ``path`` on a new connection and return the status code.
+    """
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    try:
+        writer.write(f'GET {path} HTTP/1.1\r\nHost: {host}\r\nConnection: close\r\n\r\n'.encode())
+        await writer.drain()
+        status_line = await asyncio.wait_for(reader.readline(), timeout)
+        await asyncio.wait_for(reader.read(), timeout)
+        return int(status_line.split()[1])
+    finally:
+        writer.close()
+
+
+async def _client(host, port, path, deadline, latencies):
+    errors = 0
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            status = await fetch(host, port, path)
+        except (OSError, asyncio.TimeoutError, ValueError, IndexError):
+            status = None
+        if status == 200:
+            latencies.append((time.perf_counter() - started) * 1000)
+        else:
+            errors += 1
+    return errors
+
+
+async def generate_load(host, port, path, clients=200, duration=10):
+    """
+    ``clients`` concurrent clients requesting ``path`` back to back for ``duration``
+    seconds; returns (latencies in ms of the 200 responses, errors, elapsed seconds).
+    """
+    latencies = []
+    started = time.perf_counter()
+    errors = await asyncio.gather(*[_client(host, port, path, started + duration, latencies)
+                                    for _ in range(clients)])
+    return latencies, sum(errors), time.perf_counter() - started
+
+
+async def time_flow(host, port, paths, runs=50):
+    """
+    Request ``paths`` in order ``runs`` times, each request on a new connection once
+    the previous one has been answered; returns the ms each run took.
+    """
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        for path in paths:
+            status = await fetch(host, port, path)
+            if status != 200:
+                raise RuntimeError(f'{path} returned {status}')
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def summarize(server, endpoint, clients, latencies, errors, seconds):
+    p50, p99 = percentile(latencies, 0.5), percentile(latencies, 0.99)
+    return LoadResult(server, endpoint, clients, len(latencies), errors, round(seconds, 2),
+                      round(len(latencies) / seconds, 1), p50 and round(p50, 2), p99 and round(p99, 2))
+
+
+def wait_for_port(host, port, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'The server exited with status {process.returncode}')
+        try:
+            socket.create_connection((host, port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'Nothing listening on {host}:{port} after {timeout}s')
+
+
+@contextmanager
+def serving(server, host, port, workers, cwd=None):
+    """
+    Run ``server`` against the configured database for the duration of the block.
+    """
+    env = dict(os.environ, SQL_INSTRUMENTATION_SAMPLE_RATE='0', **server.env)
+    process = subprocess.Popen(server.command(host, port, workers), cwd=cwd, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for_port(host, port, process)
+        yield
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def run_load_test(sample, servers=SERVERS, endpoints=ASYNC_ENDPOINTS, clients=200, duration=10, workers=4,
+                  host='127.0.0.1', port=8765, cwd=None):
+    """
+    Start each server in turn against the configured database and put every endpoint
+    under load; yields the LoadResult of each pair. The client runs in this process,
+    so give the servers fewer workers than there are cores.
+    """
+    urls = {endpoint.name: endpoint.url(sample) for endpoint in ENDPOINTS}
+    for server in servers:
+        with serving(server, host, port, workers, cwd):
+            for name in endpoints:
+                # A short warm-up loads each worker's capability index and connections
+                asyncio.run(generate_load(host, port, urls[name], clients, min(duration, 1)))
+                latencies, errors, seconds = asyncio.run(generate_load(host, port, urls[name], clients, duration))
+                yield summarize(server.name, name, clients, latencies, errors, seconds)
+
+
+def run_flow_test(sample, servers=SERVERS, flows=FLOWS, runs=50, workers=4, host='127.0.0.1', port=8765, cwd=None):
+    """
+    Start each server in turn and time every flow end to end, over HTTP with no other
+    load; yields the FlowTiming of each pair. Unlike the sums of run_benchmarks, the
+    timings include connecting, the server and the middleware.
+    """
+    urls = {endpoint.name: endpoint.url(sample) for endpoint in ENDPOINTS}
+    for server in servers:
+        with serving(server, host, port, workers, cwd):
+            for flow in flows:
+                paths = [urls[name] for name in flow.endpoints]
+                asyncio.run(time_flow(host, port, paths, runs=1))
+                timings = asyncio.run(time_flow(host, port, paths, runs))
+                yield FlowTiming(server.name, flow.name, len(paths), runs, round(percentile(timings, 0.5), 2),
+                                 round(percentile(timings, 0.99), 2))
@@ -0,0 +1,65 @@
+import csv
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...importer import CheckpointMismatch, IMPORT_KINDS, import_history
+from ...rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Import historical visits or appointments from a CSV file, resuming where an earlier run stopped'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV file with a header row')
+        parser.add_argument('--kind', choices=sorted(IMPORT_KINDS), required=True)
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows inserted per transaction')
+        parser.add_argument('--restart', action='store_true', help='Ignore the saved checkpoint and start from the first row')
+        parser.add_argument('--rejects', help='Write rows that could not be imported to this CSV file')
+        parser.add_argument('--skip-rollups', action='store_true',
+                            help='Do not rebuild the rollups afterwards (run rebuild_rollups yourself)')
+
+    def handle(self, *args, **options):
+        path, kind = os.path.abspath(options['path']), options['kind']
+        if not os.path.exists(path):
+            raise CommandError(f'{path} does not exist.')
+
+        with open(path, newline='', encoding='utf-8-sig') as source:
+            reader = csv.DictReader(source)
+            missing = set(IMPORT_KINDS[kind].required) - set(reader.fieldnames or ())
+            if missing:
+                raise CommandError(f'{path} has no {", ".join(sorted(missing))} column.')
+
+            rejects_file = open(options['rejects'], 'a', newline='') if options['rejects'] else None
+            rejects_writer = csv.writer(rejects_file) if rejects_file else None
+            started, imported, rejected, first_row = time.perf_counter(), 0, 0, None
+            try:
+                for progress in import_history(kind, reader, key=f'{kind}:{path}', file_size=os.path.getsize(path),
+                                               batch_size=options['batch_size'], restart=options['restart']):
+                    if first_row is None:
+                        first_row = progress.rows_done - progress.imported - len(progress.rejects)
+                    imported += progress.imported
+                    rejected += len(progress.rejects)
+                    for line, reason in progress.rejects:
+                        if rejects_writer:
+                            rejects_writer.writerow([line, reason])
+                        elif rejected <= 20:
+                            self.stderr.write(f'Line {line}: {reason}')
+                    rate = (progress.rows_done - first_row) / (time.perf_counter() - started)
+                    self.stdout.write(f'{progress.rows_done} rows done ({imported} imported, {rejected} rejected), {rate:.0f} rows/s')
+            except CheckpointMismatch as error:
+                raise CommandError(f'{error}. Pass --restart to import it from the start.')
+            finally:
+                if rejects_file:
+                    rejects_file.close()
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {imported} {kind} ({rejected} rejected) in {elapsed:.1f}s, '
+            f'{(imported + rejected) / elapsed if elapsed else 0:.0f} rows/s.'
+        ))
+        if imported and not options['skip_rollups']:
+            # The bulk inserts bypass the signals that keep the rollups current
+            for name, done in rebuild_rollups():
+                self.stdout.write(f'Rebuilt {name}: {done}')
@@ -0,0 +1,55 @@
+import json
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ...benchmarks import pick_sample
+from ...loadtest import ASYNC_ENDPOINTS, SERVERS, run_flow_test, run_load_test
+
+
+class Command(BaseCommand):
+    help = ('Compare requests/sec and p99 latency of the async JSON endpoints under gunicorn sync workers '
+            'and under uvicorn, against the configured (seeded) database')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--server', action='append', choices=[server.name for server in SERVERS],
+                            help='Only run these servers (repeatable)')
+        parser.add_argument('--endpoint', action='append', choices=ASYNC_ENDPOINTS,
+                            help='Only load these endpoints (repeatable)')
+        parser.add_argument('--clients', type=int, default=200, help='Concurrent clients')
+        parser.add_argument('--duration', type=float, default=10, help='Seconds of load per endpoint')
+        parser.add_argument('--workers', type=int, default=max((os.cpu_count() or 2) // 2, 1),
+                            help='Server worker processes (default half the cores; the client needs the rest)')
+        parser.add_argument('--flow-runs', type=int, default=50,
+                            help='Times to run each booking flow end to end per server, 0 to skip')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--output', help='Write the results to this JSON file')
+
+    def handle(self, *args, **options):
+        sample = pick_sample()
+        if sample['procedure_id'] is None:
+            raise CommandError('The database has no doctors with schedules; run seed_data first.')
+
+        servers = [server for server in SERVERS if not options['server'] or server.name in options['server']]
+        results = []
+        for result in run_load_test(sample, servers, options['endpoint'] or ASYNC_ENDPOINTS, options['clients'],
+                                    options['duration'], options['workers'], port=options['port'],
+                                    cwd=settings.BASE_DIR):
+            self.stdout.write(f'{result.server:<9} {result.endpoint:<38} {result.rps:>8.1f} req/s '
+                              f'{result.p50_ms or 0:>8.2f}ms p50 {result.p99_ms or 0:>8.2f}ms p99 '
+                              f'{result.errors:>5} errors')
+            results.append(result)
+
+        flows = []
+        if options['flow_runs'] > 0:
+            for flow in run_flow_test(sample, servers, runs=options['flow_runs'], workers=options['workers'],
+                                      port=options['port'], cwd=settings.BASE_DIR):
+                self.stdout.write(f'{flow.server:<9} {flow.flow:<18} {flow.requests} requests '
+                                  f'{flow.p50_ms:>8.2f}ms p50 {flow.p99_ms:>8.2f}ms p99')
+                flows.append(flow)
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump({'sample': sample, 'results': [result._asdict() for result in results],
+                           'flows': [flow._asdict() for flow in flows]}, output, indent=2)
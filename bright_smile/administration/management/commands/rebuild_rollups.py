@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ...rollups import expire_rollups, rebuild_rollups, verify_rollups
+
+
+class Command(BaseCommand):
+    help = 'Recompute the patient-relationship rollups from scratch and verify them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help='Number of doctors, clinics or patients rebuilt per transaction')
+        parser.add_argument('--expire', action='store_true',
+                            help='Only expire links and pointers for appointments that have passed (cheap, run periodically)')
+        parser.add_argument('--verify-only', action='store_true',
+                            help='Compare stored rollups with the source tables without rebuilding')
+
+    def handle(self, *args, **options):
+        if options['expire']:
+            expired = expire_rollups()
+            self.stdout.write(self.style.SUCCESS(f'Expired {expired} rollup rows.'))
+            return
+
+        if not options['verify_only']:
+            for name, done in rebuild_rollups(chunk_size=options['chunk_size']):
+                self.stdout.write(f'Rebuilt {name}: {done}')
+
+        mismatches = verify_rollups()
+        for name, pk, expected, stored in mismatches[:20]:
+            self.stderr.write(f'{name} {pk}: expected {expected}, stored {stored}')
+        if mismatches:
+            raise CommandError(f'{len(mismatches)} rollups do not match the source tables.')
+        self.stdout.write(self.style.SUCCESS('Rollups are consistent.'))
@@ -0,0 +1,44 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ...profiling import call_tree, load_profile, profile_ids
+
+
+class Command(BaseCommand):
+    help = 'List the request profiles saved by ProfilerMiddleware, or summarize one of them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('profile_id', nargs='?', help='Summarize this profile ("latest" for the newest)')
+        parser.add_argument('--limit', type=int, default=20, help='Profiles listed, or hot frames shown')
+        parser.add_argument('--min-share', type=float, default=2.0,
+                            help='Leave call tree branches under this percentage of the samples out')
+
+    def handle(self, *args, **options):
+        ids = profile_ids()
+        if not options['profile_id']:
+            if not ids:
+                self.stdout.write(f'No profiles in {settings.PROFILE_DIR}.')
+            for profile_id in ids[:options['limit']]:
+                summary, _ = load_profile(profile_id)
+                self.stdout.write(f'{profile_id}  {summary["method"]} {summary["path"]} {summary["status_code"]}  '
+                                  f'{summary["seconds"] * 1000:.0f}ms  {summary["samples"]} samples  {summary["user"]}')
+            return
+
+        profile_id = ids[0] if options['profile_id'] == 'latest' and ids else options['profile_id']
+        try:
+            summary, stacks = load_profile(profile_id)
+        except FileNotFoundError:
+            raise CommandError(f'No profile {profile_id} in {settings.PROFILE_DIR}')
+
+        self.stdout.write(f'{summary["method"]} {summary["path"]} {summary["status_code"]} by {summary["user"]} '
+                          f'at {summary["created"]}')
+        self.stdout.write(f'{summary["seconds"] * 1000:.0f}ms, {summary["samples"]} samples every '
+                          f'{summary["interval"] * 1000:g}ms')
+        for title, frames in (('Self', summary['own']), ('Total', summary['total'])):
+            self.stdout.write(f'\n{title} samples:')
+            for frame, count in frames[:options['limit']]:
+                self.stdout.write(f'  {count:>6} {frame}')
+        self.stdout.write('\nCall tree:')
+        for line in call_tree(stacks, options['min_share'] / 100):
+            self.stdout.write(f'  {line}')
+        self.stdout.write(f'\nFlame graph input: {settings.PROFILE_DIR}/{profile_id}.folded')
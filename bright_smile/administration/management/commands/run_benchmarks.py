@@ -0,0 +1,64 @@
+import json
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from ...benchmarks import ENDPOINTS, check_budgets, compare_flows, run_benchmarks
+
+
+class Command(BaseCommand):
+    help = ('Benchmark the hot endpoints against seeded datasets in a throwaway test database, '
+            'failing on blown query or latency budgets and on query counts that grow with the data')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scales', type=lambda value: [int(scale) for scale in value.split(',')],
+                            default=[1, 10, 100], help='Comma-separated dataset scales (default 1,10,100)')
+        parser.add_argument('--repeat', type=int, default=5, help='Timed requests per endpoint')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--endpoint', action='append', choices=[endpoint.name for endpoint in ENDPOINTS],
+                            help='Only benchmark these endpoints (repeatable)')
+        parser.add_argument('--output', help='Write the results and violations to this JSON file')
+
+    def handle(self, *args, **options):
+        endpoints = [endpoint for endpoint in ENDPOINTS
+                     if not options['endpoint'] or endpoint.name in options['endpoint']]
+        old_name = connection.settings_dict['NAME']
+        setup_test_environment()
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            measurements = []
+            for scale, results in run_benchmarks(options['scales'], options['repeat'], options['seed'],
+                                                 reset=lambda: call_command('flush', interactive=False, verbosity=0),
+                                                 endpoints=endpoints):
+                self.stdout.write(f'{scale}x')
+                for result in results:
+                    self.stdout.write(f'  {result.endpoint:<38} {result.status} {result.queries:>3} queries '
+                                      f'{result.sql_ms:>8.2f}ms sql {result.median_ms:>8.2f}ms median '
+                                      f'{result.max_ms:>8.2f}ms max {result.cold_queries:>3} queries '
+                                      f'{result.cold_ms:>8.2f}ms cold')
+                measurements += results
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        flows = compare_flows(measurements)
+        for flow in flows:
+            self.stdout.write(f'{flow.scale}x {flow.flow:<18} {flow.requests} requests {flow.queries:>3} queries '
+                              f'{flow.total_ms:>8.2f}ms in process')
+
+        violations = check_budgets(measurements, endpoints)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump({
+                    'budgets': {endpoint.name: {'max_queries': endpoint.max_queries, 'max_ms': endpoint.max_ms,
+                                                'max_cold_queries': endpoint.max_cold_queries}
+                                for endpoint in endpoints},
+                    'results': [result._asdict() for result in measurements],
+                    'flows': [flow._asdict() for flow in flows],
+                    'violations': violations,
+                }, output, indent=2)
+        if violations:
+            raise CommandError('\n'.join(['Benchmark budgets exceeded:'] + violations))
+        self.stdout.write(self.style.SUCCESS('All endpoints within budget.'))
@@ -0,0 +1,34 @@
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+
+from ...synthetic import BASE_SIZE, dataset_size, generate_dataset
+
+
+class Command(BaseCommand):
+    help = 'Populate the database with a deterministic synthetic dataset for load and scale testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=int, default=1,
+                            help='Multiply the base counts ({})'.format(
+                                ', '.join(f'{value} {name}' for name, value in BASE_SIZE.items())))
+        for name in BASE_SIZE:
+            parser.add_argument(f'--{name.replace("_", "-")}', type=int, help=f'Override the number of {name.replace("_", " ")}')
+        parser.add_argument('--years', type=int, default=3, help='Years of visit history')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--today', type=lambda value: datetime.strptime(value, '%Y-%m-%d').date(),
+                            help='Date the history ends and the appointments start (YYYY-MM-DD, default today)')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        size = dataset_size(options['scale'])
+        size.update({name: options[name] for name in BASE_SIZE if options[name] is not None})
+        self.stdout.write('Generating ' + ', '.join(f'{value} {name}' for name, value in size.items()))
+
+        started = time.perf_counter()
+        for name, done in generate_dataset(**size, years=options['years'], seed=options['seed'],
+                                           batch_size=options['batch_size'], today=options['today']):
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f'{elapsed:8.1f}s  {name}: {done}')
+        self.stdout.write(self.style.SUCCESS(f'Done in {time.perf_counter() - started:.1f}s.'))
@@ -0,0 +1,144 @@
+import logging
+import random
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+
+from .instrumentation import QueryRecorder
+from .profiling import StackSampler, save_profile
+
+logger = logging.getLogger('administration.sql')
+
+
+class AsyncCapableMiddleware:
+    """
+    Base for middleware that runs natively under both WSGI and ASGI: ``__call__``
+    serves sync chains and ``__acall__`` async ones, so async views are not pushed
+    into a thread by this layer.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return self.call(request)
+
+
+class QueryInstrumentationMiddleware(AsyncCapableMiddleware):
+    """
+    Records the SQL run by a sample of requests (SQL_INSTRUMENTATION_SAMPLE_RATE) and
+    reports it in a Server-Timing header and on the ``administration.sql`` logger:
+
+        Server-Timing: db;dur=4.12;desc="9 queries", app;dur=38.50
+
+    Requests that repeat a statement SQL_INSTRUMENTATION_REPEAT_THRESHOLD times or
+    more (an N+1 loop) or that run longer than SQL_INSTRUMENTATION_SLOW_MS are logged
+    as warnings, with the repeated fingerprints and the slowest statements. Requests
+    outside the sample are passed through untouched.
+
+    Queries run while a streaming response is consumed come after the header is sent,
+    so they are not counted.
+    """
+
+    def call(self, request):
+        if random.random() >= settings.SQL_INSTRUMENTATION_SAMPLE_RATE:
+            return self.get_response(request)
+
+        started = time.perf_counter()
+        with QueryRecorder(slowest=settings.SQL_INSTRUMENTATION_SLOWEST) as queries:
+            response = self.get_response(request)
+        return self.report(request, response, queries, started)
+
+    async def __acall__(self, request):
+        if random.random() >= settings.SQL_INSTRUMENTATION_SAMPLE_RATE:
+            return await self.get_response(request)
+
+        started = time.perf_counter()
+        # The async ORM runs a request's queries on its own worker thread, whose connections are the ones to wrap
+        queries = QueryRecorder(slowest=settings.SQL_INSTRUMENTATION_SLOWEST)
+        await sync_to_async(queries.__enter__)()
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(queries.__exit__)(None, None, None)
+        return self.report(request, response, queries, started)
+
+    def report(self, request, response, queries, started):
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        timings = [f'db;dur={queries.seconds * 1000:.2f};desc="{queries.count} queries"', f'app;dur={elapsed_ms:.2f}']
+        if response.has_header('Server-Timing'):
+            timings.insert(0, response['Server-Timing'])
+        response['Server-Timing'] = ', '.join(timings)
+
+        self.log(request, response, queries, elapsed_ms)
+        return response
+
+    def log(self, request, response, queries, elapsed_ms):
+        repeated = queries.repeated(settings.SQL_INSTRUMENTATION_REPEAT_THRESHOLD)
+        slow = elapsed_ms >= settings.SQL_INSTRUMENTATION_SLOW_MS
+        level = logging.WARNING if repeated or slow else logging.INFO
+        if not logger.isEnabledFor(level):
+            return
+
+        lines = [f'{request.method} {request.path} {response.status_code}: {queries.count} queries in '
+                 f'{queries.seconds * 1000:.2f}ms, {elapsed_ms:.2f}ms total']
+        lines += [f'  repeated {count}x: {shape}' for shape, count in repeated]
+        if level == logging.WARNING:
+            lines += [f'  slow {ms:.2f}ms: {sql}' for ms, sql in queries.slowest_statements()]
+        logger.log(level, '\n'.join(lines), extra={
+            'path': request.path,
+            'status_code': response.status_code,
+            'query_count': queries.count,
+            'db_ms': round(queries.seconds * 1000, 2),
+            'total_ms': round(elapsed_ms, 2),
+            'repeated': repeated,
+        })
+
+
+class ProfilerMiddleware(AsyncCapableMiddleware):
+    """
+    Profiles a single request when a staff user asks for it with an ``X-Profile: 1``
+    header or a ``?profile=1`` query parameter. A stack sampler runs alongside the
+    request, and the result is saved to PROFILE_DIR as a folded stack dump (for
+    flamegraph.pl or speedscope) with a summary; the response carries the profile id
+    in an X-Profile-Id header. See the ``request_profiles`` command.
+
+    Must come after AuthenticationMiddleware. Everyone else's requests are passed
+    through untouched.
+    """
+
+    def wanted(self, request):
+        return request.headers.get('X-Profile') == '1' or request.GET.get('profile') == '1'
+
+    def save(self, request, user, response, sampler):
+        response['X-Profile-Id'] = save_profile(
+            sampler, method=request.method, path=request.get_full_path(), user=user.get_username(),
+            status_code=response.status_code,
+        )
+        return response
+
+    def call(self, request):
+        if not (self.wanted(request) and request.user.is_active and request.user.is_staff):
+            return self.get_response(request)
+
+        with StackSampler(interval=settings.PROFILE_INTERVAL_MS / 1000) as sampler:
+            response = self.get_response(request)
+        return self.save(request, request.user, response, sampler)
+
+    async def __acall__(self, request):
+        user = await request.auser() if self.wanted(request) else None
+        if not (user and user.is_active and user.is_staff):
+            return await self.get_response(request)
+
+        # Samples the event loop's thread; ORM calls show up as the awaits that wait on them
+        with StackSampler(interval=settings.PROFILE_INTERVAL_MS / 1000) as sampler:
+            response = await self.get_response(request)
+        return self.save(request, user, response, sampler)
@@ -46,6 +46,11 @@ class DoctorClinicAffiliation(models.Model):
     clinic = models.ForeignKey(Clinic, on_delete=models.CASCADE)
     office_address = models.TextField()
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['doctor', 'clinic'], name='unique_doctor_clinic_affiliation'),
+        ]
+
     def __str__(self):
         return f'{self.doctor.name} at {self.clinic.name}'
     
@@ -60,6 +65,9 @@ class DoctorSchedule(models.Model):
     start_time = models.TimeField()
     end_time = models.TimeField()
 
+    class Meta:
+        indexes = [models.Index(fields=['affiliation', 'day_of_week'])]
+
     def __str__(self):
         return f'{self.get_day_of_week_display()} ({self.start_time} - {self.end_time})'
     
@@ -79,6 +87,10 @@ class Patient(models.Model):
     gender = models.CharField(max_length=10)
     address = models.TextField()
 
+    class Meta:
+        # Patients are looked up by name and date of birth (API filters, history imports)
+        indexes = [models.Index(fields=['name', 'date_of_birth'])]
+
     def __str__(self):
         return self.name
 
@@ -96,6 +108,9 @@ class Visit(models.Model):
     procedures_done = models.ManyToManyField(Specialty)  # Procedures done during the visit
     doctor_notes = models.TextField(blank=True)  # Notes from the doctor
 
+    class Meta:
+        indexes = [models.Index(fields=['patient', 'date_time'])]
+
     def __str__(self):
         return f'Visit on {self.date_time} by {self.doctor}'
 
@@ -107,5 +122,77 @@ class Appointment(models.Model):
     date_time = models.DateTimeField()  # Date and Time of the appointment
     date_booked = models.DateTimeField(default=timezone.now)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['doctor', 'clinic', 'date_time']),
+            models.Index(fields=['patient', 'date_time']),
+        ]
+
     def __str__(self):
         return f'Appointment on {self.date_time} with {self.doctor}'
+
+
+# Denormalized patient-relationship rollups, maintained by administration.rollups
+class DoctorPatientLink(models.Model):
+    """
+    A patient counted for a doctor: any visit, or an appointment that has not passed yet.
+    """
+    doctor = models.ForeignKey(Doctor, related_name='patient_links', on_delete=models.CASCADE)
+    patient = models.ForeignKey(Patient, related_name='doctor_links', on_delete=models.CASCADE)
+    has_visit = models.BooleanField(default=False)
+    last_appointment_at = models.DateTimeField(null=True, blank=True)
+    is_active = models.BooleanField(default=False)
+
+    class Meta:
+        unique_together = ('doctor', 'patient')
+        indexes = [models.Index(fields=['is_active', 'has_visit', 'last_appointment_at'])]
+
+class ClinicPatientLink(models.Model):
+    """
+    A patient counted for a clinic, through doctors affiliated with that clinic.
+    """
+    clinic = models.ForeignKey(Clinic, related_name='patient_links', on_delete=models.CASCADE)
+    patient = models.ForeignKey(Patient, related_name='clinic_links', on_delete=models.CASCADE)
+    has_visit = models.BooleanField(default=False)
+    last_appointment_at = models.DateTimeField(null=True, blank=True)
+    is_active = models.BooleanField(default=False)
+
+    class Meta:
+        unique_together = ('clinic', 'patient')
+        indexes = [models.Index(fields=['is_active', 'has_visit', 'last_appointment_at'])]
+
+class DoctorRollup(models.Model):
+    doctor = models.OneToOneField(Doctor, related_name='rollup', on_delete=models.CASCADE)
+    clinic_count = models.PositiveIntegerField(default=0)
+    patient_count = models.PositiveIntegerField(default=0)
+
+class ClinicRollup(models.Model):
+    clinic = models.OneToOneField(Clinic, related_name='rollup', on_delete=models.CASCADE)
+    doctor_count = models.PositiveIntegerField(default=0)
+    patient_count = models.PositiveIntegerField(default=0)
+
+class PatientRollup(models.Model):
+    patient = models.OneToOneField(Patient, related_name='rollup', on_delete=models.CASCADE)
+    last_visit = models.ForeignKey(Visit, related_name='+', null=True, blank=True, on_delete=models.SET_NULL)
+    next_appointment = models.ForeignKey(Appointment, related_name='+', null=True, blank=True, on_delete=models.SET_NULL)
+
+
+# Version stamps for cached data, bumped in the same transaction as the write they describe
+class ChangeCounter(models.Model):
+    key = models.CharField(max_length=100, unique=True)
+    value = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f'{self.key} v{self.value}'
+
+
+# Progress of a resumable bulk import, saved in the same transaction as each batch
+class ImportCheckpoint(models.Model):
+    key = models.CharField(max_length=255, unique=True)
+    rows_done = models.PositiveBigIntegerField(default=0)
+    file_size = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.key}: {self.rows_done} rows'
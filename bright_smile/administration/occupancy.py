@@ -0,0 +1,146 @@
+from collections import namedtuple
+from datetime import datetime, timedelta
+from math import ceil, floor
+
+from django.utils import timezone
+
+# A doctor's day is a bitmap held in a plain int: bit i stands for the 5-minute
+# slot starting i * 5 minutes after local midnight. Masks of different days,
+# doctors or clinics combine with &, | and ~, and a whole day pickles to a few bytes.
+GRANULARITY = timedelta(minutes=5)
+BITS_PER_DAY = int(timedelta(days=1) / GRANULARITY)
+FULL_DAY = (1 << BITS_PER_DAY) - 1
+_MINUTES = GRANULARITY.total_seconds() / 60
+
+
+def span(first, last):
+    """
+    Mask with bits first..last-1 set.
+    """
+    if last <= first:
+        return 0
+    return ((1 << last) - 1) ^ ((1 << first) - 1)
+
+
+def to_bits(duration):
+    return ceil(duration / GRANULARITY)
+
+
+def contiguous(mask, bits):
+    """
+    Bits of ``mask`` that start a run of at least ``bits`` set bits,
+    e.g. contiguous(free, to_bits(timedelta(minutes=45))) for 45 free minutes.
+    """
+    run, covered = mask, 1
+    while covered < bits and run:
+        step = min(covered, bits - covered)
+        run &= run >> step
+        covered += step
+    return run
+
+
+def _minutes(value):
+    return value.hour * 60 + value.minute + value.second / 60 + value.microsecond / 60_000_000
+
+
+def _local_minutes(moment, day):
+    """
+    Minutes from local midnight of ``day`` to ``moment``, clipped to that day.
+    """
+    local = timezone.localtime(moment)
+    if local.date() != day:
+        return 0 if local.date() < day else 24 * 60
+    return _minutes(local)
+
+
+def bit_time(day, index):
+    return timezone.make_aware(datetime.combine(day, datetime.min.time()) + index * GRANULARITY)
+
+
+def set_bits(mask):
+    """
+    Indexes of the set bits of ``mask``, lowest first.
+    """
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+class DayOccupancy(namedtuple('DayOccupancy', ['day', 'working', 'booked', 'starts'])):
+    """
+    One doctor's day at one clinic:
+    ``working``  the clinic's opening hours for the doctor, rounded inwards to the grid
+    ``booked``   the doctor's appointments at any clinic, rounded outwards
+    ``starts``   the bits where an appointment can start and fit, free, inside its window
+    """
+    __slots__ = ()
+
+    @classmethod
+    def build(cls, day, hours, bookings, duration):
+        """
+        ``hours`` is the day's [(start_time, end_time)] and ``bookings`` the sorted
+        appointment start times overlapping the day, each lasting ``duration``.
+        """
+        length = to_bits(duration)
+        working = grid = 0
+        for start_time, end_time in hours:
+            first, last = ceil(_minutes(start_time) / _MINUTES), floor(_minutes(end_time) / _MINUTES)
+            working |= span(first, last)
+            # Appointments run back to back from the start of each window
+            for start in range(first, last - length + 1, length):
+                grid |= 1 << start
+
+        booked = 0
+        for booking in bookings:
+            first = floor(_local_minutes(booking, day) / _MINUTES)
+            last = ceil(_local_minutes(booking + duration, day) / _MINUTES)
+            booked |= span(first, last)
+
+        return cls(day, working, booked, grid & contiguous(working & ~booked & FULL_DAY, length))
+
+    @property
+    def free(self):
+        return self.working & ~self.booked & FULL_DAY
+
+    def is_start(self, moment):
+        """
+        Whether an appointment can be booked at ``moment``.
+        """
+        local = timezone.localtime(moment)
+        if local.date() != self.day:
+            return False
+        index, remainder = divmod(_minutes(local), _MINUTES)
+        return not remainder and bool(self.starts >> int(index) & 1)
+
+    def slot_times(self, not_before=None):
+        starts = self.starts
+        if not_before is not None:
+            starts &= ~span(0, ceil(_local_minutes(not_before, self.day) / _MINUTES))
+        return [bit_time(self.day, index) for index in set_bits(starts)]
+
+    def slot_labels(self, not_before=None):
+        """
+        slot_times() as local "HH:MM" strings, without building a datetime per slot.
+        """
+        starts = self.starts
+        if not_before is not None:
+            starts &= ~span(0, ceil(_local_minutes(not_before, self.day) / _MINUTES))
+        return ['%02d:%02d' % divmod(int(index * _MINUTES), 60) for index in set_bits(starts)]
+
+
+def common_free(occupancies):
+    """
+    Grid slots free for every one of the given doctor-days, e.g. all doctors at a clinic.
+    """
+    mask = FULL_DAY
+    for occupancy in occupancies:
+        mask &= occupancy.free
+    return mask
+
+
+def any_free(occupancies):
+    mask = 0
+    for occupancy in occupancies:
+        mask |= occupancy.free
+    return mask
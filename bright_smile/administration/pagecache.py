@@ -0,0 +1,99 @@
+import hashlib
+import logging
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from .caching import cache_stats, get_stamps, table_version_key
+
+logger = logging.getLogger(__name__)
+
+# The stamps are those read before the content was rendered
+CachedPage = namedtuple('CachedPage', ['content', 'stamps', 'rendered_at'])
+
+
+class RevalidatingResponse(HttpResponse):
+    """
+    A response that calls ``revalidate`` once it has been sent, in the worker that
+    served it and before the request's database connections are released.
+    """
+
+    def __init__(self, *args, revalidate=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.revalidate = revalidate
+
+    def close(self):
+        revalidate, self.revalidate = self.revalidate, None
+        try:
+            if revalidate is not None:
+                revalidate()
+        except Exception:
+            logger.exception('Refreshing a stale page failed')
+        finally:
+            super().close()
+
+
+class StaleWhileRevalidateMixin:
+    """
+    View mixin that caches the rendered ``template_name`` per URL for
+    PAGE_CACHE_TIMEOUT seconds and wraps it in ``page_template_name``, which adds
+    the per-user layout, on every request.
+
+    A cached page is stale once one of the whole-table stamps of
+    ``page_version_models`` has moved or PAGE_CACHE_MAX_AGE seconds have passed, for
+    counts that change without a stamp. A stale page is still served, and the first
+    request to see it re-renders it after its response has been sent, so nobody waits
+    on a render after a write. Only a URL that was never cached is rendered in line.
+    """
+    page_template_name = 'administration/cached_page.html'
+    page_version_models = ()
+
+    def page_cache_key(self):
+        return 'pages:' + hashlib.sha1(self.request.get_full_path().encode()).hexdigest()
+
+    def render_page(self, stamps):
+        page = CachedPage(super().get(self.request, *self.args, **self.kwargs).rendered_content, stamps, time.time())
+        cache.set(self.page_cache_key(), page, settings.PAGE_CACHE_TIMEOUT)
+        return page
+
+    def refresh_page(self):
+        key = self.page_cache_key()
+        try:
+            self.render_page(get_stamps(table_version_key(model) for model in self.page_version_models))
+        finally:
+            cache.delete(f'{key}:refreshing')
+
+    def get(self, request, *args, **kwargs):
+        if settings.PAGE_CACHE_TIMEOUT <= 0:
+            return self.wrap(super().get(request, *args, **kwargs).rendered_content)
+
+        key = self.page_cache_key()
+        stamps = get_stamps(table_version_key(model) for model in self.page_version_models)
+        page, revalidate = cache.get(key), None
+        if page is None:
+            cache_stats.record('pages', misses=1)
+            page, state = self.render_page(stamps), 'miss'
+        elif page.stamps != stamps or time.time() - page.rendered_at > settings.PAGE_CACHE_MAX_AGE:
+            cache_stats.record('pages', hits=1, stale=1)
+            state = 'stale'
+            # One refresh at a time per page, across the workers sharing the cache
+            if cache.add(f'{key}:refreshing', True, 60):
+                revalidate = self.refresh_page
+        else:
+            cache_stats.record('pages', hits=1)
+            state = 'hit'
+
+        response = self.wrap(page.content, revalidate)
+        response['Server-Timing'] = f'page-cache;desc="{state}"'
+        return response
+
+    def wrap(self, content, revalidate=None):
+        return RevalidatingResponse(
+            render_to_string(self.page_template_name, {'page_content': mark_safe(content)}, self.request),
+            revalidate=revalidate,
+        )
@@ -0,0 +1,192 @@
+import base64
+import binascii
+import json
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Q
+from django.http import Http404
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+
+
+def estimated_count(queryset):
+    """
+    Row count of a queryset as estimated by the PostgreSQL planner.
+    Falls back to an exact COUNT(*) on other databases.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return queryset.count()
+
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def encode_cursor(values, reverse=False):
+    payload = json.dumps({'k': list(values), 'r': reverse}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return list(payload['k']), bool(payload['r'])
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise Http404('Invalid cursor.')
+
+
+class KeysetPage:
+    """
+    One page of a KeysetPaginator. Mirrors the parts of Django's Page used by templates.
+    """
+
+    def __init__(self, object_list, paginator, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """
+    Cursor pagination over a stable ordering key.
+
+    Each page is fetched with a ``WHERE key > last_key ORDER BY key LIMIT n`` query,
+    so deep pages cost the same as the first one. Ordering fields must be model
+    fields whose values are JSON serialisable, and the last one must be unique.
+    """
+
+    def __init__(self, queryset, per_page, ordering=('pk',), estimate_count=True):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = tuple(ordering)
+        self.estimate_count = estimate_count
+        self._count = None
+
+    @property
+    def count(self):
+        if self._count is None:
+            self._count = estimated_count(self.queryset) if self.estimate_count else self.queryset.count()
+        return self._count
+
+    def _key(self, obj):
+        return [getattr(obj, field.lstrip('-')) for field in self.ordering]
+
+    def _position_filter(self, values, reverse):
+        """
+        Lexicographic "after these key values" filter: (a > x) OR (a = x AND b > y) ...
+        """
+        position = Q()
+        for index, field in enumerate(self.ordering):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') != reverse else 'gt'
+            clause = Q(**{f'{name}__{lookup}': values[index]})
+            for previous_field, value in zip(self.ordering[:index], values[:index]):
+                clause &= Q(**{previous_field.lstrip('-'): value})
+            position |= clause
+        return position
+
+    def get_page(self, cursor=None):
+        queryset = self.queryset
+        reverse = False
+        if cursor:
+            values, reverse = decode_cursor(cursor)
+            if len(values) != len(self.ordering):
+                raise Http404('Invalid cursor.')
+            queryset = queryset.filter(self._position_filter(values, reverse))
+
+        ordering = self.ordering
+        if reverse:
+            ordering = tuple(field[1:] if field.startswith('-') else '-' + field for field in ordering)
+
+        rows = list(queryset.order_by(*ordering)[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if reverse:
+            rows.reverse()
+
+        next_cursor = previous_cursor = None
+        if rows:
+            # Going forward there is a next page if we over-fetched; going back we came from one
+            if has_more or (cursor and reverse):
+                next_cursor = encode_cursor(self._key(rows[-1]))
+            if (has_more and reverse) or (cursor and not reverse):
+                previous_cursor = encode_cursor(self._key(rows[0]), reverse=True)
+        return KeysetPage(rows, self, next_cursor, previous_cursor)
+
+
+class KeysetPaginationMixin:
+    """
+    ListView mixin that replaces OFFSET pagination with KeysetPaginator.
+
+    The page size can be overridden per request with ``?page_size=`` up to ``max_paginate_by``.
+    """
+    paginate_by = settings.LIST_PAGE_SIZE
+    max_paginate_by = settings.LIST_MAX_PAGE_SIZE
+    keyset_ordering = ('pk',)
+    estimate_count = True
+    cursor_kwarg = 'cursor'
+
+    def get_paginate_by(self, queryset):
+        try:
+            page_size = int(self.request.GET.get('page_size', self.paginate_by))
+        except ValueError:
+            page_size = self.paginate_by
+        return max(1, min(page_size, self.max_paginate_by))
+
+    def paginate_queryset(self, queryset, page_size):
+        paginator = KeysetPaginator(queryset, page_size, self.keyset_ordering, self.estimate_count)
+        page = paginator.get_page(self.request.GET.get(self.cursor_kwarg))
+        return paginator, page, page.object_list, page.has_other_pages()
+
+
+class KeysetAPIPagination(CursorPagination):
+    """
+    DRF cursor pagination on the primary key, with a configurable page size
+    and an estimated total count in the response body.
+    """
+    ordering = 'pk'
+    page_size = settings.LIST_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = settings.LIST_MAX_PAGE_SIZE
+    estimate_count = True
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.queryset = queryset
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_count(self):
+        return estimated_count(self.queryset) if self.estimate_count else self.queryset.count()
+
+    def get_paginated_response(self, data):
+        return Response({
+            'count': self.get_count(),
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
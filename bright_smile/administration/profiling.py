@@ -0,0 +1,176 @@
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+from django.conf import settings
+from django.utils import timezone
+
+
+def _frame_label(code):
+    filename = code.co_filename
+    if filename.startswith(str(settings.BASE_DIR)):
+        filename = os.path.relpath(filename, settings.BASE_DIR)
+    elif 'site-packages' in filename:
+        filename = filename.split('site-packages' + os.sep, 1)[1]
+    # ; separates frames in the folded format
+    return f'{code.co_name} ({filename}:{code.co_firstlineno})'.replace(';', ':')
+
+
+class StackSampler:
+    """
+    Samples the stack of one thread every ``interval`` seconds from a background
+    thread, so the profiled code runs unmodified and the overhead does not depend on
+    how many calls it makes.
+
+        with StackSampler() as sampler:
+            ...
+        sampler.stacks  # Counter of (outermost frame, ..., innermost frame) -> samples
+    """
+
+    def __init__(self, interval=0.005, thread_id=None):
+        self.interval = interval
+        self.thread_id = thread_id or threading.get_ident()
+        self.stacks = Counter()
+        self._labels = {}
+        self._stopped = threading.Event()
+
+    def _sample(self):
+        frame = sys._current_frames().get(self.thread_id)
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            if code not in self._labels:
+                self._labels[code] = _frame_label(code)
+            stack.append(self._labels[code])
+            frame = frame.f_back
+        if stack:
+            self.stacks[tuple(reversed(stack))] += 1
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self._sample()
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stopped.set()
+        self._thread.join()
+        self.seconds = time.perf_counter() - self.started
+
+
+def folded(stacks):
+    """
+    Stacks in the folded format read by flamegraph.pl and speedscope: one
+    "outer;...;inner samples" line per distinct stack.
+    """
+    return ''.join(f'{";".join(stack)} {count}\n' for stack, count in sorted(stacks.items()))
+
+
+def parse_folded(text):
+    stacks = Counter()
+    for line in text.splitlines():
+        stack, _, count = line.rpartition(' ')
+        if stack:
+            stacks[tuple(stack.split(';'))] += int(count)
+    return stacks
+
+
+def hot_frames(stacks, limit=10):
+    """
+    ([(frame, samples on top of the stack)], [(frame, samples anywhere in the stack)]),
+    each the ``limit`` largest.
+    """
+    own, total = Counter(), Counter()
+    for stack, count in stacks.items():
+        own[stack[-1]] += count
+        for frame in set(stack):
+            total[frame] += count
+    return own.most_common(limit), total.most_common(limit)
+
+
+def call_tree(stacks, min_share=0.02):
+    """
+    The stacks merged into a call tree, as indented "share% samples frame" lines.
+    Branches with less than ``min_share`` of the samples are left out.
+    """
+    samples = sum(stacks.values())
+    tree = {}
+    for stack, count in stacks.items():
+        children = tree
+        for frame in stack:
+            node = children.setdefault(frame, [0, {}])
+            node[0] += count
+            children = node[1]
+
+    lines = []
+
+    def walk(children, depth):
+        for frame, (count, grandchildren) in sorted(children.items(), key=lambda item: -item[1][0]):
+            if count < samples * min_share:
+                continue
+            lines.append(f'{"  " * depth}{count * 100 / samples:5.1f}% {count:>6} {frame}')
+            walk(grandchildren, depth + 1)
+
+    walk(tree, 0)
+    return lines
+
+
+def _directory():
+    os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+    return settings.PROFILE_DIR
+
+
+def save_profile(sampler, **details):
+    """
+    Write the sampler's stacks to <id>.folded and a summary with ``details`` to
+    <id>.json in PROFILE_DIR, then delete the oldest profiles past PROFILE_RETENTION.
+    Returns the profile id.
+    """
+    now = timezone.now()
+    profile_id = f'{now:%Y%m%d-%H%M%S-%f}-{uuid.uuid4().hex[:6]}'
+    directory = _directory()
+    own, total = hot_frames(sampler.stacks)
+    summary = dict(details, id=profile_id, created=now.isoformat(), seconds=round(sampler.seconds, 4),
+                   interval=sampler.interval, samples=sum(sampler.stacks.values()), own=own, total=total)
+    with open(os.path.join(directory, f'{profile_id}.folded'), 'w') as output:
+        output.write(folded(sampler.stacks))
+    with open(os.path.join(directory, f'{profile_id}.json'), 'w') as output:
+        json.dump(summary, output, indent=2)
+    prune_profiles(settings.PROFILE_RETENTION)
+    return profile_id
+
+
+def profile_ids():
+    """
+    Ids of the saved profiles, newest first.
+    """
+    if not os.path.isdir(settings.PROFILE_DIR):
+        return []
+    return sorted((name[:-len('.json')] for name in os.listdir(settings.PROFILE_DIR) if name.endswith('.json')),
+                  reverse=True)
+
+
+def load_profile(profile_id):
+    """
+    (summary, stacks) of a saved profile; raises FileNotFoundError for an unknown id.
+    """
+    path = os.path.join(settings.PROFILE_DIR, os.path.basename(profile_id))
+    with open(f'{path}.json') as summary, open(f'{path}.folded') as stacks:
+        return json.load(summary), parse_folded(stacks.read())
+
+
+def prune_profiles(keep):
+    for profile_id in profile_ids()[keep:]:
+        for extension in ('.json', '.folded'):
+            try:
+                os.remove(os.path.join(settings.PROFILE_DIR, profile_id + extension))
+            except FileNotFoundError:
+                pass
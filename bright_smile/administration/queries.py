@@ -0,0 +1,40 @@
+from django.db.models import Count, Exists, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from .models import DoctorClinicAffiliation
+
+
+def affiliated():
+    """
+    Exists() filter for Visit/Appointment rows whose doctor is affiliated with the row's clinic.
+    """
+    return Exists(DoctorClinicAffiliation.objects.filter(doctor=OuterRef('doctor'), clinic=OuterRef('clinic')))
+
+
+def count_distinct(queryset, group_field, counted_field):
+    """
+    Correlated subquery counting distinct ``counted_field`` values of ``queryset``
+    where ``group_field`` matches the primary key of the outer row. Rows without
+    a match count as 0.
+    """
+    counts = (
+        queryset.filter(**{group_field: OuterRef('pk')})
+        .order_by()
+        .values(group_field)
+        .annotate(count=Count(counted_field, distinct=True))
+        .values('count')
+    )
+    return Coalesce(Subquery(counts, output_field=IntegerField()), Value(0))
+
+
+def unique_patient_count(group_field, visits, appointments):
+    """
+    Number of distinct patients across ``visits`` and ``appointments`` for each outer row.
+
+    Counted as |patients with a visit| + |patients with an appointment but no visit|,
+    so the database never has to materialise a UNION of both tables.
+    """
+    appointments_only = appointments.exclude(
+        Exists(visits.filter(patient=OuterRef('patient'), **{group_field: OuterRef(group_field)}))
+    )
+    return count_distinct(visits, group_field, 'patient') + count_distinct(appointments_only, group_field, 'patient')
@@ -0,0 +1,327 @@
+from itertools import islice
+
+from django.db import transaction
+from django.db.models import Count, F, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Clinic, Doctor, Patient, DoctorClinicAffiliation, Visit, Appointment, DoctorPatientLink, \
+    ClinicPatientLink, DoctorRollup, ClinicRollup, PatientRollup
+from .queries import affiliated, count_distinct, unique_patient_count
+
+# owner field -> (owner model, link model, rollup model)
+LINKS = {
+    'doctor': (Doctor, DoctorPatientLink, DoctorRollup),
+    'clinic': (Clinic, ClinicPatientLink, ClinicRollup),
+}
+
+
+# owner model -> its one-to-one rollup model
+OWNER_ROLLUPS = {Clinic: ClinicRollup, Doctor: DoctorRollup, Patient: PatientRollup}
+
+
+def create_rollups(owners):
+    """
+    Empty rollup rows for owners inserted with bulk_create, which sends no post_save.
+    """
+    owners = list(owners)
+    if not owners or type(owners[0]) not in OWNER_ROLLUPS:
+        return
+    field = owners[0]._meta.model_name
+    rollup_model = OWNER_ROLLUPS[type(owners[0])]
+    rollup_model.objects.bulk_create([rollup_model(**{field: owner}) for owner in owners], ignore_conflicts=True)
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def _sources(owner, owner_filter):
+    """
+    Visits and appointments that make a patient count for a doctor or clinic.
+    Clinics only count patients seen by doctors affiliated with them.
+    """
+    visits = Visit.objects.filter(**owner_filter)
+    appointments = Appointment.objects.filter(**owner_filter)
+    if owner == 'clinic':
+        visits = visits.filter(affiliated())
+        appointments = appointments.filter(affiliated())
+    return visits, appointments
+
+
+def _adjust_patient_count(owner, owner_id, delta):
+    rollup_model = LINKS[owner][2]
+    rollup_model.objects.filter(**{f'{owner}_id': owner_id}).update(patient_count=F('patient_count') + delta)
+
+
+def refresh_link(owner, owner_id, patient_id, create=True):
+    """
+    Recompute one doctor-patient or clinic-patient link from its source rows and
+    move the owner's patient count by one if the link was switched on or off.
+
+    ``create`` is False on delete paths, where the owner or patient may be in the
+    middle of a cascade and must not get new rows pointing at it.
+    """
+    link_model = LINKS[owner][1]
+    now = timezone.now()
+    visits, appointments = _sources(owner, {f'{owner}_id': owner_id, 'patient_id': patient_id})
+    has_visit = visits.exists()
+    last_appointment_at = appointments.aggregate(last=Max('date_time'))['last']
+    is_active = has_visit or (last_appointment_at is not None and last_appointment_at >= now)
+
+    with transaction.atomic():
+        link = link_model.objects.select_for_update().filter(**{f'{owner}_id': owner_id, 'patient_id': patient_id}).first()
+        was_active = link is not None and link.is_active
+
+        if not has_visit and last_appointment_at is None:
+            if link is not None:
+                link.delete()
+            is_active = False
+        elif link is not None:
+            link.has_visit = has_visit
+            link.last_appointment_at = last_appointment_at
+            link.is_active = is_active
+            link.save(update_fields=['has_visit', 'last_appointment_at', 'is_active'])
+        elif create:
+            link_model.objects.create(**{f'{owner}_id': owner_id}, patient_id=patient_id, has_visit=has_visit,
+                                      last_appointment_at=last_appointment_at, is_active=is_active)
+        else:
+            is_active = False
+
+        if is_active != was_active:
+            _adjust_patient_count(owner, owner_id, 1 if is_active else -1)
+
+
+def refresh_patient(patient_id, create=True):
+    """
+    Point a patient's rollup at their latest visit and earliest future appointment.
+    """
+    last_visit_id = (Visit.objects.filter(patient_id=patient_id)
+                     .order_by('-date_time', '-pk').values_list('pk', flat=True).first())
+    next_appointment_id = (Appointment.objects.filter(patient_id=patient_id, date_time__gte=timezone.now())
+                           .order_by('date_time', 'pk').values_list('pk', flat=True).first())
+    pointers = {'last_visit_id': last_visit_id, 'next_appointment_id': next_appointment_id}
+    if create:
+        PatientRollup.objects.update_or_create(patient_id=patient_id, defaults=pointers)
+    else:
+        PatientRollup.objects.filter(patient_id=patient_id).update(**pointers)
+
+
+def refresh_event(patient_id, doctor_id, clinic_id, create=True):
+    """
+    Refresh everything a single Visit or Appointment row contributes to.
+    """
+    refresh_link('doctor', doctor_id, patient_id, create)
+    refresh_link('clinic', clinic_id, patient_id, create)
+    refresh_patient(patient_id, create)
+
+
+def release_patient(patient_id):
+    """
+    Take a patient out of every doctor and clinic count ahead of deleting them,
+    so the cascade order of their links and visits does not matter.
+    """
+    for owner, (_, link_model, _) in LINKS.items():
+        with transaction.atomic():
+            links = link_model.objects.select_for_update().filter(patient_id=patient_id)
+            for owner_id in links.filter(is_active=True).values_list(owner, flat=True):
+                _adjust_patient_count(owner, owner_id, -1)
+            links.delete()
+
+
+def refresh_affiliation(doctor_id, clinic_id, create=True):
+    """
+    An affiliation decides which of a doctor's patients count for a clinic, so
+    recount both sides and re-check every patient the doctor has at that clinic.
+    """
+    clinic_count = DoctorClinicAffiliation.objects.filter(doctor_id=doctor_id).values('clinic').distinct().count()
+    doctor_count = DoctorClinicAffiliation.objects.filter(clinic_id=clinic_id).values('doctor').distinct().count()
+    DoctorRollup.objects.filter(doctor_id=doctor_id).update(clinic_count=clinic_count)
+    ClinicRollup.objects.filter(clinic_id=clinic_id).update(doctor_count=doctor_count)
+
+    patient_ids = Visit.objects.filter(doctor_id=doctor_id, clinic_id=clinic_id).values('patient').union(
+        Appointment.objects.filter(doctor_id=doctor_id, clinic_id=clinic_id).values('patient')
+    )
+    for patient_id in Patient.objects.filter(pk__in=patient_ids).values_list('pk', flat=True).iterator():
+        refresh_link('clinic', clinic_id, patient_id, create)
+
+
+def expire_rollups(now=None):
+    """
+    Switch off links kept alive only by an appointment that has since passed, and
+    move next-appointment pointers that are now in the past. Run periodically with
+    `rebuild_rollups --expire`; the lists correct for it at read time in between.
+    Returns the number of links and patients touched.
+    """
+    now = now or timezone.now()
+    expired = 0
+    for owner, (_, link_model, _) in LINKS.items():
+        with transaction.atomic():
+            stale = link_model.objects.select_for_update().filter(is_active=True, has_visit=False, last_appointment_at__lt=now)
+            stale_ids = list(stale.values_list('pk', flat=True))
+            for row in link_model.objects.filter(pk__in=stale_ids).values(owner).annotate(n=Count('pk')):
+                _adjust_patient_count(owner, row[owner], -row['n'])
+            link_model.objects.filter(pk__in=stale_ids).update(is_active=False)
+            expired += len(stale_ids)
+
+    stale_patients = PatientRollup.objects.filter(next_appointment__date_time__lt=now).values_list('patient_id', flat=True)
+    for patient_id in stale_patients.iterator():
+        refresh_patient(patient_id, create=False)
+        expired += 1
+    return expired
+
+
+def active_patient_count(owner, now=None):
+    """
+    An expression for the doctor's or clinic's rollup patient count, less the links
+    kept active only by an appointment that has passed since expire_rollups() last
+    ran. Lists read the count through it, so they are right without writing anything.
+    """
+    now = now or timezone.now()
+    link_model = LINKS[owner][1]
+    passed = (link_model.objects.filter(**{owner: OuterRef('pk')}, is_active=True, has_visit=False,
+                                        last_appointment_at__lt=now)
+              .order_by().values(owner).annotate(n=Count('pk')).values('n'))
+    return Coalesce('rollup__patient_count', 0) - Coalesce(Subquery(passed), 0)
+
+
+def current_next_appointments(patients, now=None):
+    """
+    Replace next-appointment pointers of ``patients`` that have passed since they were
+    set with the actual next appointments, loaded with their doctor and procedure.
+    The rollups are left to expire_rollups(); only rows that need it cost queries.
+    Returns how many were replaced.
+    """
+    now = now or timezone.now()
+    stale = [patient for patient in patients if hasattr(patient, 'rollup')
+             and patient.rollup.next_appointment is not None and patient.rollup.next_appointment.date_time < now]
+    if not stale:
+        return 0
+    next_ids = {pk: next_appointment_id for pk, _, next_appointment_id
+                in _patient_pointers(Patient.objects.filter(pk__in=[patient.pk for patient in stale]), now)}
+    appointments = Appointment.objects.select_related('doctor', 'procedure').in_bulk(
+        [pk for pk in next_ids.values() if pk is not None])
+    for patient in stale:
+        patient.rollup.next_appointment = appointments.get(next_ids.get(patient.pk))
+    return len(stale)
+
+
+def _rebuild_links(owner, chunk_size, now):
+    owner_model, link_model, rollup_model = LINKS[owner]
+    other = 'clinic' if owner == 'doctor' else 'doctor'
+    count_field = f'{other}_count'
+
+    owner_ids = owner_model.objects.order_by('pk').values_list('pk', flat=True)
+    for chunk in _chunks(owner_ids.iterator(), chunk_size):
+        visits, appointments = _sources(owner, {f'{owner}__in': chunk})
+        links = {}
+        for owner_id, patient_id in visits.order_by().values_list(owner, 'patient').distinct():
+            links[owner_id, patient_id] = link_model(**{f'{owner}_id': owner_id}, patient_id=patient_id, has_visit=True)
+        last_appointments = appointments.order_by().values(owner, 'patient').annotate(last=Max('date_time'))
+        for row in last_appointments.values_list(owner, 'patient', 'last'):
+            link = links.setdefault(row[:2], link_model(**{f'{owner}_id': row[0]}, patient_id=row[1]))
+            link.last_appointment_at = row[2]
+
+        patient_counts = dict.fromkeys(chunk, 0)
+        for (owner_id, _), link in links.items():
+            link.is_active = link.has_visit or link.last_appointment_at >= now
+            patient_counts[owner_id] += link.is_active
+        affiliation_counts = dict(
+            DoctorClinicAffiliation.objects.filter(**{f'{owner}__in': chunk}).order_by()
+            .values(owner).annotate(n=Count(other, distinct=True)).values_list(owner, 'n')
+        )
+
+        with transaction.atomic():
+            link_model.objects.filter(**{f'{owner}__in': chunk}).delete()
+            link_model.objects.bulk_create(links.values(), batch_size=chunk_size)
+            rollup_model.objects.filter(**{f'{owner}__in': chunk}).delete()
+            rollup_model.objects.bulk_create(
+                [rollup_model(**{f'{owner}_id': owner_id, count_field: affiliation_counts.get(owner_id, 0)},
+                              patient_count=patient_counts[owner_id]) for owner_id in chunk],
+                batch_size=chunk_size,
+            )
+        yield len(chunk)
+
+
+def _patient_pointers(patients, now):
+    return patients.annotate(
+        last_visit_pk=Subquery(Visit.objects.filter(patient=OuterRef('pk')).order_by('-date_time', '-pk').values('pk')[:1]),
+        next_appointment_pk=Subquery(Appointment.objects.filter(patient=OuterRef('pk'), date_time__gte=now)
+                                     .order_by('date_time', 'pk').values('pk')[:1]),
+    ).values_list('pk', 'last_visit_pk', 'next_appointment_pk')
+
+
+def _rebuild_patients(chunk_size, now):
+    patient_ids = Patient.objects.order_by('pk').values_list('pk', flat=True)
+    for chunk in _chunks(patient_ids.iterator(), chunk_size):
+        rollups = [
+            PatientRollup(patient_id=patient_id, last_visit_id=last_visit_id, next_appointment_id=next_appointment_id)
+            for patient_id, last_visit_id, next_appointment_id in _patient_pointers(Patient.objects.filter(pk__in=chunk), now)
+        ]
+        with transaction.atomic():
+            PatientRollup.objects.filter(patient__in=chunk).delete()
+            PatientRollup.objects.bulk_create(rollups, batch_size=chunk_size)
+        yield len(chunk)
+
+
+def rebuild_rollups(chunk_size=500):
+    """
+    Recompute every rollup from the source tables, one chunk of owners at a time.
+    Yields (rollup name, rows processed so far) after each chunk.
+    """
+    now = timezone.now()
+    for name, steps in (
+        ('doctors', _rebuild_links('doctor', chunk_size, now)),
+        ('clinics', _rebuild_links('clinic', chunk_size, now)),
+        ('patients', _rebuild_patients(chunk_size, now)),
+    ):
+        done = 0
+        for processed in steps:
+            done += processed
+            yield name, done
+
+
+def verify_rollups():
+    """
+    Compare stored rollups with the same figures computed from the source tables.
+    Returns a list of (rollup name, object id, expected, stored) mismatches.
+    """
+    now = timezone.now()
+    mismatches = []
+
+    visits = Visit.objects.all()
+    future_appointments = Appointment.objects.filter(date_time__gte=now)
+    doctors = Doctor.objects.annotate(
+        expected=unique_patient_count('doctor', visits, future_appointments),
+        expected_clinics=count_distinct(DoctorClinicAffiliation.objects.all(), 'doctor', 'clinic'),
+        stored=Coalesce('rollup__patient_count', -1),
+        stored_clinics=Coalesce('rollup__clinic_count', -1),
+    )
+
+    visits = Visit.objects.filter(affiliated())
+    future_appointments = Appointment.objects.filter(affiliated(), date_time__gte=now)
+    clinics = Clinic.objects.annotate(
+        expected=unique_patient_count('clinic', visits, future_appointments),
+        expected_doctors=count_distinct(DoctorClinicAffiliation.objects.all(), 'clinic', 'doctor'),
+        stored=Coalesce('rollup__patient_count', -1),
+        stored_doctors=Coalesce('rollup__doctor_count', -1),
+    )
+
+    for name, queryset, fields in (
+        ('doctor', doctors, ('expected', 'stored', 'expected_clinics', 'stored_clinics')),
+        ('clinic', clinics, ('expected', 'stored', 'expected_doctors', 'stored_doctors')),
+    ):
+        for pk, expected, stored, expected_related, stored_related in queryset.values_list('pk', *fields).iterator():
+            if expected != stored or expected_related != stored_related:
+                mismatches.append((name, pk, (expected, expected_related), (stored, stored_related)))
+
+    stored_pointers = dict(
+        (patient_id, (last_visit_id, next_appointment_id)) for patient_id, last_visit_id, next_appointment_id
+        in PatientRollup.objects.values_list('patient_id', 'last_visit_id', 'next_appointment_id').iterator()
+    )
+    for pk, last_visit_id, next_appointment_id in _patient_pointers(Patient.objects.all(), now).iterator():
+        if stored_pointers.get(pk) != (last_visit_id, next_appointment_id):
+            mismatches.append(('patient', pk, (last_visit_id, next_appointment_id), stored_pointers.get(pk)))
+    return mismatches
@@ -1,5 +1,34 @@
+from django.utils.encoding import smart_str
 from rest_framework import serializers
-from .models import Clinic, Doctor, Patient, Specialty
+from .models import Clinic, Doctor, Patient, Specialty, DoctorClinicAffiliation
+
+
+class PrefetchedSlugRelatedField(serializers.SlugRelatedField):
+    """
+    A SlugRelatedField that resolves slugs from ``context['slug_lookups'][model]`` when
+    present, so a batch of items needs one query instead of one per slug.
+    """
+
+    def build_lookup(self, slugs):
+        lookup = {}
+        for obj in self.get_queryset().filter(**{f'{self.slug_field}__in': slugs}):
+            slug = getattr(obj, self.slug_field)
+            # Like the single lookup, an ambiguous slug is invalid
+            lookup[slug] = None if slug in lookup else obj
+        return lookup
+
+    def to_internal_value(self, data):
+        lookup = self.context.get('slug_lookups', {}).get(self.queryset.model)
+        if lookup is None:
+            return super().to_internal_value(data)
+        if not isinstance(data, (str, int, float, bool)):
+            self.fail('invalid')
+        if smart_str(data) not in lookup:
+            self.fail('does_not_exist', slug_name=self.slug_field, value=smart_str(data))
+        if lookup[smart_str(data)] is None:
+            self.fail('invalid')
+        return lookup[smart_str(data)]
+
 
 class ClinicSerializer(serializers.ModelSerializer):
     class Meta:
@@ -11,10 +40,18 @@ class SpecialtySerializer(serializers.ModelSerializer):
         model = Specialty
         fields = '__all__'
 
+class DoctorAffiliationSerializer(serializers.ModelSerializer):
+    clinic_name = serializers.CharField(source='clinic.name', read_only=True)
+
+    class Meta:
+        model = DoctorClinicAffiliation
+        fields = ['clinic', 'clinic_name', 'office_address']
+
 class DoctorSerializer(serializers.ModelSerializer):
 
     # specialties = serializers.StringRelatedField(many=True)
-    specialties = serializers.SlugRelatedField(queryset=Specialty.objects.all(), many=True, slug_field='name')
+    specialties = PrefetchedSlugRelatedField(queryset=Specialty.objects.all(), many=True, slug_field='name')
+    affiliations = DoctorAffiliationSerializer(source='doctorclinicaffiliation_set', many=True, read_only=True)
 
 
     class Meta:
@@ -25,3 +62,5 @@ class PatientSerializer(serializers.ModelSerializer):
     class Meta:
         model = Patient
         fields = '__all__'
+        # Accepted on writes but never returned, as in the exports
+        extra_kwargs = {'last_4_ssn': {'write_only': True}}
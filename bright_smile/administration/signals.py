@@ -0,0 +1,193 @@
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from .availability import booking_days, bookings_version_key, schedule_version_key
+from .caching import bump, object_version_key, table_version_key
+from .capabilities import INDEX_MODELS, capability_index
+from .models import Clinic, Doctor, Patient, Specialty, DoctorClinicAffiliation, DoctorSchedule, Visit, Appointment, \
+    ClinicRollup, DoctorRollup, PatientRollup
+from .rollups import refresh_event, refresh_affiliation, release_patient
+
+# Keep the patient-relationship rollups in step with every row-level write.
+# Queryset.update(), bulk_create() and raw SQL bypass these receivers; run
+# `manage.py rebuild_rollups` after such bulk changes.
+
+# The availability cache is invalidated the same way, by bumping the version stamps
+# of every (doctor, date) and (doctor, clinic) a write touches.
+
+EVENT_KEYS = ('patient_id', 'doctor_id', 'clinic_id')
+
+
+def _previous_row(sender, instance):
+    if instance.pk is None:
+        return None
+    return sender.objects.filter(pk=instance.pk).values(*EVENT_KEYS, 'date_time').first()
+
+
+@receiver(post_save, sender=Clinic)
+def create_clinic_rollup(sender, instance, created, **kwargs):
+    if created:
+        ClinicRollup.objects.get_or_create(clinic=instance)
+
+
+@receiver(post_save, sender=Doctor)
+def create_doctor_rollup(sender, instance, created, **kwargs):
+    if created:
+        DoctorRollup.objects.get_or_create(doctor=instance)
+
+
+@receiver(post_save, sender=Patient)
+def create_patient_rollup(sender, instance, created, **kwargs):
+    if created:
+        PatientRollup.objects.get_or_create(patient=instance)
+
+
+@receiver(pre_delete, sender=Patient)
+def patient_deleting(sender, instance, **kwargs):
+    release_patient(instance.pk)
+
+
+@receiver(pre_save, sender=Visit)
+@receiver(pre_save, sender=Appointment)
+def remember_event_row(sender, instance, **kwargs):
+    instance._previous_row = _previous_row(sender, instance)
+
+
+@receiver(post_save, sender=Visit)
+@receiver(post_save, sender=Appointment)
+def event_saved(sender, instance, **kwargs):
+    keys = tuple(getattr(instance, key) for key in EVENT_KEYS)
+    previous = getattr(instance, '_previous_row', None)
+    if previous:
+        previous_keys = tuple(previous[key] for key in EVENT_KEYS)
+        if previous_keys != keys:
+            refresh_event(*previous_keys, create=False)
+    if getattr(instance, '_refresh_rollups_on_commit', False):
+        # Set by book_appointment(), so bookings at one clinic do not queue on its rollup row
+        transaction.on_commit(lambda: refresh_event(*keys))
+    else:
+        refresh_event(*keys)
+
+
+@receiver(post_delete, sender=Visit)
+@receiver(post_delete, sender=Appointment)
+def event_deleted(sender, instance, **kwargs):
+    refresh_event(*(getattr(instance, key) for key in EVENT_KEYS), create=False)
+
+
+@receiver(pre_save, sender=DoctorClinicAffiliation)
+def remember_affiliation_keys(sender, instance, **kwargs):
+    instance._previous_pair = (
+        sender.objects.filter(pk=instance.pk).values_list('doctor_id', 'clinic_id').first() if instance.pk else None
+    )
+
+
+@receiver(post_save, sender=DoctorClinicAffiliation)
+def affiliation_saved(sender, instance, **kwargs):
+    keys = (instance.doctor_id, instance.clinic_id)
+    previous = getattr(instance, '_previous_pair', None)
+    if previous and previous != keys:
+        refresh_affiliation(*previous, create=False)
+    refresh_affiliation(*keys)
+
+
+@receiver(post_delete, sender=DoctorClinicAffiliation)
+def affiliation_deleted(sender, instance, **kwargs):
+    refresh_affiliation(instance.doctor_id, instance.clinic_id, create=False)
+
+
+@receiver(post_save, sender=Appointment)
+def booking_saved(sender, instance, **kwargs):
+    keys = {bookings_version_key(instance.doctor_id, day) for day in booking_days(instance.date_time)}
+    previous = getattr(instance, '_previous_row', None)
+    if previous:
+        keys.update(bookings_version_key(previous['doctor_id'], day) for day in booking_days(previous['date_time']))
+    bump(*keys)
+
+
+@receiver(post_delete, sender=Appointment)
+def booking_deleted(sender, instance, **kwargs):
+    bump(*(bookings_version_key(instance.doctor_id, day) for day in booking_days(instance.date_time)))
+
+
+def _bump_schedules(*affiliation_ids):
+    pairs = DoctorClinicAffiliation.objects.filter(pk__in=affiliation_ids).values_list('doctor_id', 'clinic_id')
+    bump(*{schedule_version_key(doctor_id, clinic_id) for doctor_id, clinic_id in pairs})
+
+
+@receiver(pre_save, sender=DoctorSchedule)
+def remember_schedule_affiliation(sender, instance, **kwargs):
+    instance._previous_affiliation_id = (
+        sender.objects.filter(pk=instance.pk).values_list('affiliation_id', flat=True).first() if instance.pk else None
+    )
+
+
+@receiver(post_save, sender=DoctorSchedule)
+def schedule_saved(sender, instance, **kwargs):
+    _bump_schedules(instance.affiliation_id, getattr(instance, '_previous_affiliation_id', None))
+
+
+@receiver(post_delete, sender=DoctorSchedule)
+def schedule_deleted(sender, instance, **kwargs):
+    # When the affiliation itself is being deleted it is already gone here;
+    # affiliation_changed below covers that case
+    _bump_schedules(instance.affiliation_id)
+
+
+@receiver(post_save, sender=DoctorClinicAffiliation)
+@receiver(post_delete, sender=DoctorClinicAffiliation)
+def affiliation_changed(sender, instance, **kwargs):
+    keys = {schedule_version_key(instance.doctor_id, instance.clinic_id)}
+    previous = getattr(instance, '_previous_pair', None)
+    if previous:
+        keys.add(schedule_version_key(*previous))
+    bump(*keys)
+
+
+# Per-row stamps for the cached table rows and sections of the list and detail pages
+# (see administration.templatetags.fragment_cache); a doctor's row shows its specialties
+OBJECT_VERSIONED_MODELS = (Clinic, Doctor)
+
+
+# Whole-table version stamps for the lookup endpoints and the REST API (see administration.conditional).
+# Patients have none: every patient write would queue on the one counter row.
+@receiver(post_save, sender=Clinic)
+@receiver(post_save, sender=Doctor)
+@receiver(post_save, sender=Specialty)
+@receiver(post_save, sender=DoctorClinicAffiliation)
+@receiver(post_save, sender=DoctorSchedule)
+@receiver(post_delete, sender=Clinic)
+@receiver(post_delete, sender=Doctor)
+@receiver(post_delete, sender=Specialty)
+@receiver(post_delete, sender=DoctorClinicAffiliation)
+@receiver(post_delete, sender=DoctorSchedule)
+def table_changed(sender, instance, **kwargs):
+    keys = [table_version_key(sender)]
+    if sender in OBJECT_VERSIONED_MODELS:
+        keys.append(object_version_key(sender, instance.pk))
+    bump(*keys)
+    if sender in INDEX_MODELS:
+        capability_index.expire()
+
+
+@receiver(m2m_changed, sender=Doctor.specialties.through)
+def doctor_specialties_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear' and reverse:
+        instance._cleared_doctor_ids = list(instance.doctors.values_list('pk', flat=True))
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        if not reverse:
+            doctor_ids = [instance.pk]
+        elif action == 'post_clear':
+            doctor_ids = getattr(instance, '_cleared_doctor_ids', [])
+        else:
+            doctor_ids = pk_set
+        bump(table_version_key(sender), *(object_version_key(Doctor, pk) for pk in sorted(doctor_ids)))
+        capability_index.expire()
+
+
+@receiver(post_save, sender=Specialty)
+@receiver(pre_delete, sender=Specialty)
+def specialty_changed(sender, instance, **kwargs):
+    # Its doctors' rows show it by name; a delete drops their links without m2m_changed
+    bump(*(object_version_key(Doctor, pk) for pk in sorted(instance.doctors.values_list('pk', flat=True))))
@@ -0,0 +1,193 @@
+import random
+from datetime import date, datetime, time, timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from .availability import SLOT_DURATION, booking_days, bookings_version_key, schedule_version_key
+from .caching import bump_many, table_version_key
+from .importer import insert_records
+from .models import Clinic, Doctor, Patient, Specialty, DoctorClinicAffiliation, DoctorSchedule
+from .rollups import rebuild_rollups
+
+PROCEDURES = ['Cleaning', 'Filling', 'Root Canal', 'Extraction', 'Crown', 'Orthodontics', 'Whitening', 'Implant']
+FIRST_NAMES = ['Ava', 'Ben', 'Chloe', 'Daniel', 'Emma', 'Farah', 'George', 'Hana', 'Isaac', 'Julia', 'Kofi', 'Lena',
+               'Mateo', 'Nina', 'Omar', 'Priya', 'Quinn', 'Rosa', 'Sam', 'Tara', 'Umar', 'Vera', 'Wei', 'Yusuf', 'Zoe']
+LAST_NAMES = ['Smith', 'Garcia', 'Chen', 'Patel', 'Johnson', 'Kim', 'Nguyen', 'Brown', 'Lopez', 'Okafor', 'Singh',
+              'Miller', 'Davis', 'Rossi', 'Cohen', 'Silva', 'Ahmed', 'Walker', 'Novak', 'Tanaka']
+CITIES = [('New York', 'NY'), ('Jersey City', 'NJ'), ('Boston', 'MA'), ('Chicago', 'IL'), ('Austin', 'TX'),
+          ('Denver', 'CO'), ('Seattle', 'WA'), ('Atlanta', 'GA')]
+WORKING_DAYS = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat']
+WEEKDAY_NUMBERS = {day: number for number, day in enumerate(['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun'])}
+
+# The 1x dataset; dataset_size() scales the counts, not the per-patient rates
+BASE_SIZE = {'clinics': 5, 'doctors': 20, 'patients': 500, 'visits_per_patient': 4, 'appointments_per_patient': 1}
+
+
+def dataset_size(scale=1):
+    return {name: value if name.endswith('_per_patient') else value * scale for name, value in BASE_SIZE.items()}
+
+
+def _name(rng):
+    return f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}'
+
+
+def _weekly_shifts(rng, clinic_count):
+    """
+    Split a doctor's working days between their clinics so the shifts never overlap:
+    [[(day, start, end), ...] per clinic]
+    """
+    days = rng.sample(WORKING_DAYS, rng.randint(3, 5))
+    shifts = [[] for _ in range(clinic_count)]
+    for index, day in enumerate(days):
+        start = rng.choice([7, 8, 9])
+        shifts[index % clinic_count].append((day, time(start), time(start + rng.choice([6, 8]))))
+    return shifts
+
+
+def _slot_on(rng, day, shift):
+    _, start, end = shift
+    slots = int((datetime.combine(day, end) - datetime.combine(day, start)) / SLOT_DURATION)
+    return timezone.make_aware(datetime.combine(day, start) + rng.randrange(slots) * SLOT_DURATION)
+
+
+def _day_in_range(rng, first, days, weekday):
+    """
+    A random date with the given weekday within ``days`` days from ``first``.
+    """
+    offset = (weekday - first.weekday()) % 7
+    return first + timedelta(days=offset + 7 * rng.randrange(max((days - offset + 6) // 7, 1)))
+
+
+def generate_dataset(clinics, doctors, patients, visits_per_patient, appointments_per_patient, years=3,
+                     appointment_days=90, seed=0, batch_size=5000, today=None):
+    """
+    Populate every scheduling model with a deterministic dataset: the same seed and
+    ``today`` on an empty database always produce the same rows.
+
+    Doctors get one to three specialties and one or two clinics, with weekly shifts
+    that never overlap. Visits fall within the doctors' hours over the past ``years``
+    and appointments within the next ``appointment_days`` days, never two at once for
+    a doctor. Visits and appointments are streamed in ``batch_size`` batches through
+    the bulk import path (COPY on PostgreSQL), so memory stays flat.
+
+    Yields (what, rows created so far) as it goes.
+    """
+    rng = random.Random(seed)
+    today = today or timezone.localdate()
+
+    existing = set(Specialty.objects.filter(name__in=PROCEDURES).values_list('name', flat=True))
+    Specialty.objects.bulk_create([Specialty(name=name) for name in PROCEDURES if name not in existing])
+    procedure_ids = dict(Specialty.objects.filter(name__in=PROCEDURES).values_list('name', 'pk'))
+    yield 'procedures', len(procedure_ids)
+
+    clinic_objects = Clinic.objects.bulk_create([
+        Clinic(name=f'{city} Dental {index + 1}', phone_number=f'555{rng.randrange(10 ** 7):07d}', city=city,
+               state=state, email=f'clinic{index + 1}@example.com')
+        for index, (city, state) in enumerate(rng.choice(CITIES) for _ in range(clinics))
+    ], batch_size=batch_size)
+    yield 'clinics', len(clinic_objects)
+
+    npi_start = Doctor.objects.count()
+    doctor_objects = Doctor.objects.bulk_create([
+        Doctor(NPI=f'{npi_start + index + 1:010d}', name=f'Dr. {_name(rng)}', email=f'doctor{npi_start + index + 1}@example.com',
+               phone_number=f'555{rng.randrange(10 ** 7):07d}')
+        for index in range(doctors)
+    ], batch_size=batch_size)
+    specialties = {doctor.pk: rng.sample(sorted(procedure_ids.values()), rng.randint(1, 3)) for doctor in doctor_objects}
+    Doctor.specialties.through.objects.bulk_create([
+        Doctor.specialties.through(doctor_id=doctor_id, specialty_id=specialty_id)
+        for doctor_id, specialty_ids in specialties.items() for specialty_id in specialty_ids
+    ], batch_size=batch_size)
+    yield 'doctors', len(doctor_objects)
+
+    # (doctor_id, clinic_id, [(day, start, end), ...]) for every affiliation
+    shifts = []
+    for doctor in doctor_objects:
+        doctor_clinics = rng.sample(clinic_objects, min(rng.choice([1, 1, 2]), len(clinic_objects)))
+        for clinic, weekly in zip(doctor_clinics, _weekly_shifts(rng, len(doctor_clinics))):
+            shifts.append((doctor.pk, clinic.pk, weekly))
+    affiliations = DoctorClinicAffiliation.objects.bulk_create([
+        DoctorClinicAffiliation(doctor_id=doctor_id, clinic_id=clinic_id, office_address=f'{rng.randint(1, 999)} Main St')
+        for doctor_id, clinic_id, _ in shifts
+    ], batch_size=batch_size)
+    DoctorSchedule.objects.bulk_create([
+        DoctorSchedule(affiliation=affiliation, day_of_week=day, start_time=start, end_time=end)
+        for affiliation, (_, _, weekly) in zip(affiliations, shifts) for day, start, end in weekly
+    ], batch_size=batch_size)
+    # None of the bulk inserts sent signals
+    bump_many([table_version_key(model) for model in (Specialty, Clinic, Doctor, Doctor.specialties.through,
+                                                      DoctorClinicAffiliation, DoctorSchedule)]
+              + [schedule_version_key(doctor_id, clinic_id) for doctor_id, clinic_id, _ in shifts])
+    shifts = [(doctor_id, clinic_id, weekly) for doctor_id, clinic_id, weekly in shifts if weekly]
+    yield 'affiliations', len(affiliations)
+
+    patient_ids = []
+    for first in range(0, patients, batch_size):
+        patient_ids += [patient.pk for patient in Patient.objects.bulk_create([
+            Patient(name=_name(rng), date_of_birth=date(rng.randint(1940, 2020), rng.randint(1, 12), rng.randint(1, 28)),
+                    last_4_ssn=f'{rng.randrange(10 ** 4):04d}', phone_number=f'555{rng.randrange(10 ** 7):07d}',
+                    gender=rng.choice(['Female', 'Male']), address=f'{rng.randint(1, 9999)} {rng.choice(LAST_NAMES)} Ave')
+            for _ in range(min(batch_size, patients - first))
+        ])]
+        yield 'patients', len(patient_ids)
+    if not shifts:
+        return
+
+    history_days = 365 * years
+    first_visit_day = today - timedelta(days=history_days)
+    visits, created = [], 0
+    for patient_id in patient_ids:
+        for _ in range(rng.randint(0, 2 * visits_per_patient)):
+            doctor_id, clinic_id, weekly = rng.choice(shifts)
+            shift = rng.choice(weekly)
+            day = _day_in_range(rng, first_visit_day, history_days, WEEKDAY_NUMBERS[shift[0]])
+            visits.append({'patient_id': patient_id, 'doctor_id': doctor_id, 'clinic_id': clinic_id,
+                           'date_time': _slot_on(rng, day, shift), 'doctor_notes': '',
+                           'procedures': set(rng.sample(specialties[doctor_id], min(2, len(specialties[doctor_id]))))})
+            if len(visits) == batch_size:
+                created += _insert('visits', visits)
+                yield 'visits', created
+    if visits:
+        created += _insert('visits', visits)
+        yield 'visits', created
+
+    appointments, created, taken = [], 0, set()
+    now = timezone.now()
+    for patient_id in patient_ids:
+        for _ in range(rng.randint(0, 2 * appointments_per_patient)):
+            doctor_id, clinic_id, weekly = rng.choice(shifts)
+            # A doctor's calendar can be full; give up on this one after a few tries
+            for _ in range(5):
+                shift = rng.choice(weekly)
+                day = _day_in_range(rng, today + timedelta(days=1), appointment_days, WEEKDAY_NUMBERS[shift[0]])
+                date_time = _slot_on(rng, day, shift)
+                if (doctor_id, date_time) not in taken:
+                    break
+            else:
+                continue
+            taken.add((doctor_id, date_time))
+            appointments.append({'patient_id': patient_id, 'doctor_id': doctor_id, 'clinic_id': clinic_id,
+                                 'procedure_id': rng.choice(specialties[doctor_id]), 'date_time': date_time,
+                                 'date_booked': now})
+            if len(appointments) == batch_size:
+                created += _insert('appointments', appointments)
+                yield 'appointments', created
+    if appointments:
+        created += _insert('appointments', appointments)
+        yield 'appointments', created
+
+    # The bulk inserts did not maintain the rollups either
+    for name, done in rebuild_rollups(chunk_size=batch_size):
+        yield f'{name} rollups', done
+
+
+def _insert(kind, records):
+    with transaction.atomic():
+        insert_records(kind, records)
+        if kind == 'appointments':
+            bump_many(bookings_version_key(record['doctor_id'], day)
+                      for record in records for day in booking_days(record['date_time']))
+    count = len(records)
+    records.clear()
+    return count
@@ -0,0 +1,55 @@
+from django import template
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+
+from ..caching import cache_stats
+
+register = template.Library()
+
+
+class FragmentNode(template.Node):
+
+    def __init__(self, nodelist, name, vary_on):
+        self.nodelist = nodelist
+        self.name = name
+        self.vary_on = vary_on
+
+    def render(self, context):
+        key = make_template_fragment_key(self.name.resolve(context),
+                                         [value.resolve(context) for value in self.vary_on])
+        content = cache.get(key)
+        if content is None:
+            cache_stats.record('fragments', misses=1)
+            content = self.nodelist.render(context)
+            cache.set(key, content, settings.FRAGMENT_CACHE_TIMEOUT)
+        else:
+            cache_stats.record('fragments', hits=1)
+        return content
+
+
+def missing_fragments(name, objects, vary_on):
+    """
+    The objects whose fragment ``name``, varied on ``vary_on(object)`` as in the
+    template, is not cached. Views load what only the fragment shows for these alone.
+    """
+    keys = [(obj, make_template_fragment_key(name, vary_on(obj))) for obj in objects]
+    cached = cache.get_many([key for _, key in keys])
+    return [obj for obj, key in keys if key not in cached]
+
+
+@register.tag
+def fragment(parser, token):
+    """
+    Like Django's {% cache %}, without a timeout argument and with hits and misses
+    counted under ``fragments``. Vary on the version stamps of the rows shown and on
+    any value that changes without one, such as rollup counts:
+
+        {% fragment "clinic_row" clinic.pk clinic.stamp clinic.doctor_count %}...{% endfragment %}
+    """
+    bits = token.split_contents()
+    if len(bits) < 2:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' tag requires at least a fragment name.")
+    nodelist = parser.parse(('endfragment',))
+    parser.delete_first_token()
+    return FragmentNode(nodelist, parser.compile_filter(bits[1]), [parser.compile_filter(bit) for bit in bits[2:]])
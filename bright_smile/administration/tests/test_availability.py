@@ -0,0 +1,215 @@
+import pickle
+from datetime import date, datetime, time, timedelta
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, Client
+from django.urls import reverse
+from django.utils import timezone
+
+from ..availability import afirst_available, aget_occupancy, cached_availability, is_bookable, SLOT_DURATION
+from ..caching import cache_stats
+from ..occupancy import DayOccupancy, any_free, common_free, contiguous, set_bits, span, to_bits
+from ..models import Clinic, Doctor, Patient, Specialty, DoctorClinicAffiliation, DoctorSchedule, Appointment
+
+
+def at(hour, minute=0, day=date(2024, 9, 2)):
+    return timezone.make_aware(datetime.combine(day, time(hour, minute)))
+
+
+class DayOccupancyTest(TestCase):
+
+    def build(self, hours, bookings=(), day=date(2024, 9, 2)):
+        return DayOccupancy.build(day, hours, list(bookings), SLOT_DURATION)
+
+    def test_slots_skip_overlapping_bookings(self):
+        occupancy = self.build([(time(9), time(10)), (time(13), time(14))], [at(9, 15), at(9, 40), at(13, 45)])
+        # 9:30 overlaps the unaligned 9:40 booking
+        self.assertEqual(occupancy.slot_times(), [at(9), at(13), at(13, 15), at(13, 30)])
+
+    def test_slots_fit_inside_window(self):
+        self.assertEqual(self.build([(time(9), time(9, 20))]).slot_times(), [at(9)])
+
+    def test_not_before(self):
+        self.assertEqual(self.build([(time(9), time(10))]).slot_times(not_before=at(9, 30)), [at(9, 30), at(9, 45)])
+        self.assertEqual(self.build([(time(9), time(10))]).slot_times(not_before=at(9, 31)), [at(9, 45)])
+
+    def test_slot_labels(self):
+        occupancy = self.build([(time(9), time(10)), (time(13), time(13, 30))], [at(9, 15)])
+        self.assertEqual(occupancy.slot_labels(), ['09:00', '09:30', '09:45', '13:00', '13:15'])
+        self.assertEqual(occupancy.slot_labels(not_before=at(9, 31)), ['09:45', '13:00', '13:15'])
+
+    def test_hours_round_inwards_and_bookings_outwards(self):
+        occupancy = self.build([(time(9, 2), time(10, 58))], [at(9, 31)])
+        self.assertEqual(occupancy.working, span(to_bits(timedelta(hours=9, minutes=5)), to_bits(timedelta(hours=10, minutes=55))))
+        self.assertEqual(occupancy.booked, span(9 * 12 + 6, 9 * 12 + 10))
+        self.assertEqual(occupancy.slot_times(), [at(9, 5), at(9, 50), at(10, 5), at(10, 20), at(10, 35)])
+
+    def test_booking_from_previous_day(self):
+        occupancy = self.build([(time(0), time(1))], [at(23, 50, date(2024, 9, 1))])
+        self.assertEqual(occupancy.slot_times()[0], at(0, 15))
+
+    def test_is_start(self):
+        occupancy = self.build([(time(9), time(10))], [at(9, 15)])
+        self.assertTrue(occupancy.is_start(at(9)))
+        self.assertFalse(occupancy.is_start(at(9, 15)))
+        self.assertFalse(occupancy.is_start(at(9, 5)))
+        self.assertFalse(occupancy.is_start(at(9, 30) + timedelta(seconds=1)))
+        self.assertFalse(occupancy.is_start(at(9, day=date(2024, 9, 3))))
+
+    def test_combining_doctors(self):
+        first = self.build([(time(9), time(11))], [at(9)])
+        second = self.build([(time(10), time(12))], [at(10, 30)])
+        both = common_free([first, second])
+        self.assertEqual(both, span(10 * 12, 10 * 12 + 6) | span(10 * 12 + 9, 11 * 12))
+        self.assertEqual(any_free([first, second]), span(9 * 12 + 3, 12 * 12))
+        # Starts of 45 free minutes for the second doctor
+        self.assertEqual(list(set_bits(contiguous(second.free, to_bits(timedelta(minutes=45))))),
+                         list(range(10 * 12 + 9, 10 * 12 + 16)))
+
+    def test_entry_is_small(self):
+        occupancy = self.build([(time(8), time(18))], [at(9), at(12, 30), at(16)])
+        self.assertLess(len(pickle.dumps(occupancy)), 300)
+
+
+class GetAvailabilityTest(TestCase):
+
+    def setUp(self):
+        self.specialty = Specialty.objects.create(name='Dentistry')
+        self.clinic = Clinic.objects.create(name='Clinic', phone_number='1', city='City', state='ST', email='c@test.com')
+        self.other_clinic = Clinic.objects.create(name='Other', phone_number='1', city='City', state='ST', email='o@test.com')
+        self.doctor = Doctor.objects.create(NPI='1234567890', name='Dr. Smith', email='d@test.com', phone_number='1')
+        self.patient = Patient.objects.create(name='John Doe', date_of_birth='1990-01-01', last_4_ssn='1234',
+                                              phone_number='1', gender='Male', address='Main St')
+        for clinic, day in ((self.clinic, 'Mon'), (self.other_clinic, 'Tue')):
+            affiliation = DoctorClinicAffiliation.objects.create(doctor=self.doctor, clinic=clinic, office_address='St')
+            DoctorSchedule.objects.create(affiliation=affiliation, day_of_week=day, start_time=time(9), end_time=time(10))
+
+    def test_range_uses_fixed_number_of_queries(self):
+        for week in range(4):
+            Appointment.objects.create(patient=self.patient, doctor=self.doctor, clinic=self.clinic, procedure=self.specialty,
+                                       date_time=at(9, 15, date(2024, 9, 2) + timedelta(weeks=week)))
+        pairs = [(self.doctor.id, self.clinic.id), (self.doctor.id, self.other_clinic.id)]
+        with self.assertNumQueries(2):
+            occupancy = async_to_sync(aget_occupancy)(pairs, date(2024, 9, 2), date(2024, 9, 30))
+
+        mondays = occupancy[self.doctor.id, self.clinic.id]
+        self.assertEqual(len(mondays), 4)
+        self.assertEqual(mondays[date(2024, 9, 9)].slot_labels(), ['09:00', '09:30', '09:45'])
+        self.assertEqual(len(occupancy[self.doctor.id, self.other_clinic.id][date(2024, 9, 3)].slot_labels()), 4)
+
+    def test_occupancy_of_working_days(self):
+        pairs = [(self.doctor.id, self.clinic.id), (self.doctor.id, self.other_clinic.id)]
+        with self.assertNumQueries(2):
+            occupancy = async_to_sync(aget_occupancy)(pairs, date(2024, 9, 2), date(2024, 9, 9))
+        self.assertEqual(list(occupancy[self.doctor.id, self.clinic.id]), [date(2024, 9, 2)])
+        self.assertEqual(occupancy[self.doctor.id, self.other_clinic.id][date(2024, 9, 3)].slot_labels(),
+                         ['09:00', '09:15', '09:30', '09:45'])
+
+    def test_doctor_busy_at_another_clinic(self):
+        # Monday hours at the second clinic overlap an appointment booked at the first
+        affiliation = DoctorClinicAffiliation.objects.get(doctor=self.doctor, clinic=self.other_clinic)
+        DoctorSchedule.objects.create(affiliation=affiliation, day_of_week='Mon', start_time=time(9), end_time=time(9, 30))
+        Appointment.objects.create(patient=self.patient, doctor=self.doctor, clinic=self.clinic, procedure=self.specialty,
+                                   date_time=at(9))
+        occupancy = async_to_sync(aget_occupancy)([(self.doctor.id, self.other_clinic.id)], date(2024, 9, 2), date(2024, 9, 3))
+        self.assertEqual(occupancy[self.doctor.id, self.other_clinic.id][date(2024, 9, 2)].slot_labels(), ['09:15'])
+
+    def test_first_available_merges_pairs(self):
+        Appointment.objects.create(patient=self.patient, doctor=self.doctor, clinic=self.clinic, procedure=self.specialty,
+                                   date_time=at(9))
+        pairs = [(self.doctor.id, self.other_clinic.id), (self.doctor.id, self.clinic.id)]
+        with self.assertNumQueries(2):
+            slots = async_to_sync(afirst_available)(pairs, date(2024, 9, 2), date(2024, 9, 30), 6)
+        self.assertEqual(slots, [
+            (at(9, 15), self.doctor.id, self.clinic.id),
+            (at(9, 30), self.doctor.id, self.clinic.id),
+            (at(9, 45), self.doctor.id, self.clinic.id),
+            (at(9, day=date(2024, 9, 3)), self.doctor.id, self.other_clinic.id),
+            (at(9, 15, date(2024, 9, 3)), self.doctor.id, self.other_clinic.id),
+            (at(9, 30, date(2024, 9, 3)), self.doctor.id, self.other_clinic.id),
+        ])
+
+
+class AvailabilityCacheTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        cache_stats.reset()
+        self.specialty = Specialty.objects.create(name='Dentistry')
+        self.clinic = Clinic.objects.create(name='Clinic', phone_number='1', city='City', state='ST', email='c@test.com')
+        self.doctor = Doctor.objects.create(NPI='1234567890', name='Dr. Smith', email='d@test.com', phone_number='1')
+        self.patient = Patient.objects.create(name='John Doe', date_of_birth='1990-01-01', last_4_ssn='1234',
+                                              phone_number='1', gender='Male', address='Main St')
+        self.affiliation = DoctorClinicAffiliation.objects.create(doctor=self.doctor, clinic=self.clinic, office_address='St')
+        self.schedule = DoctorSchedule.objects.create(affiliation=self.affiliation, day_of_week='Mon',
+                                                      start_time=time(9), end_time=time(10))
+        self.monday, self.next_monday = date(2024, 9, 2), date(2024, 9, 9)
+
+    def read(self):
+        availability = cached_availability(self.doctor.id, self.clinic.id, self.monday, self.monday + timedelta(weeks=2))
+        return {day: occupancy and occupancy.slot_times() for day, occupancy in availability.items()}
+
+    def book(self, date_time):
+        return Appointment.objects.create(patient=self.patient, doctor=self.doctor, clinic=self.clinic,
+                                          procedure=self.specialty, date_time=date_time)
+
+    def test_hit_costs_one_query(self):
+        first = self.read()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.read(), first)
+        self.assertEqual(len(first[self.monday]), 4)
+        self.assertIsNone(first[self.monday + timedelta(days=1)])
+        self.assertEqual(cache_stats.snapshot()['availability'], {'hits': 14, 'misses': 14, 'hit_ratio': 0.5})
+
+    def test_booking_invalidates_only_its_day(self):
+        self.read()
+        self.book(at(9, 15))
+        availability = self.read()
+        self.assertEqual(availability[self.monday], [at(9), at(9, 30), at(9, 45)])
+        self.assertEqual(cache_stats.snapshot()['availability']['misses'], 15)
+
+    def test_moving_and_cancelling_a_booking(self):
+        appointment = self.book(at(9))
+        self.read()
+        appointment.date_time = at(9, day=self.next_monday)
+        appointment.save()
+        availability = self.read()
+        self.assertEqual(len(availability[self.monday]), 4)
+        self.assertEqual(len(availability[self.next_monday]), 3)
+
+        appointment.delete()
+        self.assertEqual(len(self.read()[self.next_monday]), 4)
+
+    def test_booking_before_midnight_blocks_next_day(self):
+        DoctorSchedule.objects.create(affiliation=self.affiliation, day_of_week='Tue', start_time=time(0), end_time=time(1))
+        tuesday = self.monday + timedelta(days=1)
+        self.assertEqual(len(self.read()[tuesday]), 4)
+        self.book(at(23, 50))
+        self.assertEqual(self.read()[tuesday], [at(0, 15, tuesday), at(0, 30, tuesday), at(0, 45, tuesday)])
+
+    def test_schedule_and_affiliation_changes(self):
+        self.read()
+        self.schedule.end_time = time(11)
+        self.schedule.save()
+        self.assertEqual(len(self.read()[self.monday]), 8)
+
+        self.affiliation.delete()
+        self.assertIsNone(self.read()[self.monday])
+
+    def test_is_bookable(self):
+        self.book(at(9))
+        self.assertFalse(is_bookable(self.doctor.id, self.clinic.id, at(9)))
+        self.assertTrue(is_bookable(self.doctor.id, self.clinic.id, at(9, 15)))
+        self.assertFalse(is_bookable(self.doctor.id, self.clinic.id, at(10)))
+        with self.assertNumQueries(1):
+            self.assertTrue(is_bookable(self.doctor.id, self.clinic.id, at(9, 45)))
+
+    def test_cache_stats_endpoint_is_staff_only(self):
+        self.read()
+        client = Client()
+        User.objects.create_user(username='staff', password='12345', is_staff=True)
+        self.assertEqual(client.get(reverse('get_cache_stats')).status_code, 302)
+        client.login(username='staff', password='12345')
+        self.assertEqual(client.get(reverse('get_cache_stats')).json()['availability']['misses'], 14)
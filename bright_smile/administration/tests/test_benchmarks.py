@@ -0,0 +1,52 @@
+from django.db import transaction
+from django.test import TestCase
+
+from ..benchmarks import ENDPOINTS, Endpoint, Flow, FlowResult, Measurement, check_budgets, compare_flows, run_benchmarks
+
+
+class CheckBudgetsTest(TestCase):
+    endpoints = [Endpoint('clinic_list', None, 4, 100, 6)]
+
+    def test_within_budget(self):
+        measurements = [Measurement(1, 'clinic_list', 200, 4, 1.0, 20.0, 30.0, 6, 40.0),
+                        Measurement(10, 'clinic_list', 200, 4, 1.5, 60.0, 120.0, 6, 150.0)]
+        self.assertEqual(check_budgets(measurements, self.endpoints), [])
+
+    def test_violations(self):
+        measurements = [Measurement(10, 'clinic_list', 200, 9, 1.0, 150.0, 160.0, 6, 200.0),
+                        Measurement(1, 'clinic_list', 500, 3, 1.0, 20.0, 30.0, 5, 40.0)]
+        self.assertEqual(check_budgets(measurements, self.endpoints), [
+            'clinic_list at 10x ran 9 queries, budget 4',
+            'clinic_list at 10x took 150.0ms, budget 100ms',
+            'clinic_list at 10x ran 9 queries, 3 at 1x',
+            'clinic_list at 10x ran 6 queries cold, 5 at 1x',
+            'clinic_list at 1x returned 500',
+        ])
+
+    def test_cold_budget(self):
+        measurements = [Measurement(1, 'clinic_list', 200, 4, 1.0, 20.0, 30.0, 12, 40.0)]
+        self.assertEqual(check_budgets(measurements, self.endpoints), ['clinic_list at 1x ran 12 queries cold, budget 6'])
+
+
+class CompareFlowsTest(TestCase):
+
+    def test_adds_up_each_flow(self):
+        flows = [Flow('cascade', ['a', 'b']), Flow('bootstrap', ['c']), Flow('unmeasured', ['d'])]
+        measurements = [Measurement(1, 'a', 200, 1, 1.0, 4.0, 5.0, 1, 5.0), Measurement(1, 'b', 200, 2, 1.0, 6.0, 7.0, 2, 7.0),
+                        Measurement(1, 'c', 200, 3, 1.0, 8.0, 9.0, 3, 9.0)]
+        self.assertEqual(compare_flows(measurements, flows=flows), [
+            FlowResult(1, 'cascade', 2, 3, 10.0),
+            FlowResult(1, 'bootstrap', 1, 3, 8.0),
+        ])
+
+
+class RunBenchmarksTest(TestCase):
+
+    def test_endpoints_within_budget_at_two_scales(self):
+        savepoint = transaction.savepoint()
+        measurements = [result for _, results in run_benchmarks(
+            scales=(1, 2), repeat=1, reset=lambda: transaction.savepoint_rollback(savepoint)) for result in results]
+        self.assertEqual(len(measurements), 2 * len(ENDPOINTS))
+        # Latency is left to the run_benchmarks command; a loaded test machine makes it flaky here
+        violations = [violation for violation in check_budgets(measurements) if 'ms, budget' not in violation]
+        self.assertEqual(violations, [])
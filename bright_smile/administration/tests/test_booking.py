@@ -0,0 +1,147 @@
+import random
+import time as clock
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, time, timedelta
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import connection, OperationalError
+from django.test import TestCase, TransactionTestCase, Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from ..booking import book_appointment
+from ..models import Clinic, Doctor, Patient, Specialty, DoctorClinicAffiliation, DoctorSchedule, Appointment, \
+    ClinicPatientLink
+from ..rollups import refresh_event, verify_rollups
+
+MONDAY = date(2024, 9, 2)
+
+
+def at(hour, minute=0, day=MONDAY):
+    return timezone.make_aware(datetime.combine(day, time(hour, minute)))
+
+
+class BookingFixture:
+
+    def create_fixture(self, patients=2):
+        cache.clear()
+        self.specialty = Specialty.objects.create(name='Dentistry')
+        self.clinic = Clinic.objects.create(name='Clinic', phone_number='1', city='City', state='ST', email='c@test.com')
+        self.other_clinic = Clinic.objects.create(name='Other', phone_number='1', city='City', state='ST', email='o@test.com')
+        self.doctor = Doctor.objects.create(NPI='1234567890', name='Dr. Smith', email='d@test.com', phone_number='1')
+        self.other_doctor = Doctor.objects.create(NPI='1111111111', name='Dr. Jones', email='j@test.com', phone_number='1')
+        for doctor in (self.doctor, self.other_doctor):
+            doctor.specialties.add(self.specialty)
+            affiliation = DoctorClinicAffiliation.objects.create(doctor=doctor, clinic=self.clinic, office_address='St')
+            DoctorSchedule.objects.create(affiliation=affiliation, day_of_week='Mon', start_time=time(9), end_time=time(17))
+        self.patients = [Patient.objects.create(name=f'Patient {i}', date_of_birth='1990-01-01', last_4_ssn='1234',
+                                                phone_number='1', gender='Male', address='Main St') for i in range(patients)]
+        self.patient = self.patients[0]
+
+    def appointment(self, date_time, patient=None, doctor=None, clinic=None):
+        return Appointment(patient=patient or self.patient, doctor=doctor or self.doctor, clinic=clinic or self.clinic,
+                           procedure=self.specialty, date_time=date_time)
+
+
+class BookAppointmentTest(BookingFixture, TestCase):
+
+    def setUp(self):
+        self.create_fixture()
+
+    def assertRejected(self, appointment, code):
+        with self.assertRaises(ValidationError) as raised:
+            book_appointment(appointment)
+        self.assertEqual(raised.exception.code, code)
+
+    def test_books_free_slot(self):
+        book_appointment(self.appointment(at(9)))
+        self.assertEqual(Appointment.objects.count(), 1)
+
+    def test_rejects_out_of_schedule(self):
+        self.assertRejected(self.appointment(at(8, 45)), 'out_of_schedule')
+        self.assertRejected(self.appointment(at(9, day=MONDAY + timedelta(days=1))), 'out_of_schedule')
+        self.assertRejected(self.appointment(at(9, 5)), 'out_of_schedule')
+        self.assertRejected(self.appointment(at(9), clinic=self.other_clinic), 'out_of_schedule')
+        self.assertFalse(Appointment.objects.exists())
+
+    def test_rejects_doctor_conflict(self):
+        book_appointment(self.appointment(at(9)))
+        self.assertRejected(self.appointment(at(9), patient=self.patients[1]), 'slot_taken')
+        # Booked at another clinic by a direct insert
+        Appointment.objects.create(patient=self.patients[1], doctor=self.doctor, clinic=self.other_clinic,
+                                   procedure=self.specialty, date_time=at(10, 5))
+        self.assertRejected(self.appointment(at(10), patient=self.patients[1]), 'slot_taken')
+        self.assertEqual(Appointment.objects.count(), 2)
+
+    def test_rejects_patient_conflict(self):
+        book_appointment(self.appointment(at(9)))
+        self.assertRejected(self.appointment(at(9), doctor=self.other_doctor), 'patient_busy')
+        book_appointment(self.appointment(at(9, 15), doctor=self.other_doctor))
+
+    def test_rollups_refresh_after_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks, CaptureQueriesContext(connection) as context:
+            book_appointment(self.appointment(at(9)))
+        self.assertFalse([query for query in context.captured_queries
+                          if 'rollup' in query['sql'] or 'patientlink' in query['sql']])
+        for callback in callbacks:
+            callback()
+        self.assertTrue(ClinicPatientLink.objects.filter(clinic=self.clinic, patient=self.patient).exists())
+        self.assertEqual(verify_rollups(), [])
+
+    def test_view_reports_conflict(self):
+        book_appointment(self.appointment(at(9)))
+        response = Client().post(reverse('schedule_appointment', args=[self.patients[1].id]), {
+            'procedure': self.specialty.id, 'clinic': self.clinic.id, 'doctor': self.doctor.id,
+            'date_time': '2024-09-02T09:00:00',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'That slot has just been booked.')
+        self.assertEqual(Appointment.objects.count(), 1)
+
+
+class ConcurrentBookingTest(BookingFixture, TransactionTestCase):
+    """
+    Many clerks booking the same few slots at once: every slot ends up booked exactly once.
+    """
+    attempts = 200
+    workers = 16
+
+    def setUp(self):
+        self.create_fixture(patients=self.attempts)
+
+    def attempt(self, index):
+        slot = at(9) + timedelta(minutes=15 * (index % 8))
+        # Both doctors work at the same clinic, so their bookings share its rollup row
+        doctor = (self.doctor, self.other_doctor)[index // 8 % 2]
+        booked = None
+        try:
+            for _ in range(1000):
+                try:
+                    if booked is None or not Appointment.objects.filter(pk=booked.pk).exists():
+                        booked = self.appointment(slot, patient=self.patients[index], doctor=doctor)
+                        book_appointment(booked)
+                    else:
+                        # Committed, but the rollup refresh after the commit hit the lock
+                        refresh_event(booked.patient_id, booked.doctor_id, booked.clinic_id)
+                    return True
+                except OperationalError:
+                    # SQLite's shared in-memory test database reports a locked table instead of waiting
+                    clock.sleep(random.uniform(0, 0.005))
+            raise AssertionError('Booking never got the database lock')
+        except ValidationError:
+            return False
+        finally:
+            connection.close()
+
+    def test_parallel_bookings_never_double_book(self):
+        with ThreadPoolExecutor(self.workers) as pool:
+            results = list(pool.map(self.attempt, range(self.attempts)))
+
+        # Eight slots for each of the two doctors
+        self.assertEqual(sum(results), 16)
+        self.assertEqual(Appointment.objects.count(), 16)
+        self.assertEqual(Appointment.objects.values('doctor', 'date_time').distinct().count(), 16)
+        self.assertEqual(ClinicPatientLink.objects.filter(clinic=self.clinic).count(), 16)
+        self.assertEqual(verify_rollups(), [])
@@ -0,0 +1,104 @@
+import sys
+import time
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from ..models import Clinic, Doctor, Specialty, DoctorRollup, PatientRollup
+
+
+def doctor_data(index, specialties=('Dentistry',)):
+    return {'NPI': f'{index:010d}', 'name': f'Dr. {index}', 'email': f'dr{index}@example.com',
+            'phone_number': '555-555-5557', 'specialties': list(specialties)}
+
+
+def patient_data(index):
+    return {'name': f'Patient {index}', 'date_of_birth': '1990-01-01', 'last_4_ssn': '1234',
+            'phone_number': '555-555-5555', 'gender': 'Male', 'address': '123 Main St'}
+
+
+class BulkCreateTest(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(username='staff', password='12345', is_staff=True))
+        Specialty.objects.create(name='Dentistry')
+        Specialty.objects.create(name='Root Canal')
+        Doctor.objects.create(NPI='9999999999', name='Dr. Existing', email='e@example.com', phone_number='1')
+
+    def post(self, name, items, **params):
+        url = reverse(f'{name}-list')
+        if params:
+            url += '?' + '&'.join(f'{key}={value}' for key, value in params.items())
+        return self.client.post(url, items, format='json')
+
+    def test_doctors_with_per_item_errors(self):
+        response = self.post('doctor', [
+            doctor_data(1, ('Dentistry', 'Root Canal')),
+            doctor_data(2, ('Surgery',)),
+            doctor_data(3),
+            doctor_data(1),
+            doctor_data(9999999999),
+            {'name': 'No NPI'},
+        ])
+        self.assertEqual(response.status_code, 207)
+        body = response.json()
+        self.assertEqual(body['created'], 2)
+        results = body['results']
+        self.assertEqual([result['index'] for result in results], [0, 1, 2, 3, 4, 5])
+        self.assertIn('specialties', results[1]['errors'])
+        self.assertIn('NPI', results[3]['errors'])
+        self.assertIn('NPI', results[4]['errors'])
+        self.assertIn('NPI', results[5]['errors'])
+
+        doctor = Doctor.objects.get(pk=results[0]['id'])
+        self.assertEqual(sorted(doctor.specialties.values_list('name', flat=True)), ['Dentistry', 'Root Canal'])
+        self.assertTrue(DoctorRollup.objects.filter(doctor=doctor).exists())
+        self.assertEqual(Doctor.objects.count(), 3)
+
+    def test_atomic_batch_rejected_as_a_whole(self):
+        response = self.post('doctor', [doctor_data(1), doctor_data(2, ('Surgery',))], atomic='true')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['created'], 0)
+        self.assertEqual(Doctor.objects.count(), 1)
+
+    def test_query_count_does_not_grow_with_batch(self):
+        # Savepoint, specialties, NPI check, doctors, specialty rows, rollups, two for version stamps, release
+        with self.assertNumQueries(9):
+            self.post('doctor', [doctor_data(index) for index in range(10)])
+        with self.assertNumQueries(9):
+            self.assertEqual(self.post('doctor', [doctor_data(index) for index in range(10, 210)]).status_code, 201)
+        self.assertEqual(Doctor.objects.filter(specialties__name='Dentistry').count(), 210)
+
+    def test_patients_and_clinics(self):
+        response = self.post('patient', [patient_data(index) for index in range(3)])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(PatientRollup.objects.count(), 3)
+
+        response = self.post('clinic', [{'name': 'Downtown', 'phone_number': '1', 'city': 'NY', 'state': 'NY',
+                                         'email': 'not-an-email'}])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('email', response.json()['results'][0]['errors'])
+        self.assertFalse(Clinic.objects.exists())
+
+    def test_single_object_path_unchanged(self):
+        response = self.post('doctor', doctor_data(1))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['specialties'], ['Dentistry'])
+
+    def test_throughput_against_single_posts(self):
+        count = 200
+        started = time.perf_counter()
+        for index in range(count):
+            self.post('doctor', doctor_data(index))
+        single = count / (time.perf_counter() - started)
+
+        started = time.perf_counter()
+        self.post('doctor', [doctor_data(index) for index in range(count, 2 * count)])
+        bulk = count / (time.perf_counter() - started)
+
+        self.assertEqual(Doctor.objects.count(), 2 * count + 1)
+        self.assertGreater(bulk, single)
+        sys.stderr.write(f'\nDoctor create: {single:.0f}/s one per POST, {bulk:.0f}/s in one bulk POST\n')
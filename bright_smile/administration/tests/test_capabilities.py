@@ -0,0 +1,117 @@
+from unittest import mock
+
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..caching import bump_many, table_version_key
+from ..capabilities import CapabilityIndex, capability_index
+from ..forms import AppointmentForm, VisitForm
+from ..models import Clinic, Doctor, Specialty, DoctorClinicAffiliation, DoctorSchedule
+
+
+class CapabilityIndexTest(TestCase):
+
+    def setUp(self):
+        self.cleaning = Specialty.objects.create(name='Cleaning')
+        self.filling = Specialty.objects.create(name='Filling')
+        self.downtown = Clinic.objects.create(name='Downtown', phone_number='1', city='City', state='ST', email='d@example.com')
+        self.uptown = Clinic.objects.create(name='Uptown', phone_number='1', city='City', state='ST', email='u@example.com')
+        self.smith = Doctor.objects.create(NPI='1234567890', name='Dr. Smith', email='s@example.com', phone_number='1')
+        self.jones = Doctor.objects.create(NPI='1234567891', name='Dr. Jones', email='j@example.com', phone_number='1')
+        self.smith.specialties.add(self.cleaning, self.filling)
+        self.jones.specialties.add(self.filling)
+        affiliation = DoctorClinicAffiliation.objects.create(doctor=self.smith, clinic=self.downtown, office_address='1')
+        DoctorClinicAffiliation.objects.create(doctor=self.jones, clinic=self.downtown, office_address='2')
+        DoctorClinicAffiliation.objects.create(doctor=self.jones, clinic=self.uptown, office_address='3')
+        DoctorSchedule.objects.create(affiliation=affiliation, day_of_week='Mon', start_time='09:00', end_time='17:00')
+
+    def test_graph(self):
+        with self.assertNumQueries(6):
+            index = CapabilityIndex.load()
+        self.assertEqual(index.procedure_choices(), [(self.cleaning.id, 'Cleaning'), (self.filling.id, 'Filling')])
+        self.assertEqual(index.clinics_offering(self.cleaning.id), [(self.downtown.id, 'Downtown')])
+        self.assertEqual(index.clinics_offering(str(self.filling.id)), [(self.downtown.id, 'Downtown'), (self.uptown.id, 'Uptown')])
+        self.assertEqual(index.doctors_at(self.downtown.id), [(self.smith.id, 'Dr. Smith'), (self.jones.id, 'Dr. Jones')])
+        self.assertEqual(index.doctors_at(self.downtown.id, self.cleaning.id), [(self.smith.id, 'Dr. Smith')])
+        self.assertEqual(index.specialties_of(self.jones.id), [(self.filling.id, 'Filling')])
+        self.assertEqual([schedule.day_of_week for schedule in index.affiliation(self.smith.id, self.downtown.id).schedules],
+                         ['Mon'])
+        self.assertIsNone(index.affiliation(self.smith.id, self.uptown.id))
+        self.assertEqual(index.doctors_at('x'), [])
+
+    @override_settings(CAPABILITY_INDEX_MAX_AGE=60)
+    def test_forms_run_no_sql_once_loaded(self):
+        capability_index.get()
+        data = {'procedure': self.cleaning.id, 'clinic': self.downtown.id, 'doctor': self.smith.id,
+                'date_time': '2024-01-01T10:00'}
+        with self.assertNumQueries(0):
+            AppointmentForm().as_p()
+            VisitForm().as_p()
+        # Submitted forms check the index's stamps
+        with self.assertNumQueries(2):
+            form = AppointmentForm(data=data)
+            visit_form = VisitForm(data={'clinic': self.uptown.id, 'doctor': self.jones.id})
+        self.assertEqual(list(form.fields['clinic'].choices), [('', '---------'), (self.downtown.id, 'Downtown')])
+        self.assertEqual(list(visit_form.fields['procedures_done'].choices), [(self.filling.id, 'Filling')])
+
+        # Model validation still confirms the chosen rows exist
+        self.assertTrue(form.is_valid())
+        self.assertEqual(form.cleaned_data['doctor'].name, 'Dr. Smith')
+        self.assertEqual(form.cleaned_data['doctor'].email, 's@example.com')
+
+    def test_form_rejects_pairs_outside_the_index(self):
+        form = AppointmentForm(data={'procedure': self.cleaning.id, 'clinic': self.uptown.id, 'doctor': self.jones.id,
+                                     'date_time': '2024-01-01T10:00'})
+        self.assertFalse(form.is_valid())
+        self.assertIn('clinic', form.errors)
+        self.assertIn('doctor', form.errors)
+
+    @override_settings(CAPABILITY_INDEX_MAX_AGE=60)
+    def test_submitted_forms_reject_rows_deleted_elsewhere(self):
+        capability_index.get()
+        filling_id = self.filling.id
+        # Deleted by another worker, so this one's index is not expired
+        with mock.patch.object(capability_index, 'expire'):
+            self.filling.delete()
+        self.assertIn((filling_id, 'Filling'), capability_index.get().specialties_of(self.jones.id))
+
+        # Model validation does not check many-to-many rows, so saving would fail on the foreign key
+        form = VisitForm(data={'clinic': self.uptown.id, 'doctor': self.jones.id, 'procedures_done': [filling_id],
+                               'date_time': '2024-01-01T10:00'})
+        self.assertFalse(form.is_valid())
+        self.assertIn('procedures_done', form.errors)
+
+    @override_settings(CAPABILITY_INDEX_MAX_AGE=60)
+    def test_refreshes_on_writes(self):
+        capability_index.get()
+        self.jones.specialties.add(self.cleaning)
+        self.assertEqual(capability_index.get().clinics_offering(self.cleaning.id),
+                         [(self.downtown.id, 'Downtown'), (self.uptown.id, 'Uptown')])
+
+        # Another worker's write is noticed once the index is due a check
+        Clinic.objects.filter(pk=self.uptown.pk).update(name='Midtown')
+        bump_many([table_version_key(Clinic)])
+        self.assertEqual(capability_index.get().clinics[self.uptown.id], 'Uptown')
+        with override_settings(CAPABILITY_INDEX_MAX_AGE=0):
+            self.assertEqual(capability_index.get().clinics[self.uptown.id], 'Midtown')
+
+    def test_lookups_answer_from_the_index(self):
+        capability_index.get()
+        for name, params in [
+            ('get_clinics', {'procedure_id': self.filling.id}),
+            ('get_doctors', {'clinic_id': self.downtown.id}),
+            ('get_specialties', {'doctor_id': self.smith.id}),
+            ('get_doctors_with_clinic_and_procedure', {'clinic_id': self.downtown.id, 'procedure_id': self.filling.id}),
+            ('get_doctor_schedule', {'doctor_id': self.smith.id, 'clinic_id': self.downtown.id}),
+        ]:
+            with self.subTest(name):
+                with CaptureQueriesContext(connection) as context:
+                    response = self.client.get(reverse(name), params)
+                self.assertEqual(response.status_code, 200)
+                # Only the version stamps, which the index reuses
+                self.assertEqual(len(context.captured_queries), 1)
+
+        response = self.client.get(reverse('get_doctor_schedule'), {'doctor_id': self.smith.id, 'clinic_id': self.uptown.id})
+        self.assertEqual(response.status_code, 404)
@@ -0,0 +1,158 @@
+import shutil
+import tempfile
+
+from django.core.cache import cache
+from django.db import connection
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from ..caching import cache_stats
+from ..models import Clinic, Doctor, Patient, Specialty, DoctorClinicAffiliation, DoctorSchedule, ChangeCounter
+
+
+class ConditionalGetTest(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(username='staff', password='12345', is_staff=True))
+        self.specialty = Specialty.objects.create(name='Cleaning')
+        self.clinic = Clinic.objects.create(name='Downtown', phone_number='1', city='City', state='ST', email='c@example.com')
+        self.doctor = Doctor.objects.create(NPI='1234567890', name='Dr. Smith', email='d@example.com', phone_number='1')
+        self.doctor.specialties.add(self.specialty)
+        self.affiliation = DoctorClinicAffiliation.objects.create(doctor=self.doctor, clinic=self.clinic, office_address='1')
+        DoctorSchedule.objects.create(affiliation=self.affiliation, day_of_week='Mon', start_time='09:00', end_time='17:00')
+        Patient.objects.create(name='John Doe', date_of_birth='1990-01-01', last_4_ssn='1234', phone_number='1',
+                               gender='Male', address='1 Main St')
+
+    def revalidate(self, url, params=None):
+        """
+        (first response, queries of a revalidation with its ETag, revalidation response)
+        """
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('ETag', response)
+        self.assertIn('Last-Modified', response)
+        with CaptureQueriesContext(connection) as context:
+            revalidated = self.client.get(url, params, HTTP_IF_NONE_MATCH=response['ETag'])
+        return response, context.captured_queries, revalidated
+
+    def test_lookups_answer_304_with_one_query(self):
+        for name, params in [
+            ('get_clinics', {'procedure_id': self.specialty.id}),
+            ('get_doctors', {'clinic_id': self.clinic.id}),
+            ('get_specialties', {'doctor_id': self.doctor.id}),
+            ('get_doctors_with_clinic_and_procedure', {'clinic_id': self.clinic.id, 'procedure_id': self.specialty.id}),
+            ('get_doctor_schedule', {'doctor_id': self.doctor.id, 'clinic_id': self.clinic.id}),
+        ]:
+            with self.subTest(name):
+                _, queries, revalidated = self.revalidate(reverse(name), params)
+                self.assertEqual(revalidated.status_code, 304)
+                self.assertEqual(len(queries), 1)
+                self.assertIn('administration_changecounter', queries[0]['sql'])
+
+    def test_etag_varies_with_query_string(self):
+        first = self.client.get(reverse('get_doctors'), {'clinic_id': self.clinic.id})
+        other = self.client.get(reverse('get_doctors'), {'clinic_id': self.clinic.id + 1})
+        self.assertNotEqual(first['ETag'], other['ETag'])
+
+    def test_writes_change_the_etag(self):
+        url, params = reverse('get_specialties'), {'doctor_id': self.doctor.id}
+        etag = self.client.get(url, params)['ETag']
+        self.doctor.specialties.add(Specialty.objects.create(name='Filling'))
+        response = self.client.get(url, params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 2)
+
+        url, params = reverse('get_doctor_schedule'), {'doctor_id': self.doctor.id, 'clinic_id': self.clinic.id}
+        etag = self.client.get(url, params)['ETag']
+        DoctorSchedule.objects.create(affiliation=self.affiliation, day_of_week='Tue', start_time='09:00', end_time='12:00')
+        self.assertEqual(self.client.get(url, params, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        url = reverse('get_clinics')
+        etag = self.client.get(url, {'procedure_id': self.specialty.id})['ETag']
+        self.clinic.name = 'Uptown'
+        self.clinic.save()
+        response = self.client.get(url, {'procedure_id': self.specialty.id}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.json(), [{'id': self.clinic.id, 'name': 'Uptown'}])
+
+    def test_rest_lists_and_details(self):
+        for url in [reverse('clinic-list'), reverse('doctor-list'), reverse('specialty-list'),
+                    reverse('doctor-detail', args=[self.doctor.id])]:
+            with self.subTest(url):
+                _, queries, revalidated = self.revalidate(url)
+                self.assertEqual(revalidated.status_code, 304)
+                self.assertEqual(len(queries), 1)
+
+        etag = self.client.get(reverse('doctor-list'))['ETag']
+        DoctorClinicAffiliation.objects.filter(pk=self.affiliation.pk).get().delete()
+        response = self.client.get(reverse('doctor-list'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.json()['results'][0]['affiliations'], [])
+
+    def test_bulk_create_changes_the_etag(self):
+        url = reverse('clinic-list')
+        etag = self.client.get(url)['ETag']
+        self.client.post(url, [{'name': 'New', 'phone_number': '1', 'city': 'C', 'state': 'S', 'email': 'n@example.com'}],
+                         format='json')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_patients_have_no_validators(self):
+        for params in [{}, {'doctor': self.doctor.id}]:
+            response = self.client.get(reverse('patient-list'), params)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('ETag', response)
+
+    def test_patient_writes_bump_no_stamp(self):
+        with CaptureQueriesContext(connection) as context:
+            Patient.objects.create(name='Jane Doe', date_of_birth='1990-01-01', last_4_ssn='1234', phone_number='1',
+                                   gender='Female', address='1 Main St')
+        self.assertFalse([query for query in context.captured_queries if ChangeCounter._meta.db_table in query['sql']])
+
+
+class LookupCacheTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        cache_stats.reset()
+        self.specialty = Specialty.objects.create(name='Cleaning')
+        self.clinic = Clinic.objects.create(name='Downtown', phone_number='1', city='City', state='ST', email='c@example.com')
+        self.doctor = Doctor.objects.create(NPI='1234567890', name='Dr. Smith', email='d@example.com', phone_number='1')
+        self.doctor.specialties.add(self.specialty)
+        DoctorClinicAffiliation.objects.create(doctor=self.doctor, clinic=self.clinic, office_address='1')
+
+    def check_read_through(self):
+        url, params = reverse('get_doctors_with_clinic_and_procedure'), {'clinic_id': self.clinic.id,
+                                                                          'procedure_id': self.specialty.id}
+        first = self.client.get(url, params)
+        with CaptureQueriesContext(connection) as context:
+            second = self.client.get(url, params)
+        self.assertEqual(len(context.captured_queries), 1)
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second['Content-Type'], 'application/json')
+        self.assertEqual(second['ETag'], first['ETag'])
+
+        self.doctor.specialties.remove(self.specialty)
+        self.assertEqual(self.client.get(url, params).json(), [])
+        self.assertEqual(cache_stats.snapshot()['lookups'], {'hits': 1, 'misses': 2, 'hit_ratio': 0.3333})
+
+    def test_local_memory_backend(self):
+        self.check_read_through()
+
+    def test_file_backend(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                                                   'LOCATION': directory}}):
+            self.check_read_through()
+
+    def test_only_writes_to_indexed_tables_miss(self):
+        url, params = reverse('get_doctors'), {'clinic_id': self.clinic.id}
+        self.client.get(url, params)
+        Patient.objects.create(name='John Doe', date_of_birth='1990-01-01', last_4_ssn='1234', phone_number='1',
+                               gender='Male', address='1 Main St')
+        self.client.get(url, params)
+        Clinic.objects.create(name='Uptown', phone_number='1', city='City', state='ST', email='u@example.com')
+        self.client.get(url, params)
+        self.assertEqual(cache_stats.snapshot()['lookups'], {'hits': 1, 'misses': 2, 'hit_ratio': 0.3333})
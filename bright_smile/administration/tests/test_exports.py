@@ -0,0 +1,81 @@
+import csv
+import io
+import json
+from datetime import datetime, timedelta
+
+from django.contrib.auth.models import User
+from django.test import TestCase, Client
+from django.urls import reverse
+from django.utils import timezone
+
+from ..exports import export_chunks
+from ..models import Clinic, Doctor, Patient, Specialty, Visit, Appointment
+
+
+class ExportTest(TestCase):
+
+    def setUp(self):
+        User.objects.create_user(username='testuser', password='testpass')
+        self.client = Client()
+        self.client.login(username='testuser', password='testpass')
+
+        self.cleaning = Specialty.objects.create(name='Cleaning')
+        self.filling = Specialty.objects.create(name='Filling')
+        self.clinic = Clinic.objects.create(name='Downtown', phone_number='1', city='City', state='ST', email='c@test.com')
+        self.other_clinic = Clinic.objects.create(name='Uptown', phone_number='1', city='City', state='ST', email='u@test.com')
+        self.doctor = Doctor.objects.create(NPI='1234567890', name='Dr. Smith', email='d@test.com', phone_number='1')
+        self.start = timezone.make_aware(datetime(2024, 9, 2, 9))
+        self.patients = []
+        for index in range(5):
+            patient = Patient.objects.create(name=f'Patient {index}', date_of_birth='1990-01-01', last_4_ssn='1234',
+                                             phone_number='1', gender='Female', address='Main St, Apt "4"')
+            clinic = self.clinic if index < 4 else self.other_clinic
+            visit = Visit.objects.create(patient=patient, doctor=self.doctor, clinic=clinic,
+                                         date_time=self.start + timedelta(days=index))
+            visit.procedures_done.add(self.cleaning, self.filling)
+            Appointment.objects.create(patient=patient, doctor=self.doctor, clinic=clinic, procedure=self.filling,
+                                       date_time=self.start + timedelta(days=30 + index))
+            self.patients.append(patient)
+
+    def export(self, resource, **params):
+        response = self.client.get(reverse('export_data', args=[resource]), params)
+        self.assertEqual(response.status_code, 200)
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_visits_csv(self):
+        response, content = self.export('visits')
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="visits.csv"')
+        rows = list(csv.DictReader(io.StringIO(content)))
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[0]['patient_name'], 'Patient 0')
+        self.assertEqual(rows[0]['clinic_name'], 'Downtown')
+        self.assertEqual(rows[0]['procedures'], 'Cleaning; Filling')
+        self.assertEqual(rows[0]['date_time'], self.start.isoformat())
+
+    def test_appointments_ndjson_with_filters(self):
+        _, content = self.export('appointments', format='ndjson', clinic_id=self.clinic.id,
+                                 start='2024-10-03', end='2024-10-04')
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual([row['patient_name'] for row in rows], ['Patient 1', 'Patient 2'])
+        self.assertEqual(rows[0]['procedure'], 'Filling')
+
+    def test_patients_filtered_by_clinic(self):
+        _, content = self.export('patients', clinic_id=self.other_clinic.id)
+        rows = list(csv.DictReader(io.StringIO(content)))
+        self.assertEqual([row['name'] for row in rows], ['Patient 4'])
+        self.assertEqual(rows[0]['address'], 'Main St, Apt "4"')
+        self.assertNotIn('last_4_ssn', rows[0])
+
+    def test_queries_per_chunk_not_per_row(self):
+        # One streamed query for the rows, plus one procedures query per chunk of two
+        with self.assertNumQueries(4):
+            chunks = list(export_chunks('visits', chunk_size=2))
+        self.assertEqual([len(chunk) for chunk in chunks], [2, 2, 1])
+        self.assertEqual(chunks[2][0]['procedures'], ['Cleaning', 'Filling'])
+
+    def test_invalid_requests(self):
+        self.assertEqual(self.client.get(reverse('export_data', args=['doctors'])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('export_data', args=['visits']), {'format': 'xml'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('export_data', args=['visits']), {'start': '2024-13-01'}).status_code, 400)
+        self.assertEqual(Client().get(reverse('export_data', args=['visits'])).status_code, 302)
@@ -0,0 +1,110 @@
+import csv
+import os
+import tempfile
+from datetime import date
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import SimpleTestCase, TestCase
+
+from ..availability import bookings_version_key
+from ..caching import get_versions
+from ..importer import _copy_csv, import_history
+from ..models import Clinic, Doctor, Patient, Specialty, Visit, Appointment, DoctorRollup, PatientRollup
+
+HEADER = ['date_time', 'doctor_npi', 'clinic_name', 'patient_name', 'patient_date_of_birth', 'patient_last_4_ssn',
+          'procedures', 'procedure', 'doctor_notes']
+
+
+class ImportHistoryTest(TestCase):
+
+    def setUp(self):
+        Specialty.objects.create(name='Cleaning')
+        Specialty.objects.create(name='Filling')
+        self.clinic = Clinic.objects.create(name='Downtown', phone_number='1', city='City', state='ST', email='c@test.com')
+        self.doctor = Doctor.objects.create(NPI='1234567890', name='Dr. Smith', email='d@test.com', phone_number='1')
+        for name in ('Jane Doe', 'John Doe'):
+            Patient.objects.create(name=name, date_of_birth='1990-01-01', last_4_ssn='1234',
+                                   phone_number='1', gender='Female', address='Main St')
+        handle, self.path = tempfile.mkstemp(suffix='.csv')
+        os.close(handle)
+        self.addCleanup(os.remove, self.path)
+
+    def write(self, rows):
+        with open(self.path, 'w', newline='') as target:
+            writer = csv.writer(target)
+            writer.writerow(HEADER)
+            writer.writerows(rows)
+
+    def row(self, day, patient='Jane Doe', npi='1234567890', procedures='Cleaning; Filling', procedure='Filling'):
+        return [f'2024-09-{day:02d} 09:00', npi, 'Downtown', patient, '1990-01-01', '1234', procedures, procedure, 'Notes']
+
+    def run_command(self, *args):
+        out = StringIO()
+        call_command('import_history', self.path, *args, stdout=out, stderr=StringIO())
+        return out.getvalue()
+
+    def test_import_visits_with_rejects(self):
+        self.write([self.row(1), self.row(2, patient='Nobody'), self.row(3, npi='0000000000'),
+                    self.row(4, procedures='Surgery'), self.row(5, patient='John Doe', procedures='')])
+        rejects = self.path + '.rejects'
+        self.addCleanup(os.remove, rejects)
+        output = self.run_command('--kind', 'visits', '--batch-size', '2', '--rejects', rejects)
+
+        self.assertIn('Imported 2 visits (3 rejected)', output)
+        self.assertIn('rows/s', output)
+        self.assertEqual(Visit.objects.count(), 2)
+        self.assertEqual(sorted(Visit.objects.get(patient__name='Jane Doe').procedures_done.values_list('name', flat=True)),
+                         ['Cleaning', 'Filling'])
+        with open(rejects) as source:
+            self.assertEqual([line for line, _ in csv.reader(source)], ['3', '4', '5'])
+        # Bulk inserts skip the signals, so the rollups are rebuilt afterwards
+        self.assertEqual(DoctorRollup.objects.get(doctor=self.doctor).patient_count, 2)
+        self.assertIsNotNone(PatientRollup.objects.get(patient__name='Jane Doe').last_visit)
+
+    def test_interrupted_import_resumes(self):
+        self.write([self.row(day) for day in range(1, 8)])
+        with open(self.path, newline='') as source:
+            progress = import_history('appointments', csv.DictReader(source), key=f'appointments:{os.path.abspath(self.path)}',
+                                      file_size=os.path.getsize(self.path), batch_size=3)
+            next(progress)
+            progress.close()
+        self.assertEqual(Appointment.objects.count(), 3)
+
+        output = self.run_command('--kind', 'appointments', '--batch-size', '3')
+        self.assertIn('Imported 4 appointments', output)
+        self.assertEqual(Appointment.objects.count(), 7)
+        self.assertEqual(Appointment.objects.values('date_time').distinct().count(), 7)
+
+        # A finished import has nothing left to do
+        self.assertIn('Imported 0 appointments', self.run_command('--kind', 'appointments'))
+        self.assertEqual(Appointment.objects.count(), 7)
+
+    def test_changed_file_needs_restart(self):
+        self.write([self.row(1)])
+        self.run_command('--kind', 'appointments')
+        self.write([self.row(1), self.row(2)])
+        with self.assertRaises(CommandError):
+            self.run_command('--kind', 'appointments')
+        self.run_command('--kind', 'appointments', '--restart')
+        self.assertEqual(Appointment.objects.count(), 3)
+
+    def test_appointments_invalidate_cached_availability(self):
+        self.write([self.row(2)])
+        self.run_command('--kind', 'appointments')
+        key = bookings_version_key(self.doctor.id, date(2024, 9, 2))
+        self.assertEqual(get_versions([key])[key], 1)
+
+    def test_missing_column(self):
+        with open(self.path, 'w') as target:
+            target.write('date_time,doctor_npi\n')
+        with self.assertRaises(CommandError):
+            self.run_command('--kind', 'visits')
+
+
+class CopyCsvTest(SimpleTestCase):
+
+    def test_blank_strings_are_not_null(self):
+        # COPY ... WITH (FORMAT csv, NULL '\N') reads a bare empty field as an empty string
+        self.assertEqual(_copy_csv([[1, '', 'x'], [2, None, 'y, z']]).read(), '1,,x\r\n2,\\N,"y, z"\r\n')
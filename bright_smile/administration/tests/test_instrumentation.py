@@ -0,0 +1,102 @@
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+
+from ..capabilities import capability_index
+from ..instrumentation import QueryRecorder, fingerprint
+from ..middleware import QueryInstrumentationMiddleware
+from ..models import Clinic
+
+
+class FingerprintTest(TestCase):
+
+    def test_literals_and_lists_are_normalised(self):
+        self.assertEqual(
+            fingerprint("SELECT *  FROM t WHERE id IN (%s, %s, %s) AND name = 'x' LIMIT 21"),
+            fingerprint('SELECT * FROM t WHERE id IN (%s) AND name = %s LIMIT 1'),
+        )
+        self.assertEqual(fingerprint('SELECT "T3"."id" FROM t WHERE id = %s'), 'SELECT "T3"."id" FROM t WHERE id = ?')
+
+
+class QueryRecorderTest(TestCase):
+
+    def test_records_queries(self):
+        clinics = Clinic.objects.bulk_create([Clinic(name=f'Clinic {index}') for index in range(3)])
+        with QueryRecorder(slowest=2) as queries:
+            for clinic in clinics:
+                Clinic.objects.get(pk=clinic.pk)
+            Clinic.objects.count()
+        self.assertEqual(queries.count, 4)
+        self.assertGreater(queries.seconds, 0)
+        self.assertEqual(len(queries.slowest_statements()), 2)
+        repeated = queries.repeated(3)
+        self.assertEqual(len(repeated), 1)
+        self.assertIn('WHERE "administration_clinic"."id" = ?', repeated[0][0])
+        self.assertEqual(repeated[0][1], 3)
+
+    def test_stops_recording_on_exit(self):
+        with QueryRecorder() as queries:
+            Clinic.objects.count()
+        Clinic.objects.count()
+        self.assertEqual(queries.count, 1)
+
+
+def n_plus_one(request):
+    for clinic in Clinic.objects.all():
+        Clinic.objects.filter(pk=clinic.pk).exists()
+    return HttpResponse('ok')
+
+
+@override_settings(SQL_INSTRUMENTATION_SAMPLE_RATE=1, SQL_INSTRUMENTATION_REPEAT_THRESHOLD=3,
+                   SQL_INSTRUMENTATION_SLOW_MS=10000)
+class QueryInstrumentationMiddlewareTest(TestCase):
+
+    def setUp(self):
+        Clinic.objects.bulk_create([Clinic(name=f'Clinic {index}') for index in range(4)])
+        self.request = RequestFactory().get('/clinics/')
+
+    def test_server_timing_header(self):
+        with self.assertLogs('administration.sql', 'INFO') as logs:
+            response = QueryInstrumentationMiddleware(lambda request: HttpResponse())(self.request)
+        self.assertRegex(response['Server-Timing'], r'^db;dur=\d+\.\d\d;desc="0 queries", app;dur=\d+\.\d\d$')
+        self.assertEqual(logs.records[0].levelname, 'INFO')
+        self.assertEqual(logs.records[0].query_count, 0)
+
+    def test_n_plus_one_is_logged_as_warning(self):
+        with self.assertLogs('administration.sql', 'WARNING') as logs:
+            response = QueryInstrumentationMiddleware(n_plus_one)(self.request)
+        self.assertIn('desc="5 queries"', response['Server-Timing'])
+        record = logs.records[0]
+        self.assertEqual(record.query_count, 5)
+        self.assertEqual(record.repeated[0][1], 4)
+        self.assertIn('repeated 4x: SELECT', record.getMessage())
+        self.assertIn('slow ', record.getMessage())
+
+    def test_existing_header_is_kept(self):
+        def view(request):
+            response = HttpResponse()
+            response['Server-Timing'] = 'cache;desc="hit"'
+            return response
+        with self.assertLogs('administration.sql', 'INFO'):
+            response = QueryInstrumentationMiddleware(view)(self.request)
+        self.assertTrue(response['Server-Timing'].startswith('cache;desc="hit", db;dur='))
+
+    @override_settings(SQL_INSTRUMENTATION_SAMPLE_RATE=0)
+    def test_unsampled_requests_are_untouched(self):
+        with self.assertNoLogs('administration.sql'):
+            response = QueryInstrumentationMiddleware(n_plus_one)(self.request)
+        self.assertFalse(response.has_header('Server-Timing'))
+
+    def test_installed(self):
+        with self.assertLogs('administration.sql', 'INFO'):
+            response = self.client.get(reverse('login'))
+        self.assertIn('db;dur=', response['Server-Timing'])
+
+    async def test_async_views_are_recorded(self):
+        # The async client runs the middleware chain as it runs under ASGI
+        await capability_index.aget()
+        with self.assertLogs('administration.sql', 'INFO') as logs:
+            response = await self.async_client.get(reverse('get_clinics'), {'procedure_id': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('desc="1 queries"', response['Server-Timing'])
+        self.assertEqual(logs.records[0].query_count, 1)
@@ -0,0 +1,53 @@
+import asyncio
+
+from django.test import SimpleTestCase
+
+from ..loadtest import generate_load, percentile, summarize, time_flow
+
+
+class PercentileTest(SimpleTestCase):
+
+    def test_nearest_rank(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 0.5), 50)
+        self.assertEqual(percentile(values, 0.99), 99)
+        self.assertEqual(percentile([3.0], 0.99), 3.0)
+        self.assertIsNone(percentile([], 0.99))
+
+
+async def handle(reader, writer):
+    request = await reader.readuntil(b'\r\n\r\n')
+    status = b'200 OK' if request.startswith(b'GET /ok') else b'404 Not Found'
+    writer.write(b'HTTP/1.1 ' + status + b'\r\nContent-Length: 2\r\nConnection: close\r\n\r\n{}')
+    await writer.drain()
+    writer.close()
+
+
+class GenerateLoadTest(SimpleTestCase):
+
+    async def test_counts_responses_and_errors(self):
+        server = await asyncio.start_server(handle, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            latencies, errors, seconds = await generate_load('127.0.0.1', port, '/ok', clients=5, duration=0.2)
+            self.assertGreater(len(latencies), 5)
+            self.assertEqual(errors, 0)
+            result = summarize('test', 'ok', 5, latencies, errors, seconds)
+            self.assertEqual(result.requests, len(latencies))
+            self.assertGreaterEqual(result.p99_ms, result.p50_ms)
+
+            latencies, errors, _ = await generate_load('127.0.0.1', port, '/missing', clients=2, duration=0.1)
+            self.assertEqual(latencies, [])
+            self.assertGreater(errors, 0)
+
+
+class TimeFlowTest(SimpleTestCase):
+
+    async def test_times_each_run(self):
+        server = await asyncio.start_server(handle, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            timings = await time_flow('127.0.0.1', port, ['/ok', '/ok2'], runs=3)
+            self.assertEqual(len(timings), 3)
+            with self.assertRaisesMessage(RuntimeError, '/missing returned 404'):
+                await time_flow('127.0.0.1', port, ['/ok', '/missing'], runs=1)
@@ -0,0 +1,149 @@
+import hashlib
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..caching import cache_stats
+from ..models import Clinic, Doctor, Specialty, DoctorClinicAffiliation, DoctorSchedule
+
+
+class CacheTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        cache_stats.reset()
+        self.client.force_login(User.objects.create_user(username='staff', password='12345', is_staff=True))
+        self.specialty = Specialty.objects.create(name='Cleaning')
+        self.clinic = Clinic.objects.create(name='Downtown', phone_number='1', city='City', state='ST', email='c@example.com')
+        self.doctor = Doctor.objects.create(NPI='1234567890', name='Dr. Smith', email='d@example.com', phone_number='1')
+        self.doctor.specialties.add(self.specialty)
+        self.affiliation = DoctorClinicAffiliation.objects.create(doctor=self.doctor, clinic=self.clinic,
+                                                                  office_address='1 Main St')
+        DoctorSchedule.objects.create(affiliation=self.affiliation, day_of_week='Mon', start_time='09:00', end_time='17:00')
+
+
+@override_settings(PAGE_CACHE_TIMEOUT=60, PAGE_CACHE_MAX_AGE=60)
+class PageCacheTest(CacheTestCase):
+
+    def test_hits_skip_the_render(self):
+        url = reverse('clinic_list')
+        first = self.client.get(url)
+        self.assertEqual(first['Server-Timing'], 'page-cache;desc="miss"')
+        with CaptureQueriesContext(connection) as context:
+            second = self.client.get(url)
+        self.assertEqual(second['Server-Timing'], 'page-cache;desc="hit"')
+        self.assertContains(second, 'Downtown')
+        self.assertContains(second, 'logout-form')
+        # The session, the user and the stamps
+        self.assertEqual(len(context.captured_queries), 3)
+
+        self.assertEqual(self.client.get(url, {'page_size': 1})['Server-Timing'], 'page-cache;desc="miss"')
+
+    def test_writes_serve_the_stale_page_once(self):
+        url = reverse('clinic_list')
+        self.client.get(url)
+        self.clinic.name = 'Uptown'
+        self.clinic.save()
+
+        stale = self.client.get(url)
+        self.assertEqual(stale['Server-Timing'], 'page-cache;desc="stale"')
+        self.assertContains(stale, 'Downtown')
+        # Re-rendered once the stale response was sent
+        fresh = self.client.get(url)
+        self.assertEqual(fresh['Server-Timing'], 'page-cache;desc="hit"')
+        self.assertContains(fresh, 'Uptown')
+        self.assertEqual(cache_stats.snapshot()['pages'], {'hits': 2, 'misses': 1, 'stale': 1, 'hit_ratio': 0.6667})
+
+    def test_pages_age(self):
+        url = reverse('doctor_list')
+        self.client.get(url)
+        with override_settings(PAGE_CACHE_MAX_AGE=0):
+            self.assertEqual(self.client.get(url)['Server-Timing'], 'page-cache;desc="stale"')
+        self.assertEqual(self.client.get(url)['Server-Timing'], 'page-cache;desc="hit"')
+
+    def test_one_refresh_at_a_time(self):
+        url = reverse('clinic_list')
+        self.client.get(url)
+        self.clinic.name = 'Uptown'
+        self.clinic.save()
+        # Another worker is already refreshing the page
+        cache.set(f'pages:{hashlib.sha1(url.encode()).hexdigest()}:refreshing', True)
+        self.client.get(url)
+        self.assertEqual(self.client.get(url)['Server-Timing'], 'page-cache;desc="stale"')
+
+
+class FragmentCacheTest(CacheTestCase):
+
+    def render(self, url):
+        cache_stats.reset()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response, cache_stats.snapshot()['fragments']
+
+    def test_list_rows_load_specialties_on_a_miss(self):
+        url = reverse('doctor_list')
+        with CaptureQueriesContext(connection) as cold:
+            self.render(url)
+        with CaptureQueriesContext(connection) as warm:
+            self.assertContains(self.render(url)[0], 'Cleaning')
+        specialty_table = Specialty._meta.db_table
+        self.assertTrue(any(specialty_table in query['sql'] for query in cold.captured_queries))
+        self.assertFalse(any(specialty_table in query['sql'] for query in warm.captured_queries))
+
+    def test_clinic_detail_sections(self):
+        url = reverse('clinic_detail', args=[self.clinic.pk])
+        _, stats = self.render(url)
+        self.assertEqual(stats['misses'], 2)
+        response, stats = self.render(url)
+        self.assertEqual(stats, {'hits': 2, 'misses': 0, 'hit_ratio': 1.0})
+        self.assertContains(response, 'Mon')
+        # The remove forms carry this request's CSRF token
+        self.assertContains(response, 'csrfmiddlewaretoken', count=2)
+
+        DoctorSchedule.objects.create(affiliation=self.affiliation, day_of_week='Tue', start_time='09:00', end_time='12:00')
+        response, stats = self.render(url)
+        self.assertEqual(stats, {'hits': 1, 'misses': 1, 'hit_ratio': 0.5})
+        self.assertContains(response, 'Tue')
+
+        self.doctor.name = 'Dr. Jones'
+        self.doctor.save()
+        self.clinic.email = 'new@example.com'
+        self.clinic.save()
+        response, stats = self.render(url)
+        self.assertEqual(stats['misses'], 2)
+        self.assertContains(response, 'Dr. Jones')
+        self.assertContains(response, 'new@example.com')
+
+    def test_list_rows(self):
+        other = Doctor.objects.create(NPI='1234567891', name='Dr. Jones', email='j@example.com', phone_number='1')
+        filling = Specialty.objects.create(name='Filling')
+        self.render(reverse('doctor_list'))
+        self.assertEqual(self.render(reverse('doctor_list'))[1]['hits'], 2)
+
+        filling.doctors.add(other)
+        response, stats = self.render(reverse('doctor_list'))
+        self.assertEqual(stats, {'hits': 1, 'misses': 1, 'hit_ratio': 0.5})
+        self.assertContains(response, 'Filling')
+
+        # Only the rows that show a specialty miss when it changes
+        self.specialty.name = 'Scaling'
+        self.specialty.save()
+        Specialty.objects.create(name='Crowns')
+        response, stats = self.render(reverse('doctor_list'))
+        self.assertEqual(stats, {'hits': 1, 'misses': 1, 'hit_ratio': 0.5})
+        self.assertContains(response, 'Scaling')
+
+        filling.delete()
+        response, stats = self.render(reverse('doctor_list'))
+        self.assertEqual(stats, {'hits': 1, 'misses': 1, 'hit_ratio': 0.5})
+        self.assertNotContains(response, 'Filling')
+
+        self.render(reverse('clinic_list'))
+        DoctorClinicAffiliation.objects.create(doctor=other, clinic=self.clinic, office_address='2')
+        response, stats = self.render(reverse('clinic_list'))
+        self.assertEqual(stats['misses'], 1)
+        self.assertContains(response, '<td>2</td>')
@@ -0,0 +1,86 @@
+from django.contrib.auth.models import User
+from django.http import Http404
+from django.test import TestCase, Client
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from ..models import Clinic
+from ..pagination import KeysetPaginator, estimated_count
+
+
+class KeysetPaginatorTest(TestCase):
+
+    def setUp(self):
+        for i in range(7):
+            Clinic.objects.create(name=f'Clinic {i % 3}', phone_number='1234567890', city='Test City',
+                                  state='Test State', email='clinic@test.com')
+
+    def walk(self, paginator):
+        """ Follow next cursors from the first page and return the pages seen """
+        pages = [paginator.get_page()]
+        while pages[-1].has_next():
+            pages.append(paginator.get_page(pages[-1].next_cursor))
+        return pages
+
+    def test_forward_pages_cover_every_row_once(self):
+        pages = self.walk(KeysetPaginator(Clinic.objects.all(), 3))
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+        ids = [clinic.pk for page in pages for clinic in page]
+        self.assertEqual(ids, list(Clinic.objects.order_by('pk').values_list('pk', flat=True)))
+        self.assertFalse(pages[0].has_previous())
+        self.assertTrue(pages[-1].has_previous())
+
+    def test_previous_cursor_returns_previous_page(self):
+        paginator = KeysetPaginator(Clinic.objects.all(), 3)
+        pages = self.walk(paginator)
+        previous = paginator.get_page(pages[2].previous_cursor)
+        self.assertEqual(list(previous), list(pages[1]))
+        self.assertTrue(previous.has_next())
+        self.assertEqual(list(paginator.get_page(previous.previous_cursor)), list(pages[0]))
+
+    def test_multi_field_ordering(self):
+        paginator = KeysetPaginator(Clinic.objects.all(), 2, ordering=('-name', 'pk'))
+        names = [(clinic.name, clinic.pk) for page in self.walk(paginator) for clinic in page]
+        self.assertEqual(names, list(Clinic.objects.order_by('-name', 'pk').values_list('name', 'pk')))
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(Http404):
+            KeysetPaginator(Clinic.objects.all(), 3).get_page('not-a-cursor')
+
+    def test_estimated_count(self):
+        # SQLite has no planner estimate, so the exact count is used
+        self.assertEqual(estimated_count(Clinic.objects.all()), 7)
+        self.assertEqual(KeysetPaginator(Clinic.objects.all(), 3).count, 7)
+
+
+class KeysetPaginationViewTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='12345')
+        for i in range(5):
+            Clinic.objects.create(name=f'Clinic {i}', phone_number='1234567890', city='Test City',
+                                  state='Test State', email='clinic@test.com')
+
+    def test_clinic_list_view_pages(self):
+        client = Client()
+        client.login(username='testuser', password='12345')
+        response = client.get(reverse('clinic_list'), {'page_size': 2})
+        self.assertEqual(len(response.context['clinics']), 2)
+        self.assertTrue(response.context['is_paginated'])
+
+        cursor = response.context['page_obj'].next_cursor
+        response = client.get(reverse('clinic_list'), {'page_size': 2, 'cursor': cursor})
+        self.assertContains(response, 'Clinic 2')
+        self.assertNotContains(response, 'Clinic 0')
+
+    def test_clinic_api_pages(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user(username='staff', password='12345', is_staff=True))
+        response = client.get(reverse('clinic-list'), {'page_size': 2})
+        body = response.json()
+        self.assertEqual(body['count'], 5)
+        self.assertEqual([clinic['name'] for clinic in body['results']], ['Clinic 0', 'Clinic 1'])
+
+        body = client.get(body['next']).json()
+        self.assertEqual([clinic['name'] for clinic in body['results']], ['Clinic 2', 'Clinic 3'])
+        self.assertIsNotNone(body['previous'])
@@ -0,0 +1,99 @@
+import shutil
+import tempfile
+import time
+from io import StringIO
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from ..profiling import StackSampler, call_tree, folded, hot_frames, load_profile, parse_folded, profile_ids
+
+
+def busy(seconds):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+class StackSamplerTest(TestCase):
+
+    def test_samples_the_calling_thread(self):
+        with StackSampler(interval=0.001) as sampler:
+            busy(0.05)
+        self.assertGreater(sum(sampler.stacks.values()), 5)
+        own, total = hot_frames(sampler.stacks, limit=100)
+        self.assertTrue(own[0][0].startswith('busy (administration/tests/test_profiling.py:'))
+        self.assertTrue(any(frame.startswith('test_samples_the_calling_thread') for frame, _ in total))
+
+    def test_folded_round_trip_and_tree(self):
+        stacks = {('main', 'view', 'query'): 6, ('main', 'view'): 2, ('main', 'render'): 2}
+        self.assertEqual(folded(stacks), 'main;render 2\nmain;view 2\nmain;view;query 6\n')
+        self.assertEqual(parse_folded(folded(stacks)), stacks)
+        self.assertEqual(call_tree(stacks, min_share=0.25), [
+            '100.0%     10 main',
+            '   80.0%      8 view',
+            '     60.0%      6 query',
+        ])
+
+
+class ProfilerMiddlewareTest(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        settings_override = override_settings(PROFILE_DIR=self.directory, PROFILE_RETENTION=2, PROFILE_INTERVAL_MS=0.5)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.staff = User.objects.create_user(username='staff', password='12345', is_staff=True)
+
+    def test_staff_request_is_profiled(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('clinic_list'), {'profile': '1'})
+        self.assertEqual(response.status_code, 200)
+        summary, stacks = load_profile(response['X-Profile-Id'])
+        self.assertEqual(summary['path'], reverse('clinic_list') + '?profile=1')
+        self.assertEqual(summary['user'], 'staff')
+        self.assertEqual(summary['samples'], sum(stacks.values()))
+
+        response = self.client.get(reverse('clinic_list'), HTTP_X_PROFILE='1')
+        self.assertIn('X-Profile-Id', response)
+
+    async def test_async_request_is_profiled(self):
+        await self.async_client.aforce_login(self.staff)
+        response = await self.async_client.get(reverse('get_doctors'), {'clinic_id': 1, 'profile': '1'})
+        self.assertEqual(response.status_code, 200)
+        summary, stacks = await sync_to_async(load_profile)(response['X-Profile-Id'])
+        self.assertEqual(summary['user'], 'staff')
+
+    def test_others_are_not_profiled(self):
+        response = self.client.get(reverse('clinic_list'), {'profile': '1'})
+        self.assertNotIn('X-Profile-Id', response)
+        self.client.force_login(User.objects.create_user(username='user', password='12345'))
+        response = self.client.get(reverse('clinic_list'), {'profile': '1'})
+        self.assertNotIn('X-Profile-Id', response)
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('clinic_list'))
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertEqual(profile_ids(), [])
+
+    def test_retention_and_command(self):
+        self.client.force_login(self.staff)
+        ids = [self.client.get(reverse('clinic_list'), {'profile': '1'})['X-Profile-Id'] for _ in range(3)]
+        self.assertEqual(profile_ids(), ids[:0:-1])
+
+        out = StringIO()
+        call_command('request_profiles', stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 2)
+        self.assertIn(f'{ids[2]}  GET {reverse("clinic_list")}?profile=1 200', out.getvalue())
+
+        out = StringIO()
+        call_command('request_profiles', 'latest', stdout=out)
+        self.assertIn('Call tree:', out.getvalue())
+        self.assertIn(f'{ids[2]}.folded', out.getvalue())
+
+        with self.assertRaises(CommandError):
+            call_command('request_profiles', ids[0])
@@ -0,0 +1,82 @@
+import re
+from datetime import datetime, time, timedelta
+
+from django.db import connection, IntegrityError, transaction
+from django.test import TestCase
+from django.utils import timezone
+
+from ..models import Clinic, Doctor, Patient, Specialty, DoctorClinicAffiliation, DoctorSchedule, Visit, Appointment
+
+
+def sequential_scans(queryset):
+    """
+    Tables read by a full sequential scan in the plan of ``queryset``.
+    PostgreSQL is told to avoid sequential scans, so any that remain mean no index can serve the query.
+    """
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        return re.findall(r'Seq Scan on (\w+)', queryset.explain())
+    if connection.vendor == 'sqlite':
+        return re.findall(r'\bSCAN (\w+)(?! USING)', queryset.explain())
+    return []
+
+
+class QueryPlanTest(TestCase):
+    """
+    EXPLAIN the scheduling hot paths against a seeded dataset and fail if any of them
+    falls back to scanning a whole table.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        specialty = Specialty.objects.create(name='Dentistry')
+        clinics = [Clinic.objects.create(name=f'Clinic {i}', phone_number='1', city='City', state='ST', email='c@test.com')
+                   for i in range(3)]
+        doctors = [Doctor.objects.create(NPI=f'{i:010d}', name=f'Dr. {i}', email='d@test.com', phone_number='1')
+                   for i in range(6)]
+        patients = [Patient.objects.create(name=f'Patient {i}', date_of_birth='1990-01-01', last_4_ssn='1234',
+                                           phone_number='1', gender='Male', address='Main St') for i in range(20)]
+        for index, doctor in enumerate(doctors):
+            affiliation = DoctorClinicAffiliation.objects.create(doctor=doctor, clinic=clinics[index % 3], office_address='St')
+            for day in ('Mon', 'Wed', 'Fri'):
+                DoctorSchedule.objects.create(affiliation=affiliation, day_of_week=day, start_time=time(9), end_time=time(17))
+
+        now = timezone.now()
+        for index, patient in enumerate(patients):
+            doctor = doctors[index % 6]
+            for days in range(5):
+                Visit.objects.create(patient=patient, doctor=doctor, clinic=clinics[index % 3], date_time=now - timedelta(days=30 * days))
+                Appointment.objects.create(patient=patient, doctor=doctor, clinic=clinics[index % 3], procedure=specialty,
+                                           date_time=now + timedelta(days=days, minutes=15 * index))
+
+        cls.doctor, cls.clinic, cls.patient = doctors[0], clinics[0], patients[0]
+        cls.affiliation = DoctorClinicAffiliation.objects.get(doctor=cls.doctor, clinic=cls.clinic)
+
+    def assertNoSequentialScan(self, queryset):
+        self.assertEqual(sequential_scans(queryset), [], queryset.explain())
+
+    def test_available_slots_appointments(self):
+        day = timezone.make_aware(datetime(2024, 9, 2))
+        self.assertNoSequentialScan(Appointment.objects.filter(
+            doctor_id=self.doctor.id, clinic_id=self.clinic.id, date_time__gte=day, date_time__lt=day + timedelta(days=1)
+        ))
+
+    def test_affiliation_lookup(self):
+        self.assertNoSequentialScan(DoctorClinicAffiliation.objects.filter(doctor_id=self.doctor.id, clinic_id=self.clinic.id))
+
+    def test_schedule_lookup(self):
+        self.assertNoSequentialScan(DoctorSchedule.objects.filter(affiliation=self.affiliation, day_of_week='Mon'))
+
+    def test_patient_visit_history(self):
+        self.assertNoSequentialScan(Visit.objects.filter(patient=self.patient).order_by('-date_time'))
+
+    def test_patient_appointments(self):
+        self.assertNoSequentialScan(Appointment.objects.filter(patient=self.patient).order_by('date_time'))
+        self.assertNoSequentialScan(
+            Appointment.objects.filter(patient=self.patient, date_time__gte=timezone.now()).order_by('date_time')
+        )
+
+    def test_affiliation_is_unique(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            DoctorClinicAffiliation.objects.create(doctor=self.doctor, clinic=self.clinic, office_address='Duplicate')
@@ -0,0 +1,195 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TestCase, Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from ..models import Clinic, Doctor, Patient, Specialty, DoctorClinicAffiliation, Visit, Appointment, \
+    ClinicRollup, DoctorRollup, PatientRollup, ClinicPatientLink, DoctorPatientLink
+from ..rollups import expire_rollups, verify_rollups
+
+
+class RollupTestCase(TestCase):
+
+    def setUp(self):
+        self.specialty = Specialty.objects.create(name='Dentistry')
+        self.clinic = Clinic.objects.create(name='Test Clinic', phone_number='1234567890', city='Test City',
+                                            state='Test State', email='clinic@test.com')
+        self.doctor = Doctor.objects.create(NPI='1234567890', name='Dr. Smith', email='drsmith@example.com',
+                                            phone_number='555-555-5557')
+        self.affiliation = DoctorClinicAffiliation.objects.create(doctor=self.doctor, clinic=self.clinic,
+                                                                  office_address='123 Clinic St.')
+        self.patient = self.create_patient('John Doe')
+        self.now = timezone.now()
+
+    def create_patient(self, name):
+        return Patient.objects.create(name=name, date_of_birth='1990-01-01', last_4_ssn='1234',
+                                      phone_number='555-555-5555', gender='Male', address='123 Main St')
+
+    def visit(self, patient=None, days_ago=10, **kwargs):
+        kwargs.setdefault('doctor', self.doctor)
+        kwargs.setdefault('clinic', self.clinic)
+        return Visit.objects.create(patient=patient or self.patient, date_time=self.now - timedelta(days=days_ago), **kwargs)
+
+    def appointment(self, patient=None, days_ahead=10, **kwargs):
+        kwargs.setdefault('doctor', self.doctor)
+        kwargs.setdefault('clinic', self.clinic)
+        return Appointment.objects.create(patient=patient or self.patient, procedure=self.specialty,
+                                          date_time=self.now + timedelta(days=days_ahead), **kwargs)
+
+    def counts(self):
+        return (DoctorRollup.objects.get(doctor=self.doctor).patient_count,
+                ClinicRollup.objects.get(clinic=self.clinic).patient_count)
+
+    def assertConsistent(self):
+        self.assertEqual(verify_rollups(), [])
+
+
+class IncrementalRollupTest(RollupTestCase):
+
+    def test_rollup_rows_created_with_owners(self):
+        self.assertEqual(DoctorRollup.objects.get(doctor=self.doctor).clinic_count, 1)
+        self.assertEqual(ClinicRollup.objects.get(clinic=self.clinic).doctor_count, 1)
+        self.assertTrue(PatientRollup.objects.filter(patient=self.patient).exists())
+
+    def test_visits_and_appointments_count_each_patient_once(self):
+        self.visit()
+        self.visit(days_ago=5)
+        self.appointment()
+        self.appointment(patient=self.create_patient('Jane Doe'))
+        self.appointment(patient=self.create_patient('Past Patient'), days_ahead=-3)
+        self.assertEqual(self.counts(), (2, 2))
+        self.assertConsistent()
+
+    def test_patient_pointers(self):
+        self.visit(days_ago=30)
+        latest = self.visit(days_ago=5)
+        self.appointment(days_ahead=-1)
+        upcoming = self.appointment(days_ahead=3)
+        self.appointment(days_ahead=9)
+        rollup = PatientRollup.objects.get(patient=self.patient)
+        self.assertEqual(rollup.last_visit, latest)
+        self.assertEqual(rollup.next_appointment, upcoming)
+
+    def test_update_moves_patient_between_doctors(self):
+        other = Doctor.objects.create(NPI='1111111111', name='Dr. Jones', email='jones@example.com', phone_number='1')
+        visit = self.visit()
+        visit.doctor = other
+        visit.save()
+        self.assertEqual(self.counts(), (0, 0))
+        self.assertEqual(DoctorRollup.objects.get(doctor=other).patient_count, 1)
+        self.assertConsistent()
+
+    def test_delete_views_update_rollups(self):
+        User.objects.create_user(username='testuser', password='testpass')
+        client = Client()
+        client.login(username='testuser', password='testpass')
+        visit = self.visit()
+        appointment = self.appointment()
+
+        client.post(reverse('delete_visit', args=[visit.id]))
+        self.assertEqual(self.counts(), (1, 1))
+        client.post(reverse('delete_appointment', args=[appointment.id]))
+        self.assertEqual(self.counts(), (0, 0))
+        self.assertIsNone(PatientRollup.objects.get(patient=self.patient).last_visit)
+        self.assertConsistent()
+
+    def test_affiliation_controls_clinic_count(self):
+        self.visit()
+        self.affiliation.delete()
+        self.assertEqual(self.counts(), (1, 0))
+        self.assertEqual(ClinicRollup.objects.get(clinic=self.clinic).doctor_count, 0)
+        DoctorClinicAffiliation.objects.create(doctor=self.doctor, clinic=self.clinic, office_address='Back again')
+        self.assertEqual(self.counts(), (1, 1))
+        self.assertConsistent()
+
+    def test_cascading_deletes(self):
+        other_clinic = Clinic.objects.create(name='Other Clinic', phone_number='1', city='City', state='ST', email='o@test.com')
+        DoctorClinicAffiliation.objects.create(doctor=self.doctor, clinic=other_clinic, office_address='Other St.')
+        self.visit()
+        self.visit(clinic=other_clinic)
+        other_patient = self.create_patient('Jane Doe')
+        self.appointment(patient=other_patient)
+
+        other_clinic.delete()
+        self.assertEqual(self.counts(), (2, 2))
+        self.assertEqual(DoctorRollup.objects.get(doctor=self.doctor).clinic_count, 1)
+        self.assertConsistent()
+
+        self.patient.delete()
+        self.assertEqual(self.counts(), (1, 1))
+        self.assertConsistent()
+
+        self.doctor.delete()
+        self.assertEqual(ClinicRollup.objects.get(clinic=self.clinic).patient_count, 0)
+        self.assertConsistent()
+
+    def test_expire_passed_appointments(self):
+        self.appointment(days_ahead=1)
+        self.assertEqual(self.counts(), (1, 1))
+        self.assertEqual(expire_rollups(now=self.now + timedelta(days=2)), 3)
+        self.assertEqual(self.counts(), (0, 0))
+        self.assertFalse(DoctorPatientLink.objects.get(doctor=self.doctor).is_active)
+
+
+class PassedAppointmentTest(RollupTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(User.objects.create_user(username='testuser', password='12345'))
+        self.passed = self.appointment(days_ahead=1)
+        self.later = self.appointment(days_ahead=20)
+        # The first appointment passes without anything touching the rollups
+        Appointment.objects.filter(pk=self.passed.pk).update(date_time=self.now - timedelta(hours=1))
+
+    def test_patient_list_skips_passed_appointments(self):
+        response = self.client.get(reverse('patient_list'))
+        listed = response.context['object_list'][0]
+        self.assertEqual(listed.rollup.next_appointment, self.later)
+        # Left to expire_rollups()
+        self.assertEqual(PatientRollup.objects.get(patient=self.patient).next_appointment_id, self.passed.pk)
+
+        Appointment.objects.filter(pk=self.later.pk).update(date_time=self.now - timedelta(minutes=1))
+        self.assertContains(self.client.get(reverse('patient_list')), 'No appointment scheduled.')
+
+    def test_lists_do_not_count_passed_appointments(self):
+        # The later appointment passes too
+        past = self.now - timedelta(minutes=1)
+        Appointment.objects.filter(pk=self.later.pk).update(date_time=past)
+        for link_model in (DoctorPatientLink, ClinicPatientLink):
+            link_model.objects.update(last_appointment_at=past)
+
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(self.client.get(reverse('clinic_list')).context['clinics'][0].unique_patient_count, 0)
+            self.assertEqual(self.client.get(reverse('doctor_list')).context['doctors'][0].unique_patient_count, 0)
+        self.assertFalse([query for query in context.captured_queries
+                          if query['sql'].startswith(('UPDATE', 'INSERT', 'DELETE')) and 'rollup' in query['sql']])
+        self.assertEqual(self.counts(), (1, 1))
+
+        expire_rollups()
+        self.assertEqual(self.counts(), (0, 0))
+        self.assertEqual(self.client.get(reverse('clinic_list')).context['clinics'][0].unique_patient_count, 0)
+
+
+class RebuildRollupsCommandTest(RollupTestCase):
+
+    def test_rebuild_repairs_drift(self):
+        self.visit()
+        self.appointment(patient=self.create_patient('Jane Doe'))
+        DoctorRollup.objects.update(patient_count=42)
+        PatientRollup.objects.all().delete()
+
+        with self.assertRaises(CommandError):
+            call_command('rebuild_rollups', '--verify-only', stdout=StringIO(), stderr=StringIO())
+
+        out = StringIO()
+        call_command('rebuild_rollups', '--chunk-size', '1', stdout=out)
+        self.assertIn('Rollups are consistent.', out.getvalue())
+        self.assertEqual(self.counts(), (2, 2))
+        self.assertEqual(PatientRollup.objects.count(), 2)
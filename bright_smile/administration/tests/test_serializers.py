@@ -121,4 +121,4 @@ class PatientSerializerTest(TestCase):
         patient = Patient.objects.create(**self.patient_data)
         serializer = PatientSerializer(patient)
         self.assertEqual(serializer.data['name'], 'John Doe')
-        self.assertEqual(serializer.data['last_4_ssn'], '1234')
+        self.assertNotIn('last_4_ssn', serializer.data)
@@ -0,0 +1,78 @@
+from datetime import date, timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TestCase
+from django.utils import timezone
+
+from ..availability import is_bookable
+from ..models import Clinic, Doctor, Patient, DoctorSchedule, Visit, Appointment, DoctorRollup
+from ..rollups import verify_rollups
+from ..synthetic import dataset_size, generate_dataset
+
+TODAY = date(2024, 9, 2)
+
+
+def snapshot():
+    return {
+        'doctors': list(Doctor.objects.order_by('pk').values_list('NPI', 'name')),
+        'patients': list(Patient.objects.order_by('pk').values_list('name', 'date_of_birth', 'last_4_ssn')),
+        'schedules': list(DoctorSchedule.objects.order_by('pk').values_list('affiliation__doctor__NPI', 'day_of_week', 'start_time')),
+        'visits': list(Visit.objects.order_by('pk').values_list('patient__name', 'doctor__NPI', 'date_time')),
+        'appointments': list(Appointment.objects.order_by('pk').values_list('patient__name', 'doctor__NPI', 'date_time')),
+    }
+
+
+def generate(seed=7):
+    list(generate_dataset(**dataset_size(1), seed=seed, batch_size=300, today=TODAY))
+
+
+class GenerateDatasetTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        generate()
+
+    def test_counts_and_consistency(self):
+        self.assertEqual(Clinic.objects.count(), 5)
+        self.assertEqual(Doctor.objects.count(), 20)
+        self.assertEqual(Patient.objects.count(), 500)
+        self.assertGreater(Visit.objects.count(), 1000)
+        self.assertGreater(Appointment.objects.count(), 100)
+        self.assertTrue(Visit.objects.filter(procedures_done__isnull=False).exists())
+        self.assertEqual(DoctorRollup.objects.count(), 20)
+        self.assertEqual(verify_rollups(), [])
+
+    def test_appointments_respect_schedules(self):
+        self.assertEqual(Appointment.objects.values('doctor', 'date_time').distinct().count(), Appointment.objects.count())
+        appointments = Appointment.objects.order_by('?')[:50]
+        for appointment in appointments:
+            # Bookable once the appointment itself is out of the way
+            Appointment.objects.filter(pk=appointment.pk).delete()
+            self.assertTrue(is_bookable(appointment.doctor_id, appointment.clinic_id, appointment.date_time))
+        days = Appointment.objects.order_by('date_time').values_list('date_time', flat=True)
+        self.assertGreater(timezone.localdate(days.first()), TODAY)
+        self.assertLessEqual(timezone.localdate(days.last()), TODAY + timedelta(days=91))
+        self.assertLess(timezone.localdate(Visit.objects.latest('date_time').date_time), TODAY)
+
+
+
+class SeedTest(TestCase):
+
+    def test_same_seed_same_data(self):
+        with transaction.atomic():
+            generate()
+            first = snapshot()
+            transaction.set_rollback(True)
+        self.assertFalse(Patient.objects.exists())
+        generate()
+        self.assertEqual(snapshot(), first)
+
+    def test_command(self):
+        out = StringIO()
+        call_command('seed_data', '--patients', '50', '--doctors', '4', '--clinics', '2', '--seed', '3',
+                     '--today', '2024-09-02', stdout=out)
+        self.assertIn('Done in', out.getvalue())
+        self.assertEqual(Patient.objects.count(), 50)
+        self.assertEqual(Doctor.objects.count(), 4)
@@ -1,3 +1,4 @@
+from django.core.cache import cache
 from django.test import TestCase, Client
 from django.urls import reverse
 
@@ -6,6 +7,7 @@ from ...models import Clinic, Doctor, Patient, Appointment, Specialty, DoctorCli
 
 class AppointmentViewTestCase(TestCase):
     def setUp(self):
+        cache.clear()
         # Setup test user and login
         self.client = Client()
 
@@ -125,3 +127,78 @@ class AppointmentViewTestCase(TestCase):
         self.assertEqual(response.json()[0]['day_of_week'], 'Mon')
         self.assertEqual(response.json()[0]['start_time'], '09:00:00')
         self.assertEqual(response.json()[0]['end_time'], '17:00:00')
+
+    def test_get_availability_range(self):
+        """Test fetching free slots for a range of dates in one call."""
+        url = reverse('get_availability')
+        data = {
+            'doctor_id': self.doctor.id,
+            'clinic_id': self.clinic.id,
+            'start': '2099-09-07',  # A Monday
+            'days': 14
+        }
+        response = self.client.get(url, data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.json()), ['2099-09-07', '2099-09-14'])
+        self.assertEqual(len(response.json()['2099-09-07']), 32)
+        self.assertEqual(response.json()['2099-09-07'][0], '2099-09-07 09:00:00')
+
+    def test_get_availability_range_invalid(self):
+        response = self.client.get(reverse('get_availability'), {'doctor_id': 'x'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_get_first_available(self):
+        """Test searching the earliest open slots for a procedure."""
+        other_clinic = Clinic.objects.create(name="Other Clinic", phone_number="555-555-5558", city="New York",
+                                             state="NY", email="other@example.com")
+        affiliation = DoctorClinicAffiliation.objects.create(doctor=self.doctor, clinic=other_clinic, office_address="456 Clinic St.")
+        for day in ("Tue", "Wed", "Thu", "Fri", "Sat", "Sun"):
+            DoctorSchedule.objects.create(affiliation=affiliation, day_of_week=day, start_time="09:00:00", end_time="10:00:00")
+
+        url = reverse('get_first_available')
+        response = self.client.get(url, {'procedure_id': self.specialty.id, 'limit': 6})
+        self.assertEqual(response.status_code, 200)
+        slots = response.json()
+        self.assertEqual(len(slots), 6)
+        self.assertEqual([slot['date_time'] for slot in slots], sorted(slot['date_time'] for slot in slots))
+        self.assertEqual({slot['doctor_name'] for slot in slots}, {"Dr. Smith"})
+
+        response = self.client.get(url, {'procedure_id': self.specialty.id, 'clinic_id': self.clinic.id, 'limit': 3})
+        self.assertEqual({slot['clinic_name'] for slot in response.json()}, {"Bright Smile Clinic"})
+
+    def test_get_first_available_unknown_procedure(self):
+        response = self.client.get(reverse('get_first_available'), {'procedure_id': self.specialty.id + 1})
+        self.assertEqual(response.json(), [])
+
+    def test_get_booking_bootstrap(self):
+        """Test fetching the booking tree and a procedure's availability in one call."""
+        url = reverse('get_booking_bootstrap')
+        response = self.client.get(url, {'procedure_id': self.specialty.id, 'start': '2099-09-07', 'days': 7})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        pair = f'{self.doctor.id}-{self.clinic.id}'
+        self.assertEqual(data['procedures'], {str(self.specialty.id): 'Dentistry'})
+        self.assertEqual(data['offers'], {str(self.specialty.id): {str(self.clinic.id): [self.doctor.id]}})
+        self.assertEqual(data['schedules'], {pair: [['Mon', '09:00', '17:00']]})
+        self.assertEqual(data['availability']['start'], '2099-09-07')
+        self.assertEqual(data['availability']['end'], '2099-09-14')
+        self.assertEqual(list(data['availability']['slots'][pair]), ['2099-09-07'])
+        self.assertEqual(len(data['availability']['slots'][pair]['2099-09-07']), 32)
+        self.assertEqual(data['availability']['slots'][pair]['2099-09-07'][:2], ['09:00', '09:15'])
+
+    def test_get_booking_bootstrap_parts(self):
+        url = reverse('get_booking_bootstrap')
+        response = self.client.get(url, {'parts': 'tree'})
+        self.assertNotIn('availability', response.json())
+        # The tree alone is versioned like the other lookups
+        self.assertEqual(self.client.get(url, {'parts': 'tree'}, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+        response = self.client.get(url, {'parts': 'availability', 'clinic_id': self.clinic.id, 'start': '2099-09-07'})
+        self.assertEqual(list(response.json()), ['availability'])
+        self.assertNotIn('ETag', response)
+
+    def test_get_booking_bootstrap_invalid(self):
+        url = reverse('get_booking_bootstrap')
+        self.assertEqual(self.client.get(url, {'parts': 'slots'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'parts': 'availability'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'doctor_id': self.doctor.id, 'days': 'x'}).status_code, 400)
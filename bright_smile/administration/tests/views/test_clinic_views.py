@@ -1,7 +1,13 @@
+from datetime import timedelta
+
 from django.contrib.auth.models import User
+from django.db import connection
 from django.test import TestCase, Client
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
-from ...models import Clinic, Doctor, Specialty, DoctorClinicAffiliation
+from django.utils import timezone
+
+from ...models import Clinic, Doctor, Specialty, DoctorClinicAffiliation, Patient, Visit, Appointment
 
 
 class ClinicViewTests(TestCase):
@@ -101,3 +107,62 @@ class ClinicViewTests(TestCase):
         response = self.client.post(reverse('remove_affiliation', args=[affiliation.id]))
         self.assertEqual(response.status_code, 302)
         self.assertFalse(DoctorClinicAffiliation.objects.filter(id=affiliation.id).exists())
+
+
+class ClinicListQueryTests(TestCase):
+
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='12345')
+        self.client.login(username='testuser', password='12345')
+        self.specialty = Specialty.objects.create(name="Dentistry")
+        self.doctor = Doctor.objects.create(NPI='1234567890', name='Dr. Smith', email='dr.smith@test.com', phone_number='9876543210')
+        self.other_doctor = Doctor.objects.create(NPI='1234567891', name='Dr. Jones', email='dr.jones@test.com', phone_number='9876543211')
+        self.patients = [
+            Patient.objects.create(name=f'Patient {i}', date_of_birth='1990-01-01', last_4_ssn='1234',
+                                   phone_number='555-555-5555', gender='Male', address='123 Main St')
+            for i in range(3)
+        ]
+
+    def create_clinic(self, name):
+        clinic = Clinic.objects.create(name=name, phone_number='1234567890', city='Test City', state='Test State', email='clinic@test.com')
+        DoctorClinicAffiliation.objects.create(doctor=self.doctor, clinic=clinic, office_address='Test Address')
+        now = timezone.now()
+        for patient in self.patients:
+            Visit.objects.create(patient=patient, doctor=self.doctor, clinic=clinic, date_time=now - timedelta(days=30))
+        Appointment.objects.create(patient=self.patients[0], doctor=self.doctor, clinic=clinic,
+                                   procedure=self.specialty, date_time=now + timedelta(days=7))
+        return clinic
+
+    def count_list_queries(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('clinic_list'))
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def test_clinic_list_counts(self):
+        """ Patients are counted once across visits and future appointments of affiliated doctors """
+        clinic = self.create_clinic('Counted Clinic')
+        new_patient = Patient.objects.create(name='New Patient', date_of_birth='1990-01-01', last_4_ssn='1234',
+                                             phone_number='555-555-5555', gender='Male', address='123 Main St')
+        Appointment.objects.create(patient=new_patient, doctor=self.doctor, clinic=clinic,
+                                   procedure=self.specialty, date_time=timezone.now() + timedelta(days=7))
+        # Past appointments and doctors without an affiliation are not counted
+        Appointment.objects.create(patient=new_patient, doctor=self.doctor, clinic=clinic,
+                                   procedure=self.specialty, date_time=timezone.now() - timedelta(days=7))
+        other_patient = Patient.objects.create(name='Other Patient', date_of_birth='1990-01-01', last_4_ssn='1234',
+                                               phone_number='555-555-5555', gender='Male', address='123 Main St')
+        Visit.objects.create(patient=other_patient, doctor=self.other_doctor, clinic=clinic, date_time=timezone.now())
+
+        response = self.client.get(reverse('clinic_list'))
+        listed = {c.pk: c for c in response.context['clinics']}
+        self.assertEqual(listed[clinic.pk].doctor_count, 1)
+        self.assertEqual(listed[clinic.pk].unique_patient_count, 4)
+
+    def test_clinic_list_query_count_is_flat(self):
+        """ Adding clinics does not add queries to the clinic list """
+        self.create_clinic('Clinic 0')
+        baseline = self.count_list_queries()
+        for i in range(1, 6):
+            self.create_clinic(f'Clinic {i}')
+        self.assertEqual(self.count_list_queries(), baseline)
@@ -1,9 +1,14 @@
+from datetime import timedelta
+
 from django.contrib.auth.models import User
+from django.db import connection
 from django.test import TestCase, Client
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework.test import APIClient
 
-from ...models import Doctor, Specialty
+from ...models import Doctor, Specialty, Clinic, Patient, Visit, Appointment, DoctorClinicAffiliation
 
 
 class DoctorViewTestCase(TestCase):
@@ -73,9 +78,62 @@ class DoctorViewTestCase(TestCase):
         self.assertEqual(Doctor.objects.count(), 0)
 
 
+class DoctorPatientAggregationTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.client = Client()
+        self.client.login(username='testuser', password='testpass')
+
+        self.specialty = Specialty.objects.create(name='Dentist')
+        self.clinic = Clinic.objects.create(name='Test Clinic', phone_number='1234567890', city='Test City', state='Test State', email='clinic@test.com')
+        self.doctor = self.create_doctor('1234567890')
+
+    def create_doctor(self, npi):
+        doctor = Doctor.objects.create(NPI=npi, name=f'Dr. {npi}', email='doctor@example.com', phone_number='555-555-5555')
+        doctor.specialties.add(self.specialty)
+        return doctor
+
+    def create_patients(self, doctor, count):
+        now = timezone.now()
+        for i in range(count):
+            patient = Patient.objects.create(name=f'Patient {i:03d}', date_of_birth='1990-01-01', last_4_ssn='1234',
+                                             phone_number='555-555-5555', gender='Male', address='123 Main St')
+            Visit.objects.create(patient=patient, doctor=doctor, clinic=self.clinic, date_time=now - timedelta(days=1))
+            Appointment.objects.create(patient=patient, doctor=doctor, clinic=self.clinic, procedure=self.specialty,
+                                       date_time=now + timedelta(days=1))
+
+    def test_doctor_list_unique_patient_count(self):
+        self.create_patients(self.doctor, 3)
+        response = self.client.get(reverse('doctor_list'))
+        self.assertEqual(response.context['doctors'][0].unique_patient_count, 3)
+
+    def test_doctor_list_query_count_is_flat(self):
+        self.create_patients(self.doctor, 2)
+        with CaptureQueriesContext(connection) as baseline:
+            self.client.get(reverse('doctor_list'))
+        for npi in ('1111111111', '2222222222', '3333333333'):
+            self.create_patients(self.create_doctor(npi), 2)
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(reverse('doctor_list'))
+        self.assertEqual(len(context.captured_queries), len(baseline.captured_queries))
+
+    def test_doctor_detail_paginates_unique_patients(self):
+        self.create_patients(self.doctor, 60)
+        url = reverse('doctor_detail', args=[self.doctor.id])
+        response = self.client.get(url)
+        page = response.context['patient_page']
+        self.assertEqual(page.paginator.count, 60)
+        self.assertEqual(len(page.object_list), 50)
+        self.assertEqual(page.object_list[0].name, 'Patient 000')
+
+        response = self.client.get(url, {'patient_page': 2})
+        self.assertEqual(len(response.context['affiliated_patients']), 10)
+
+
 class DoctorViewSetTestCase(TestCase):
     def setUp(self):
         self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(username='staff', password='12345', is_staff=True))
 
         # Create some specialties and doctors
         self.specialty1 = Specialty.objects.create(name="Dentist")
@@ -87,7 +145,63 @@ class DoctorViewSetTestCase(TestCase):
         url = reverse('doctor-list')
         response = self.client.get(url)
         self.assertEqual(response.status_code, 200)
-        self.assertEqual(len(response.json()), 0)
+        self.assertEqual(response.json()['results'], [{
+            'id': self.doctor.id, 'specialties': ['Dentist'], 'affiliations': [], 'NPI': '1234567890',
+            'name': 'John Doe', 'email': 'johndoe@example.com', 'phone_number': '555-555-5555',
+        }])
+
+    def test_doctor_retrieve_api(self):
+        clinic = Clinic.objects.create(name='Test Clinic', phone_number='1234567890', city='City', state='State',
+                                       email='clinic@test.com')
+        DoctorClinicAffiliation.objects.create(doctor=self.doctor, clinic=clinic, office_address='Suite 1')
+        response = self.client.get(reverse('doctor-detail', args=[self.doctor.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['affiliations'],
+                         [{'clinic': clinic.id, 'clinic_name': 'Test Clinic', 'office_address': 'Suite 1'}])
+
+    def test_doctor_list_sparse_fields(self):
+        url = reverse('doctor-list')
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, {'fields': 'name,NPI'})
+        self.assertEqual(response.json()['results'], [{'NPI': '1234567890', 'name': 'John Doe'}])
+        # Version stamps, count and page only: no prefetches, and no unrequested columns
+        self.assertEqual(len(context.captured_queries), 3)
+        self.assertNotIn('"email"', context.captured_queries[-1]['sql'])
+
+        response = self.client.get(url, {'fields': 'name,salary'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('salary', response.json()['fields'][0])
+
+    def test_doctor_list_filters(self):
+        clinic = Clinic.objects.create(name='Test Clinic', phone_number='1234567890', city='City', state='State',
+                                       email='clinic@test.com')
+        other = Doctor.objects.create(NPI='1111111111', name='Other', email='other@example.com', phone_number='1')
+        DoctorClinicAffiliation.objects.create(doctor=other, clinic=clinic, office_address='Suite 1')
+        url = reverse('doctor-list')
+
+        def names(**params):
+            return [doctor['name'] for doctor in self.client.get(url, dict(params, fields='name')).json()['results']]
+
+        self.assertEqual(names(), ['John Doe', 'Other'])
+        self.assertEqual(names(clinic=clinic.id), ['Other'])
+        self.assertEqual(names(specialty=self.specialty1.id), ['John Doe'])
+        self.assertEqual(names(npi='1111111111'), ['Other'])
+        self.assertEqual(self.client.get(url, {'clinic': 'abc'}).status_code, 400)
+
+    def test_doctor_list_queries_constant_at_any_page_size(self):
+        clinic = Clinic.objects.create(name='Test Clinic', phone_number='1234567890', city='City', state='State',
+                                       email='clinic@test.com')
+        for index in range(30):
+            doctor = Doctor.objects.create(NPI=f'{index:010d}', name=f'Doctor {index}', email='d@example.com', phone_number='1')
+            doctor.specialties.add(self.specialty1)
+            DoctorClinicAffiliation.objects.create(doctor=doctor, clinic=clinic, office_address='Suite 1')
+        url = reverse('doctor-list')
+        with CaptureQueriesContext(connection) as small:
+            self.assertEqual(len(self.client.get(url, {'page_size': 2}).json()['results']), 2)
+        with CaptureQueriesContext(connection) as large:
+            self.assertEqual(len(self.client.get(url, {'page_size': 31}).json()['results']), 31)
+        self.assertEqual(len(small.captured_queries), 5)
+        self.assertEqual(len(large.captured_queries), 5)
 
     def test_doctor_create_api(self):
         # Test creating a doctor using API
@@ -108,4 +222,13 @@ class DoctorViewSetTestCase(TestCase):
         # Test deleting a doctor using API
         url = reverse('doctor-detail', args=[self.doctor.id])
         response = self.client.delete(url)
-        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(Doctor.objects.exists())
+
+    def test_doctor_api_requires_sign_in(self):
+        url = reverse('doctor-detail', args=[self.doctor.id])
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get(reverse('doctor-list')).status_code, 403)
+        self.assertEqual(self.client.patch(url, {'name': 'Changed'}, format='json').status_code, 403)
+        self.assertEqual(self.client.delete(url).status_code, 403)
+        self.assertEqual(Doctor.objects.get().name, 'John Doe')
@@ -1,9 +1,14 @@
+from datetime import timedelta
+
 from django.contrib.auth.models import User
+from django.db import connection
 from django.test import TestCase, Client
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework.test import APIClient
 
-from ...models import Patient
+from ...models import Patient, Clinic, Doctor, Specialty, Visit, Appointment, DoctorClinicAffiliation
 
 
 class PatientViewTestCase(TestCase):
@@ -86,9 +91,51 @@ class PatientViewTestCase(TestCase):
         self.assertEqual(Patient.objects.count(), 1)  # Only 1 patient should remain
 
 
+class PatientListQueryTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.client = Client()
+        self.client.login(username='testuser', password='testpass')
+
+        self.specialty = Specialty.objects.create(name='Dentistry')
+        self.clinic = Clinic.objects.create(name='Test Clinic', phone_number='1234567890', city='Test City', state='Test State', email='clinic@test.com')
+        self.doctor = Doctor.objects.create(NPI='1234567890', name='Dr. Smith', email='drsmith@example.com', phone_number='555-555-5557')
+
+    def create_patient(self, name):
+        now = timezone.now()
+        patient = Patient.objects.create(name=name, date_of_birth='1990-01-01', last_4_ssn='1234',
+                                         phone_number='555-555-5555', gender='Male', address='123 Main St')
+        for days in (60, 30):
+            visit = Visit.objects.create(patient=patient, doctor=self.doctor, clinic=self.clinic, date_time=now - timedelta(days=days))
+            visit.procedures_done.add(self.specialty)
+        for days in (-5, 10, 20):
+            Appointment.objects.create(patient=patient, doctor=self.doctor, clinic=self.clinic,
+                                       procedure=self.specialty, date_time=now + timedelta(days=days))
+        return patient
+
+    def test_last_visit_and_next_future_appointment(self):
+        self.create_patient('John Doe')
+        response = self.client.get(reverse('patient_list'))
+        patient = response.context['object_list'][0]
+        self.assertEqual(patient.rollup.last_visit, Visit.objects.latest('date_time'))
+        self.assertEqual(patient.rollup.next_appointment, Appointment.objects.filter(date_time__gte=timezone.now()).earliest('date_time'))
+
+    def test_patient_list_query_count_is_flat(self):
+        self.create_patient('Patient 0')
+        with CaptureQueriesContext(connection) as baseline:
+            self.client.get(reverse('patient_list'))
+        for i in range(1, 6):
+            self.create_patient(f'Patient {i}')
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('patient_list'))
+        self.assertContains(response, 'Patient 5')
+        self.assertEqual(len(context.captured_queries), len(baseline.captured_queries))
+
+
 class PatientViewSetTestCase(TestCase):
     def setUp(self):
         self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(username='staff', password='12345', is_staff=True))
 
         # Create test patients
         self.patient1 = Patient.objects.create(
@@ -113,7 +160,32 @@ class PatientViewSetTestCase(TestCase):
         url = reverse('patient-list')
         response = self.client.get(url)
         self.assertEqual(response.status_code, 200)
-        self.assertEqual(len(response.json()), 0)
+        self.assertEqual([patient['name'] for patient in response.json()['results']], ['John Doe', 'Jane Doe'])
+
+        response = self.client.get(url, {'fields': 'id,name'})
+        self.assertEqual(response.json()['results'][0], {'id': self.patient1.id, 'name': 'John Doe'})
+
+    def test_patient_retrieve_api(self):
+        response = self.client.get(reverse('patient-detail', args=[self.patient1.id]), {'fields': 'date_of_birth'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'date_of_birth': '1990-01-01'})
+
+    def test_patient_list_filters(self):
+        clinic = Clinic.objects.create(name='Test Clinic', phone_number='1234567890', city='City', state='State',
+                                       email='clinic@test.com')
+        doctor = Doctor.objects.create(NPI='1234567890', name='Dr. Smith', email='d@example.com', phone_number='1')
+        DoctorClinicAffiliation.objects.create(doctor=doctor, clinic=clinic, office_address='Suite 1')
+        Visit.objects.create(patient=self.patient2, doctor=doctor, clinic=clinic, date_time=timezone.now())
+        url = reverse('patient-list')
+
+        def names(**params):
+            return [patient['name'] for patient in self.client.get(url, dict(params, fields='name')).json()['results']]
+
+        self.assertEqual(names(doctor=doctor.id), ['Jane Doe'])
+        self.assertEqual(names(clinic=clinic.id), ['Jane Doe'])
+        self.assertEqual(names(name='John Doe', date_of_birth='1990-01-01'), ['John Doe'])
+        self.assertEqual(names(name='John Doe', date_of_birth='1995-02-02'), [])
+        self.assertEqual(self.client.get(url, {'date_of_birth': 'yesterday'}).status_code, 400)
 
     def test_patient_create_api(self):
         # Test creating a patient using API
@@ -135,4 +207,24 @@ class PatientViewSetTestCase(TestCase):
         # Test deleting a patient using API
         url = reverse('patient-detail', args=[self.patient1.id])
         response = self.client.delete(url)
-        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(Patient.objects.count(), 1)
+
+    def test_patient_api_requires_sign_in(self):
+        url = reverse('patient-detail', args=[self.patient1.id])
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get(reverse('patient-list')).status_code, 403)
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.assertEqual(self.client.patch(url, {'last_4_ssn': '0000'}, format='json').status_code, 403)
+        self.assertEqual(self.client.delete(url).status_code, 403)
+        self.patient1.refresh_from_db()
+        self.assertEqual(self.patient1.last_4_ssn, '1234')
+
+        # Other signed-in users can read, without the SSN digits, but not write
+        self.client.force_authenticate(User.objects.create_user(username='reader', password='12345'))
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('last_4_ssn', response.json())
+        self.assertEqual(self.client.patch(url, {'name': 'Changed'}, format='json').status_code, 403)
+        self.assertEqual(self.client.delete(url).status_code, 403)
+        self.assertEqual(Patient.objects.count(), 2)
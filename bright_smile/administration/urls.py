@@ -7,7 +7,9 @@ from .views.clinic_views import ClinicListView, ClinicDetailView, ClinicCreateVi
 from .views.doctor_views import DoctorListView, DoctorDetailView, DoctorCreateView, DoctorUpdateView, DoctorDeleteView,DoctorViewSet
 from .views.patient_views import PatientListView, PatientDetailView, PatientCreateView, PatientUpdateView, PatientDeleteView, PatientViewSet
 from .views.visit_views import add_visit,get_doctors, get_specialties,delete_visit
-from .views.appointment_views import schedule_appointment, get_doctors_with_clinic_and_procedure, get_available_slots, delete_appointment, get_doctor_schedule
+from .views.cache_views import get_cache_stats
+from .views.export_views import export_data
+from .views.appointment_views import schedule_appointment, get_doctors_with_clinic_and_procedure, get_available_slots, get_availability_range, get_first_available, delete_appointment, get_doctor_schedule, get_booking_bootstrap
 
 from django.contrib.auth import views as auth_views
 
@@ -59,7 +61,13 @@ urlpatterns = [
     path('api/get-clinics/', get_clinics, name='get_clinics'),
     path('api/get-doctors-with-clinic-and-procedure/', get_doctors_with_clinic_and_procedure, name='get_doctors_with_clinic_and_procedure'),
     path('api/get-available-slots/', get_available_slots, name='get_available_slots'),
+    path('api/get-availability/', get_availability_range, name='get_availability'),
+    path('api/first-available/', get_first_available, name='get_first_available'),
     path('api/get-doctor-schedule/', get_doctor_schedule, name='get_doctor_schedule'),
+    path('api/booking-bootstrap/', get_booking_bootstrap, name='get_booking_bootstrap'),
+    path('api/cache-stats/', get_cache_stats, name='get_cache_stats'),
+
+    path('export/<str:resource>/', export_data, name='export_data'),
 
     path('appointments/delete/<int:appointment_id>/', delete_appointment, name='delete_appointment'),
     path('visit/delete/<int:visit_id>/', delete_visit, name='delete_visit'),
@@ -1,11 +1,22 @@
 from datetime import datetime, timedelta
 
+from django.core.exceptions import ValidationError
 from django.http import JsonResponse
 from django.shortcuts import render, get_object_or_404, redirect
 from django.utils import timezone
 
+from ..availability import acached_availability, afirst_available, aget_occupancy, format_slots, SLOT_FORMAT
+from ..booking import book_appointment
+from ..capabilities import INDEX_KEYS, INDEX_MODELS, capability_index
+from ..conditional import request_stamps, versioned, versioned_by
 from ..forms import AppointmentForm
-from ..models import Doctor, Patient, DoctorClinicAffiliation, DoctorSchedule, Appointment
+from ..models import Patient, Appointment
+
+DEFAULT_AVAILABILITY_DAYS = 28
+MAX_AVAILABILITY_DAYS = 92
+MAX_FIRST_AVAILABLE = 100
+BOOTSTRAP_PARTS = ('tree', 'availability')
+DEFAULT_BOOTSTRAP_DAYS = 14
 
 
 def schedule_appointment(request, patient_id):
@@ -13,79 +24,114 @@ def schedule_appointment(request, patient_id):
 
     if request.method == 'POST':
         form = AppointmentForm(request.POST)
-        print(form.errors)
         if form.is_valid():
             appointment = form.save(commit=False)
             appointment.patient = patient
-            appointment.save()
-            return redirect('patient_detail', pk=patient_id)
+            try:
+                book_appointment(appointment)
+            except ValidationError as error:
+                form.add_error(None, error)
+            else:
+                return redirect('patient_detail', pk=patient_id)
     else:
         form = AppointmentForm()
 
     return render(request, 'administration/schedule_appointment.html', {'form': form, 'patient': patient})
 
 
-def get_doctors_with_clinic_and_procedure(request):
+@versioned_by(*INDEX_MODELS, cache_namespace='lookups')
+async def get_doctors_with_clinic_and_procedure(request):
     clinic_id = request.GET.get('clinic_id')
     procedure_id = request.GET.get('procedure_id')
 
     # Get doctors affiliated with the selected clinic who offer the selected procedure
-    doctors = Doctor.objects.filter(
-        doctorclinicaffiliation__clinic=clinic_id,
-        specialties=procedure_id
-    ).distinct()
+    doctors = (await capability_index.aget(request_stamps(request))).doctors_at(clinic_id, procedure_id)
 
-    doctor_list = list(doctors.values('id', 'name'))
+    doctor_list = [{'id': pk, 'name': name} for pk, name in doctors]
     return JsonResponse(doctor_list, safe=False)
 
-def get_available_slots(request):
-    doctor_id = request.GET.get('doctor_id')
-    clinic_id = request.GET.get('clinic_id')
-    appointment_date = request.GET.get('date')  # Expected format: YYYY-MM-DD
-
-    # Convert the appointment_date to a datetime object and get the day of the week
-    appointment_date_obj = timezone.make_aware(datetime.strptime(appointment_date, '%Y-%m-%d'))
-    day_of_week = appointment_date_obj.strftime('%a')
-
-    # Fetch the doctor's schedule for the specific clinic and day
-    affiliation = DoctorClinicAffiliation.objects.get(doctor_id=doctor_id, clinic_id=clinic_id)
-    schedule = DoctorSchedule.objects.filter(affiliation=affiliation, day_of_week=day_of_week).first()
-
-    if not schedule:
+def _bootstrap_parts(request):
+    return [part for part in request.GET.get('parts', ','.join(BOOTSTRAP_PARTS)).split(',') if part]
+
+
+def _hours(time):
+    return time.strftime('%H:%M')
+
+
+# The tree alone only changes with the index tables; availability moves with every booking
+@versioned(lambda request: INDEX_KEYS if _bootstrap_parts(request) == ['tree'] else None, cache_namespace='lookups')
+async def get_booking_bootstrap(request):
+    """
+    What the booking page needs in one response, instead of a request per step of the
+    procedure -> clinic -> doctor -> schedule -> slots cascade. ``parts`` picks the
+    sections (default both):
+
+    tree: every procedure, clinic and doctor by id, ``offers`` as
+        {procedure: {clinic: [doctor, ...]}}, and the weekly ``schedules`` of each
+        "doctor-clinic" pair as [day, start, end].
+    availability: free slots as {"doctor-clinic": {date: ["HH:MM", ...]}} from
+        ``start`` (default today) for ``days`` days (default 14), for the pairs
+        matching procedure_id, clinic_id and doctor_id; at least one is required.
+        Past slots are left out.
+    """
+    parts = _bootstrap_parts(request)
+    if not parts or set(parts) - set(BOOTSTRAP_PARTS):
+        return JsonResponse({"error": f"parts must be one or more of {', '.join(BOOTSTRAP_PARTS)}"}, status=400)
+
+    index = await capability_index.aget(request_stamps(request))
+    data = {}
+    if 'tree' in parts:
+        data.update(
+            procedures=index.procedures,
+            clinics=index.clinics,
+            doctors=index.doctors,
+            offers=index.offers(),
+            schedules={
+                f'{doctor_id}-{clinic_id}': [[schedule.day_of_week, _hours(schedule.start_time), _hours(schedule.end_time)]
+                                             for schedule in affiliation.schedules]
+                for (doctor_id, clinic_id), affiliation in sorted(index.affiliations.items())
+            },
+        )
+
+    if 'availability' in parts:
+        scope = {name: request.GET[name] for name in ('procedure_id', 'clinic_id', 'doctor_id') if request.GET.get(name)}
+        try:
+            start_date = datetime.strptime(request.GET.get('start', timezone.localdate().isoformat()), '%Y-%m-%d').date()
+            days = max(min(int(request.GET.get('days', DEFAULT_BOOTSTRAP_DAYS)), MAX_AVAILABILITY_DAYS), 1)
+        except (TypeError, ValueError):
+            return JsonResponse({"error": "start (YYYY-MM-DD) and days must be valid"}, status=400)
+        if not scope:
+            return JsonResponse({"error": "availability needs procedure_id, clinic_id or doctor_id"}, status=400)
+
+        end_date = start_date + timedelta(days=days)
+        now = timezone.now()
+        occupancy = await aget_occupancy(index.pairs(**scope), start_date, end_date)
+        data['availability'] = {
+            'start': start_date.isoformat(),
+            'end': end_date.isoformat(),
+            'slots': {
+                f'{doctor_id}-{clinic_id}': {day.isoformat(): labels for day, labels in (
+                    (day, day_occupancy.slot_labels(not_before=now)) for day, day_occupancy in sorted(by_date.items()))
+                    if labels}
+                for (doctor_id, clinic_id), by_date in occupancy.items()
+            },
+        }
+
+    return JsonResponse(data)
+
+
+async def get_available_slots(request):
+    doctor_id = int(request.GET.get('doctor_id'))
+    clinic_id = int(request.GET.get('clinic_id'))
+    appointment_date = datetime.strptime(request.GET.get('date'), '%Y-%m-%d').date()  # Expected format: YYYY-MM-DD
+
+    # The doctor's working hours at the clinic merged with their appointments that day
+    occupancy = (await acached_availability(doctor_id, clinic_id, appointment_date, appointment_date + timedelta(days=1)))[appointment_date]
+
+    if occupancy is None:
         return JsonResponse({"error": "Doctor is not available on the selected day"}, status=400)
 
-    # Fetch existing appointments for the doctor at this clinic on the selected date
-    existing_appointments = Appointment.objects.filter(
-        doctor_id=doctor_id,
-        clinic_id=clinic_id,
-        date_time__date=appointment_date_obj.date()
-    )
-
-    appointment_duration = timedelta(minutes=15)
-
-    # Initialize available slots based on doctor's working hours
-    start_time = timezone.make_aware(datetime.combine(appointment_date_obj.date(), schedule.start_time))
-    end_time = timezone.make_aware(datetime.combine(appointment_date_obj.date(), schedule.end_time))
-
-    available_slots = []
-    current_time = start_time
-
-    booked_ranges = [
-        (appointment.date_time, appointment.date_time + appointment_duration)
-        for appointment in existing_appointments
-    ]
-
-    while current_time + appointment_duration <= end_time:
-        is_conflict = False
-        for start, end in booked_ranges:
-            if start <= current_time < end:
-                is_conflict = True
-                break
-
-        if not is_conflict:
-            available_slots.append(current_time.strftime('%Y-%m-%d %H:%M:%S'))
-
-        current_time += appointment_duration
+    available_slots = format_slots(occupancy.slot_times())
 
     if not available_slots:
         return JsonResponse({"error": "No available slots for the selected day"}, status=400)
@@ -93,23 +139,79 @@ def get_available_slots(request):
     return JsonResponse(available_slots, safe=False)
 
 
+async def get_availability_range(request):
+    """
+    Free slots for one doctor at one clinic over a range of days (default four weeks),
+    keyed by date. Past slots are left out.
+    """
+    try:
+        doctor_id = int(request.GET.get('doctor_id'))
+        clinic_id = int(request.GET.get('clinic_id'))
+        start_date = datetime.strptime(request.GET.get('start', timezone.localdate().isoformat()), '%Y-%m-%d').date()
+        days = min(int(request.GET.get('days', DEFAULT_AVAILABILITY_DAYS)), MAX_AVAILABILITY_DAYS)
+    except (TypeError, ValueError):
+        return JsonResponse({"error": "doctor_id, clinic_id, start (YYYY-MM-DD) and days must be valid"}, status=400)
+
+    now = timezone.now()
+    availability = await acached_availability(doctor_id, clinic_id, start_date, start_date + timedelta(days=max(days, 1)))
+    upcoming = {day: occupancy.slot_times(not_before=now) for day, occupancy in availability.items() if occupancy}
+    return JsonResponse({day.isoformat(): format_slots(slots) for day, slots in sorted(upcoming.items()) if slots})
+
+
+async def get_first_available(request):
+    """
+    The earliest open slots for a procedure across every qualified doctor and clinic,
+    optionally narrowed to one clinic and/or doctor.
+    """
+    try:
+        procedure_id = int(request.GET.get('procedure_id'))
+        days = min(int(request.GET.get('days', DEFAULT_AVAILABILITY_DAYS)), MAX_AVAILABILITY_DAYS)
+        limit = min(int(request.GET.get('limit', 10)), MAX_FIRST_AVAILABLE)
+    except (TypeError, ValueError):
+        return JsonResponse({"error": "procedure_id, days and limit must be valid"}, status=400)
+
+    # Doctors offering the procedure, at the clinics they are affiliated with
+    index = await capability_index.aget()
+    names = {
+        (doctor_id, clinic_id): (index.doctors[doctor_id], index.clinics[clinic_id])
+        for doctor_id, clinic_id in index.pairs(procedure_id, request.GET.get('clinic_id') or None,
+                                                 request.GET.get('doctor_id') or None)
+    }
+
+    now = timezone.now()
+    today = timezone.localdate()
+    slots = await afirst_available(names, today, today + timedelta(days=max(days, 1)), limit, not_before=now)
+
+    return JsonResponse([
+        {
+            'date_time': slot.strftime(SLOT_FORMAT),
+            'doctor_id': doctor_id,
+            'doctor_name': names[doctor_id, clinic_id][0],
+            'clinic_id': clinic_id,
+            'clinic_name': names[doctor_id, clinic_id][1],
+        }
+        for slot, doctor_id, clinic_id in slots
+    ], safe=False)
+
+
 def delete_appointment(request, appointment_id):
     appointment = get_object_or_404(Appointment, pk=appointment_id)
-    patient_id = appointment.patient.pk
+    patient_id = appointment.patient_id
     appointment.delete()
     return redirect('patient_detail', pk=patient_id)
 
 
 
-def get_doctor_schedule(request):
+@versioned_by(*INDEX_MODELS)
+async def get_doctor_schedule(request):
     doctor_id = request.GET.get('doctor_id')
     clinic_id = request.GET.get('clinic_id')
 
     # Get the doctor's affiliation with the clinic
-    affiliation = DoctorClinicAffiliation.objects.get(doctor_id=doctor_id, clinic_id=clinic_id)
-
-    # Fetch the doctor's schedule for that clinic
-    schedules = DoctorSchedule.objects.filter(affiliation=affiliation).values('day_of_week', 'start_time', 'end_time')
+    affiliation = (await capability_index.aget(request_stamps(request))).affiliation(doctor_id, clinic_id)
+    if affiliation is None:
+        return JsonResponse({"error": "The doctor is not affiliated with the clinic"}, status=404)
 
-    schedule_list = list(schedules)
+    # The doctor's schedule for that clinic
+    schedule_list = [schedule._asdict() for schedule in affiliation.schedules]
     return JsonResponse(schedule_list, safe=False)
@@ -0,0 +1,12 @@
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import JsonResponse
+
+from ..caching import cache_stats
+
+
+@staff_member_required
+def get_cache_stats(request):
+    """
+    Hit/miss counters of the caches served by this worker process.
+    """
+    return JsonResponse(cache_stats.snapshot())
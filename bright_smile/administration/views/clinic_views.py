@@ -1,6 +1,6 @@
-from datetime import datetime
-
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.db import transaction
+from django.db.models.functions import Coalesce
 from django.http import JsonResponse
 from django.shortcuts import render, get_object_or_404, redirect
 from django.urls import reverse_lazy
@@ -8,42 +8,45 @@ from django.views.generic import ListView, DetailView, CreateView, UpdateView, D
 from rest_framework import viewsets
 
 from ..forms import ClinicForm, DoctorClinicAffiliationForm, DoctorScheduleFormSet
-from ..models import Clinic, Doctor, DoctorClinicAffiliation, Visit, Appointment
+from ..models import Clinic, Doctor, DoctorClinicAffiliation
+from ..availability import schedule_version_key
+from ..bulk import BulkCreateMixin
+from ..caching import attach_stamps, object_version_key
+from ..capabilities import INDEX_MODELS, capability_index
+from ..conditional import VersionedViewSetMixin, request_stamps, versioned_by
+from ..fieldsets import SparseFieldsetMixin
+from ..pagecache import StaleWhileRevalidateMixin
+from ..pagination import KeysetAPIPagination, KeysetPaginationMixin
+from ..rollups import active_patient_count
 from ..serializers import ClinicSerializer
 
 
 # REST API ViewSets
-class ClinicViewSet(viewsets.ModelViewSet):
+class ClinicViewSet(VersionedViewSetMixin, SparseFieldsetMixin, BulkCreateMixin, viewsets.ModelViewSet):
     queryset = Clinic.objects.all()
     serializer_class = ClinicSerializer
+    pagination_class = KeysetAPIPagination
+    version_models = (Clinic,)
 
 
 # Clinic CRUD
-class ClinicListView(LoginRequiredMixin, ListView):
+class ClinicListView(LoginRequiredMixin, StaleWhileRevalidateMixin, KeysetPaginationMixin, ListView):
     model = Clinic
     template_name = 'administration/clinic/clinic_list.html'
     context_object_name = 'clinics'
+    page_version_models = (Clinic, DoctorClinicAffiliation)
 
     def get_queryset(self):
-        clinics = Clinic.objects.prefetch_related('doctorclinicaffiliation_set').all()
-
-        for clinic in clinics:
-            affiliated_doctors = DoctorClinicAffiliation.objects.filter(clinic=clinic).values_list('doctor', flat=True)
-
-            past_visits = Visit.objects.filter(clinic=clinic, doctor__in=affiliated_doctors).values_list('patient', flat=True)
-            future_appointments = Appointment.objects.filter(
-                clinic=clinic, 
-                doctor__in=affiliated_doctors, 
-                date_time__gte=datetime.now()
-            ).values_list('patient', flat=True)
+        # Counts are maintained incrementally in ClinicRollup (see administration.rollups)
+        return Clinic.objects.annotate(
+            doctor_count=Coalesce('rollup__doctor_count', 0),
+            unique_patient_count=active_patient_count('clinic'),
+        ).order_by('pk')
 
-            # Combine and remove duplicates
-            unique_patients = set(list(past_visits) + list(future_appointments))
-
-            # Store the number of unique patients in the clinic object
-            clinic.unique_patient_count = len(unique_patients)
-
-        return clinics
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        attach_stamps((clinic, 'stamp', object_version_key(Clinic, clinic.pk)) for clinic in context['object_list'])
+        return context
 
 class ClinicDetailView(LoginRequiredMixin, DetailView):
     model = Clinic
@@ -61,8 +64,15 @@ class ClinicDetailView(LoginRequiredMixin, DetailView):
         context['available_doctors'] = Doctor.objects.exclude(id__in=affiliated_doctors)
         
         # Add clinic affiliations to the context
-        context['affiliations'] = DoctorClinicAffiliation.objects.filter(clinic=self.object)
-        
+        context['affiliations'] = list(DoctorClinicAffiliation.objects.filter(clinic=self.object).select_related('doctor').prefetch_related('schedules'))
+
+        # Stamps the clinic's details and each affiliation's cells are cached under
+        targets = [(self.object, 'stamp', object_version_key(Clinic, self.object.pk))]
+        for affiliation in context['affiliations']:
+            targets += [(affiliation, 'stamp', schedule_version_key(affiliation.doctor_id, affiliation.clinic_id)),
+                        (affiliation, 'doctor_stamp', object_version_key(Doctor, affiliation.doctor_id))]
+        attach_stamps(targets)
+
         return context
 
 
@@ -88,9 +98,11 @@ def manage_affiliations(request, clinic_id, affiliation_id=None):
         if affiliation_form.is_valid() and schedule_formset.is_valid():
             affiliation = affiliation_form.save(commit=False)
             affiliation.clinic = clinic
-            affiliation.save()
-            schedule_formset.instance = affiliation
-            schedule_formset.save()
+            # One transaction, so the availability cache is invalidated with the schedule change
+            with transaction.atomic():
+                affiliation.save()
+                schedule_formset.instance = affiliation
+                schedule_formset.save()
 
             return redirect('clinic_detail', pk=clinic_id)
         else:
@@ -129,13 +141,12 @@ class ClinicDeleteView(LoginRequiredMixin, DeleteView):
     success_url = reverse_lazy('clinic_list')
 
 
-def get_clinics(request):
+@versioned_by(*INDEX_MODELS, cache_namespace='lookups')
+async def get_clinics(request):
     procedure_id = request.GET.get('procedure_id')
     
     # Get clinics that have doctors offering the selected procedure
-    clinics = Clinic.objects.filter(
-        doctorclinicaffiliation__doctor__specialties=procedure_id
-    ).distinct()
+    clinics = (await capability_index.aget(request_stamps(request))).clinics_offering(procedure_id)
     
-    clinic_list = list(clinics.values('id', 'name'))
+    clinic_list = [{'id': pk, 'name': name} for pk, name in clinics]
     return JsonResponse(clinic_list, safe=False)
@@ -1,69 +1,88 @@
-from datetime import datetime
-
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.core.paginator import Paginator
+from django.db.models import Prefetch, prefetch_related_objects
+from django.db.models.functions import Coalesce
 from django.urls import reverse_lazy
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView
 from rest_framework import viewsets
 
 from ..forms import DoctorForm
-from ..models import Doctor, Patient, DoctorClinicAffiliation, Visit, Appointment
+from ..models import Clinic, Doctor, Patient, Specialty, DoctorClinicAffiliation, Visit, Appointment
+from ..bulk import BulkCreateMixin
+from ..caching import attach_stamps, object_version_key
+from ..conditional import VersionedViewSetMixin
+from ..fieldsets import IndexedFilterMixin, SparseFieldsetMixin
+from ..pagecache import StaleWhileRevalidateMixin
+from ..pagination import KeysetAPIPagination, KeysetPaginationMixin
+from ..rollups import active_patient_count
 from ..serializers import DoctorSerializer
+from ..templatetags.fragment_cache import missing_fragments
 
 
 # REST API ViewSets
-class DoctorViewSet(viewsets.ModelViewSet):
-    queryset = Doctor.objects.none()
+class DoctorViewSet(VersionedViewSetMixin, SparseFieldsetMixin, IndexedFilterMixin, BulkCreateMixin, viewsets.ModelViewSet):
+    queryset = Doctor.objects.all()
     serializer_class = DoctorSerializer
-
+    pagination_class = KeysetAPIPagination
+    version_models = (Doctor, Doctor.specialties.through, Specialty, DoctorClinicAffiliation, Clinic)
+    field_prefetches = {
+        'specialties': 'specialties',
+        'affiliations': Prefetch('doctorclinicaffiliation_set',
+                                 queryset=DoctorClinicAffiliation.objects.select_related('clinic').order_by('pk')),
+    }
+    filter_fields = {
+        'npi': 'NPI',
+        'specialty': 'specialties',
+        'clinic': 'doctorclinicaffiliation__clinic',
+    }
 
 
 # Doctor CRUD
-class DoctorListView(LoginRequiredMixin, ListView):
+class DoctorListView(LoginRequiredMixin, StaleWhileRevalidateMixin, KeysetPaginationMixin, ListView):
     model = Doctor
     template_name = 'administration/doctor/doctor_list.html'
     context_object_name = 'doctors'
+    page_version_models = (Doctor, Doctor.specialties.through, Specialty, DoctorClinicAffiliation)
 
     def get_queryset(self):
-        doctors = Doctor.objects.prefetch_related('specialties', 'doctorclinicaffiliation_set').all()
-
-        for doctor in doctors:
-            # Fetch patients who visited this doctor
-            past_visits = Visit.objects.filter(doctor=doctor).values_list('patient', flat=True)
-
-            # Fetch patients who have future appointments with this doctor
-            future_appointments = Appointment.objects.filter(doctor=doctor, date_time__gte=datetime.now()).values_list('patient', flat=True)
-
-            # Combine and remove duplicates
-            unique_patients = set(list(past_visits) + list(future_appointments))
+        # Counts are maintained incrementally in DoctorRollup (see administration.rollups)
+        return Doctor.objects.annotate(
+            clinic_count=Coalesce('rollup__clinic_count', 0),
+            unique_patient_count=active_patient_count('doctor'),
+        ).order_by('pk')
 
-            # Store the number of unique patients in the doctor object
-            doctor.unique_patient_count = len(unique_patients)
-
-        return doctors
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        doctors = context['object_list']
+        attach_stamps((doctor, 'stamp', object_version_key(Doctor, doctor.pk)) for doctor in doctors)
+        # Only rows missing from the fragment cache show the specialties
+        prefetch_related_objects(missing_fragments('doctor_row', doctors, lambda doctor: [
+            doctor.pk, doctor.stamp, doctor.clinic_count, doctor.unique_patient_count]), 'specialties')
+        return context
 
 class DoctorDetailView(LoginRequiredMixin, DetailView):
     model = Doctor
     template_name = 'administration/doctor/doctor_detail.html'
     context_object_name = 'doctor'
+    patients_per_page = 50
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         
         # Fetch affiliations with clinics
-        affiliations = DoctorClinicAffiliation.objects.filter(doctor=self.object).prefetch_related('schedules')
+        affiliations = DoctorClinicAffiliation.objects.filter(doctor=self.object).select_related('clinic').prefetch_related('schedules')
         context['affiliations'] = affiliations
 
-        # Get the unique list of patients affiliated with the doctor (from visits or appointments)
-        patients_from_visits = Patient.objects.filter(visits__doctor=self.object).distinct()
-        patients_from_appointments = Patient.objects.filter(appointments__doctor=self.object).distinct()
-
-        # Combine the two querysets and remove duplicates manually in Python
-        all_patients = list(patients_from_visits) + list(patients_from_appointments)
-        # Convert to a set of unique patient IDs to remove duplicates
-        unique_patients = {patient.id: patient for patient in all_patients}.values()
+        # Unique patients affiliated with the doctor (from visits or appointments), deduplicated by the database
+        patient_ids = Visit.objects.filter(doctor=self.object).values('patient').union(
+            Appointment.objects.filter(doctor=self.object).values('patient')
+        )
+        patients = Patient.objects.filter(pk__in=patient_ids).order_by('name', 'pk')
 
-        # Pass the unique patients to the context
-        context['affiliated_patients'] = unique_patients
+        # Only the requested page of patients is loaded
+        paginator = Paginator(patients, self.patients_per_page)
+        context['patient_page'] = paginator.get_page(self.request.GET.get('patient_page'))
+        context['affiliated_patients'] = context['patient_page'].object_list
         
         return context
 
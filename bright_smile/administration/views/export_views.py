@@ -0,0 +1,69 @@
+import csv
+import json
+from datetime import datetime
+
+from django.contrib.auth.decorators import login_required
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+
+from ..exports import EXPORTS, export_chunks, export_headers
+
+EXPORT_CONTENT_TYPES = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+
+
+class Echo:
+    """
+    A file-like object that hands back what csv.writer writes, so rows can be streamed.
+    """
+
+    def write(self, value):
+        return value
+
+
+def _csv_value(value):
+    if isinstance(value, list):
+        return '; '.join(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def stream_csv(headers, chunks):
+    writer = csv.writer(Echo())
+    yield writer.writerow(headers)
+    for chunk in chunks:
+        yield ''.join(writer.writerow([_csv_value(row[header]) for header in headers]) for row in chunk)
+
+
+def stream_ndjson(chunks):
+    for chunk in chunks:
+        yield ''.join(json.dumps(row, cls=DjangoJSONEncoder) + '\n' for row in chunk)
+
+
+@login_required
+def export_data(request, resource):
+    """
+    Stream every patient, visit or appointment as CSV (default) or NDJSON (?format=ndjson).
+    Optional filters: start and end dates (YYYY-MM-DD, inclusive) and clinic_id.
+    """
+    if resource not in EXPORTS:
+        raise Http404(f'No export named {resource}')
+    export_format = request.GET.get('format', 'csv')
+    try:
+        if export_format not in EXPORT_CONTENT_TYPES:
+            raise ValueError(export_format)
+        start = datetime.strptime(request.GET['start'], '%Y-%m-%d').date() if request.GET.get('start') else None
+        end = datetime.strptime(request.GET['end'], '%Y-%m-%d').date() if request.GET.get('end') else None
+        clinic_id = int(request.GET['clinic_id']) if request.GET.get('clinic_id') else None
+    except ValueError:
+        return JsonResponse({"error": "format (csv or ndjson), start and end (YYYY-MM-DD) and clinic_id must be valid"},
+                            status=400)
+
+    chunks = export_chunks(resource, start, end, clinic_id)
+    if export_format == 'csv':
+        content = stream_csv(export_headers(resource), chunks)
+    else:
+        content = stream_ndjson(chunks)
+    response = StreamingHttpResponse(content, content_type=EXPORT_CONTENT_TYPES[export_format])
+    response['Content-Disposition'] = f'attachment; filename="{resource}.{export_format}"'
+    return response
@@ -5,30 +5,44 @@ from rest_framework import viewsets
 
 from ..forms import PatientForm
 from ..models import Patient, Visit, Appointment
+from ..bulk import BulkCreateMixin
+from ..fieldsets import IndexedFilterMixin, SparseFieldsetMixin
+from ..pagination import KeysetAPIPagination, KeysetPaginationMixin
+from ..rollups import current_next_appointments
 from ..serializers import PatientSerializer
 
 
 # REST API ViewSets
-class PatientViewSet(viewsets.ModelViewSet):
-    queryset = Patient.objects.none()
+# Not versioned: a table-wide stamp would serialize every patient write on its row
+class PatientViewSet(SparseFieldsetMixin, IndexedFilterMixin, BulkCreateMixin, viewsets.ModelViewSet):
+    queryset = Patient.objects.all()
     serializer_class = PatientSerializer
+    pagination_class = KeysetAPIPagination
+    # Patients of a doctor or clinic are read from the rollup links, indexed on (doctor|clinic, patient)
+    filter_fields = {
+        'name': 'name',
+        'date_of_birth': 'date_of_birth',
+        'doctor': 'doctor_links__doctor',
+        'clinic': 'clinic_links__clinic',
+    }
 
 
 # Patient CRUD
-class PatientListView(LoginRequiredMixin, ListView):
+class PatientListView(LoginRequiredMixin, KeysetPaginationMixin, ListView):
     model = Patient
     template_name = 'administration/patient/patient_list.html'
 
     def get_queryset(self):
-        patients = Patient.objects.all()
+        # Last visit and next appointment pointers are maintained in PatientRollup (see administration.rollups)
+        return Patient.objects.select_related(
+            'rollup__last_visit__doctor', 'rollup__next_appointment__doctor', 'rollup__next_appointment__procedure',
+        ).prefetch_related('rollup__last_visit__procedures_done').order_by('pk')
 
-        # Add last visit and next appointment info to each patient
-        for patient in patients:
-            patient.last_visit = Visit.objects.filter(patient=patient).order_by('-date_time').first()
-            patient.next_appointment = Appointment.objects.filter(patient=patient).order_by('date_time').first()
-
-        print(patients)
-        return patients
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        # Appointments may have passed since the last expiry
+        current_next_appointments(context['object_list'])
+        return context
 
 class PatientDetailView(LoginRequiredMixin, DetailView):
     model = Patient
@@ -38,8 +52,8 @@ class PatientDetailView(LoginRequiredMixin, DetailView):
         context = super().get_context_data(**kwargs)
 
         # Fetch patient's visit history and next appointment
-        context['visits'] = Visit.objects.filter(patient=self.object).order_by('-date_time')
-        context['appointments'] = Appointment.objects.filter(patient=self.object).order_by('date_time')
+        context['visits'] = Visit.objects.filter(patient=self.object).select_related('doctor', 'clinic').prefetch_related('procedures_done').order_by('-date_time')
+        context['appointments'] = Appointment.objects.filter(patient=self.object).select_related('doctor', 'clinic', 'procedure').order_by('date_time')
 
         return context
 
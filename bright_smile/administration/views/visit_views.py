@@ -1,8 +1,10 @@
 from django.http import JsonResponse
 from django.shortcuts import render, get_object_or_404, redirect
 
+from ..capabilities import INDEX_MODELS, capability_index
+from ..conditional import request_stamps, versioned_by
 from ..forms import VisitForm
-from ..models import Doctor, Patient, DoctorClinicAffiliation, Visit
+from ..models import Patient, Visit
 
 
 def add_visit(request, patient_id):
@@ -22,15 +24,17 @@ def add_visit(request, patient_id):
     return render(request, 'administration/add_visit.html', {'form': form, 'patient': patient})
 
 
-def get_doctors(request):
+@versioned_by(*INDEX_MODELS, cache_namespace='lookups')
+async def get_doctors(request):
     clinic_id = request.GET.get('clinic_id')
-    doctors = DoctorClinicAffiliation.objects.filter(clinic_id=clinic_id).select_related('doctor').values('doctor__id', 'doctor__name')
-    return JsonResponse(list(doctors), safe=False)
+    doctors = (await capability_index.aget(request_stamps(request))).doctors_at(clinic_id)
+    return JsonResponse([{'doctor__id': pk, 'doctor__name': name} for pk, name in doctors], safe=False)
 
-def get_specialties(request):
+@versioned_by(*INDEX_MODELS, cache_namespace='lookups')
+async def get_specialties(request):
     doctor_id = request.GET.get('doctor_id')
-    specialties = Doctor.objects.get(pk=doctor_id).specialties.values('id', 'name')
-    return JsonResponse(list(specialties), safe=False)
+    specialties = (await capability_index.aget(request_stamps(request))).specialties_of(doctor_id)
+    return JsonResponse([{'id': pk, 'name': name} for pk, name in specialties], safe=False)
 
 
 def delete_visit(request, visit_id):